@@ -3,48 +3,56 @@ import sqlite3
 import os
 import sys
 
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, migrations, output, prefix_search
+
 # --- КОНСТАНТЫ ---
 DB_NAME = "academic_records.db"
 # Паттерн для фильтрации: ищем фамилии, начинающиеся на букву 'И'
-SURNAME_FILTER_PATTERN = "И%" 
+# (можно передать и список паттернов - все они отбираются за один проход)
+SURNAME_FILTER_PATTERN = "И%"
 
-def initialize_database_schema(db_file):
-    """Удаляет старый файл БД и создает новую схему с тремя таблицами."""
-    
-    # 1. Очистка старого файла
-    if os.path.exists(db_file):
-        os.remove(db_file)
-        
-    # 2. Подключение к новой/созданной БД
-    try:
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-    except sqlite3.Error as e:
-        print(f"Ошибка подключения к базе данных: {e}")
-        sys.exit(1)
-
-    # 3. Создание таблиц (переименованы для уникальности)
-    cursor.executescript("""
-    CREATE TABLE Pupils (
+# --- МИГРАЦИИ СХЕМЫ ---
+# Каждый шаг идемпотентен: повторное применение к готовой БД ничего не ломает
+MIGRATIONS = [
+    (1, "Таблицы Pupils, Disciplines и Assignments", """
+    CREATE TABLE IF NOT EXISTS Pupils (
         PupilID INTEGER PRIMARY KEY,
         Name TEXT NOT NULL,
         Surname TEXT NOT NULL
     );
 
-    CREATE TABLE Disciplines (
+    CREATE TABLE IF NOT EXISTS Disciplines (
         DisciplineID INTEGER PRIMARY KEY,
         Title TEXT NOT NULL
     );
 
-    CREATE TABLE Assignments (
+    CREATE TABLE IF NOT EXISTS Assignments (
         AssignmentID INTEGER PRIMARY KEY,
         PupilID INTEGER,
         DisciplineID INTEGER,
         FOREIGN KEY (PupilID) REFERENCES Pupils(PupilID),
         FOREIGN KEY (DisciplineID) REFERENCES Disciplines(DisciplineID)
     );
-    """)
-    conn.commit()
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+    # Покрывающий индекс для поиска по префиксу фамилии (PupilID - это rowid, он уже в индексе)
+    (3, "Индекс Pupils по фамилии", """
+    CREATE INDEX IF NOT EXISTS idx_Pupils_Surname_Name ON Pupils (Surname, Name);
+    """),
+]
+
+def initialize_database_schema(db_file):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+
+    try:
+        conn = migrations.open_database(db_file, MIGRATIONS)
+        cursor = conn.cursor()
+    except sqlite3.Error as e:
+        print(f"Ошибка подключения к базе данных: {e}")
+        sys.exit(1)
+
     return conn, cursor
 
 def load_initial_records(conn):
@@ -84,55 +92,83 @@ def load_initial_records(conn):
     conn.commit()
     print("-> Данные успешно загружены.")
 
+def surname_filter(patterns):
+    """
+    Части запроса для набора паттернов LIKE: (WITH, источник строк Pupils, WHERE, параметры).
+    Паттерны вида 'префикс%' превращаются в диапазоны по индексу фамилии:
+    таблица диапазонов соединяется с Pupils, и каждый префикс - отдельный
+    поиск по индексу вместо просмотра всех учеников. Прочие паттерны
+    проверяются через LIKE, как раньше; длинные префиксы - диапазоном по
+    началу префикса и затем LIKE.
+    """
+    prefixes = [prefix_search.like_prefix(pattern) for pattern in patterns]
+    if None in prefixes:
+        condition = " OR ".join("P.Surname LIKE ?" for _ in patterns)
+        return "", "Pupils P", f"WHERE {condition}", list(patterns)
+
+    cte, params = prefix_search.ranges_cte("SurnameRanges", prefix_search.prefix_ranges(prefixes))
+    where_clause = ""
+    if not prefix_search.ranges_exact(prefixes):
+        where_clause = "WHERE " + " OR ".join("P.Surname LIKE ?" for _ in patterns)
+        params += patterns
+    return (f"WITH {cte}",
+            "SurnameRanges R\n    INNER JOIN\n        Pupils P ON P.Surname >= R.low AND P.Surname < R.high",
+            where_clause, params)
+
+
 def perform_filtered_join(cursor, filter_key):
     """
     Выполняет запрос INNER JOIN через три таблицы (Pupils, Assignments, Disciplines)
-    и фильтрует результат по фамилии (Surname), используя LIKE.
+    и фильтрует результат по фамилии (Surname). filter_key - паттерн LIKE
+    или список паттернов.
     """
-    print(f"\n--- Отчет по ученикам с фамилией, начинающейся на '{filter_key}' ---")
+    patterns = [filter_key] if isinstance(filter_key, str) else list(filter_key)
+    print(f"\n--- Отчет по ученикам с фамилией, начинающейся на '{', '.join(patterns)}' ---")
     
     # Запрос
+    with_clause, pupils_source, where_clause, params = surname_filter(patterns)
     sql_query = f"""
+    {with_clause}
     SELECT 
         P.PupilID, 
         P.Name, 
         P.Surname, 
         D.Title 
     FROM 
-        Pupils P
+        {pupils_source}
     INNER JOIN 
         Assignments A ON P.PupilID = A.PupilID
     INNER JOIN 
         Disciplines D ON A.DisciplineID = D.DisciplineID
-    WHERE 
-        P.Surname LIKE ?
+    {where_clause}
     ORDER BY 
         P.PupilID, D.Title;
     """
     
-    # Выполнение запроса с параметром для безопасности
-    cursor.execute(sql_query, (filter_key,))
-    
-    results = cursor.fetchall()
+    # Выполнение запроса с параметрами для безопасности
+    cursor.execute(sql_query, params)
     
     # Форматированный вывод
     print(f"| ID | Имя         | Фамилия     | Курс")
     print("-" * 45)
     
-    for row in results:
+    def format_row(row):
         pupil_id, name, surname, course = row
-        print(f"| {pupil_id:<2} | {name:<10} | {surname:<10} | {course}")
+        return f"| {pupil_id:<2} | {name:<10} | {surname:<10} | {course}"
         
-    if not results:
-        print("Нет данных, соответствующих условиям фильтрации.")
+    output.print_rows(cursor, format_row, empty="Нет данных, соответствующих условиям фильтрации.")
 
 
 def main_execution_flow():
     """Основной поток выполнения программы."""
     
     conn, cursor = initialize_database_schema(DB_NAME)
-    load_initial_records(conn)
+    # Стартовые данные загружаются только в пустую БД
+    if migrations.is_empty(conn, "Pupils"):
+        load_initial_records(conn)
+    connection.apply_profile(conn, "read-report")
     perform_filtered_join(cursor, SURNAME_FILTER_PATTERN)
+    connection.release(conn)
 
 
 if __name__ == "__main__":
@@ -1,32 +1,60 @@
-import sqlite3
+import argparse
 import os
+import sys
 
-def identify_shared_accounts():
-    """
-    Создает две таблицы для различных клиентских платформ и использует 
-    INNER JOIN для выявления аккаунтов, присутствующих в обеих системах.
-    """
-    db_name = "accounts report.db"
-    
-    # Очищаем старый файл для гарантии чистого запуска
-    if os.path.exists(db_name):
-        os.remove(db_name)
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import changelog, connection, idsets, migrations, output
 
-    db_handle = sqlite3.connect(db_name)
-    sql_runner = db_handle.cursor()
+# Множества аккаунтов платформ: битовые карты, обновляемые по журналам изменений
+PLATFORMS = [
+    idsets.PlatformIds("Десктоп", changelog.Capture("DesktopClients", "AccountID", ("ScreenName",))),
+    idsets.PlatformIds("Мобильная", changelog.Capture("MobileClients", "AccountID", ("ScreenName",))),
+]
 
-    # Создаем таблицы для двух клиентских групп с новыми именами
-    sql_runner.executescript("""
-    CREATE TABLE DesktopClients (
+# Миграции схемы: таблицы для двух клиентских групп
+MIGRATIONS = [
+    (1, "Таблицы DesktopClients и MobileClients", """
+    CREATE TABLE IF NOT EXISTS DesktopClients (
         AccountID INTEGER PRIMARY KEY,
         ScreenName TEXT NOT NULL
     );
 
-    CREATE TABLE MobileClients (
+    CREATE TABLE IF NOT EXISTS MobileClients (
         AccountID INTEGER PRIMARY KEY,
         ScreenName TEXT NOT NULL
     );
-    """)
+    """),
+    (2, "Журналы изменений и битовые карты платформ",
+     "".join(platform.capture.script() for platform in PLATFORMS) + idsets.PlatformIds.script()),
+    # Карты прежнего формата (одно целое) перестраиваются при следующем обновлении
+    (3, "Битовые карты платформ блоками", f"DELETE FROM {idsets.BITMAPS_TABLE};"),
+]
+
+def print_overlap(platform_sets):
+    """Число аккаунтов в каждой области диаграммы Венна (ровно на этих платформах)."""
+    print("\n--- Пересечения платформ ---")
+    names = list(platform_sets)
+    regions = idsets.venn_counts(platform_sets)
+    for members, count in sorted(regions.items(), key=lambda item: (-len(item[0]), sorted(map(names.index, item[0])))):
+        print(f"Только {' + '.join(name for name in names if name in members)}: {count}")
+    print(f"Всего аккаунтов: {sum(regions.values())}")
+
+def identify_shared_accounts():
+    """
+    Создает две таблицы для различных клиентских платформ и использует 
+    INNER JOIN для выявления аккаунтов, присутствующих в обеих системах.
+    Пересечение считается по битовым картам id платформ (db_common.idsets).
+    """
+    parser = argparse.ArgumentParser(description="Аккаунты, общие для клиентских платформ")
+    parser.add_argument("--venn", action="store_true", help="Показать число аккаунтов по сочетаниям платформ")
+    args = parser.parse_args()
+
+    db_name = "accounts report.db"
+
+    # Открываем существующую БД, схема доводится до актуальной версии
+    db_handle = migrations.open_database(db_name, MIGRATIONS)
+    sql_runner = db_handle.cursor()
 
     # --- Подготовка данных ---
     
@@ -46,30 +74,39 @@ def identify_shared_accounts():
         (6, "Frank")
     ]
 
-    sql_runner.executemany("INSERT INTO DesktopClients VALUES (?, ?);", desktop_data)
-    sql_runner.executemany("INSERT INTO MobileClients VALUES (?, ?);", mobile_data)
-    db_handle.commit()
+    # Данные загружаются только в пустую БД
+    if migrations.is_empty(db_handle, "DesktopClients"):
+        sql_runner.executemany("INSERT INTO DesktopClients VALUES (?, ?);", desktop_data)
+        sql_runner.executemany("INSERT INTO MobileClients VALUES (?, ?);", mobile_data)
+        db_handle.commit()
 
-    # --- Анализ: Поиск общих аккаунтов (INNER JOIN) ---
+    # --- Анализ: Поиск общих аккаунтов ---
+    # Битовые карты обновляются по журналам изменений до перехода в режим чтения
+    platform_sets = {platform.name: platform.refresh(db_handle) for platform in PLATFORMS}
+    connection.apply_profile(db_handle, "read-report")
 
-    # Запрос на поиск общих записей, используя INNER JOIN
+    # Пересечение всех платформ в памяти, имена - поиском по ключу
+    shared = idsets.intersection(platform_sets.values())
     sql_runner.execute("""
-    SELECT 
+    SELECT
         DC.AccountID, DC.ScreenName
-    FROM 
+    FROM
+        json_each(?) J
+    JOIN
         DesktopClients DC
-    JOIN 
-        MobileClients MC 
-    ON 
-        DC.AccountID = MC.AccountID;
-    """)
+    ON
+        DC.AccountID = J.value
+    ORDER BY
+        DC.AccountID;
+    """, (idsets.ids_json(shared),))
 
     print("--- Отчет по общим аккаунтам ---")
     print("Аккаунты, используемые и на десктопе, и на мобильной платформе:")
-    for record in sql_runner.fetchall():
-        print(f"Аккаунт №: {record[0]}, Имя пользователя: {record[1]}")
+    output.print_rows(sql_runner, lambda record: f"Аккаунт №: {record[0]}, Имя пользователя: {record[1]}")
+    if args.venn:
+        print_overlap(platform_sets)
 
-    db_handle.close()
+    connection.release(db_handle)
     print("\nПроверка завершена.")
 
 if __name__ == "__main__":
@@ -1,101 +1,350 @@
 # Импорт необходимых модулей для работы с БД и датами
+import argparse
+import itertools
+import json
 import sqlite3
 import os
-from datetime import datetime, timedelta
+import sys
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, migrations, money, output
+
+# NumPy необязателен: без него сегментация считается запросом в БД
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # --- Настройки БД и схемы ---
 DB_NAME = "clients status.sqlite"
 TABLE_NAME = "UserActivity"
-VIP_THRESHOLD = 50000
+COUNTS_TABLE = "SegmentCounts"
+VIP_THRESHOLD = money.Money.from_decimal(50000)
 RECENT_DAYS = 60
 CHURN_DAYS = 180
 
-def setup_database(db_file):
-    """Инициализирует подключение и создает таблицу."""
-    # Удаляем старый файл для чистого запуска
-    if os.path.exists(db_file):
-        os.remove(db_file)
-        
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
+# Даты хранятся номерами дней от EPOCH (как unixepoch(дата) / 86400 в SQLite):
+# давность - разность целых, без julianday() для каждой строки
+EPOCH = date(1970, 1, 1)
+# Замены NULL в столбцах для NumPy: меньше любых настоящих значений
+NO_REVENUE = NO_DAY = -2 ** 63
+# Сколько строк забирать из БД за один раз в NumPy-сегментации
+CHUNK_ROWS = 100_000
+# Строка пачки в NumPy: выручка в копейках и номер дня
+COLUMNS_DTYPE = [("revenue", "i8"), ("day", "i8")]
 
-    # Создаем таблицу с новыми именами столбцов
-    cursor.execute(f"""
-    CREATE TABLE {TABLE_NAME} (
+# --- Миграции схемы ---
+MIGRATIONS = [
+    (1, f"Таблица {TABLE_NAME}", f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
         user_pk INTEGER PRIMARY KEY,
         alias_name TEXT NOT NULL,
         last_txn_date TEXT,
         gross_revenue REAL
     );
-    """)
+    """),
+    (2, "Выручка в целых копейках",
+     lambda conn: money.convert_column(conn, TABLE_NAME, "gross_revenue", not_null=False)),
+    (3, "Дата последней транзакции - номер дня", f"""
+    ALTER TABLE {TABLE_NAME} ADD COLUMN last_txn_day INTEGER;
+    UPDATE {TABLE_NAME}
+    SET last_txn_day = CAST(julianday(last_txn_date) - julianday('{EPOCH.isoformat()}') AS INTEGER);
+    ALTER TABLE {TABLE_NAME} DROP COLUMN last_txn_date;
+    """),
+    (4, f"Таблица {COUNTS_TABLE}", f"""
+    CREATE TABLE IF NOT EXISTS {COUNTS_TABLE} (
+        rule_set TEXT NOT NULL,
+        as_of_day INTEGER NOT NULL,
+        segment TEXT NOT NULL,
+        users INTEGER NOT NULL,
+        revenue MONEY INTEGER NOT NULL,
+        PRIMARY KEY (rule_set, as_of_day, segment)
+    ) WITHOUT ROWID;
+    """),
+]
+
+def day_number(value):
+    """Номер дня для даты (date)."""
+    return (value - EPOCH).days
+
+def day_date(number):
+    """Дата по номеру дня."""
+    return EPOCH + timedelta(days=number)
+
+# --- Правила сегментов ---
+
+@dataclass(frozen=True)
+class SegmentRule:
+    """
+    Правило сегмента: все заданные условия должны выполняться, None - не проверять.
+    min_revenue - выручка строго больше; within_days - последняя транзакция
+    меньше стольких дней назад; older_than_days - не меньше стольких дней назад
+    (как julianday('now') - julianday(дата) <= N и > N в прежнем CASE: дата
+    хранится днем, а 'now' - с временем суток).
+    Пользователи без транзакций проходят условия давности, только если
+    no_transactions=True.
+    """
+    segment: str
+    min_revenue: money.Money = None
+    within_days: int = None
+    older_than_days: int = None
+    no_transactions: bool = False
+
+    @property
+    def has_recency(self):
+        return self.within_days is not None or self.older_than_days is not None
+
+@dataclass(frozen=True)
+class RuleSet:
+    """Набор правил: пользователь получает сегмент первого подходящего правила, иначе default."""
+    name: str
+    rules: tuple
+    default: str
+
+    @property
+    def segments(self):
+        """Сегменты в порядке правил, без повторов, default - последним."""
+        return list(dict.fromkeys([rule.segment for rule in self.rules] + [self.default]))
+
+LOYALTY_RULES = RuleSet("loyalty", (
+    SegmentRule("VIP", min_revenue=VIP_THRESHOLD, within_days=RECENT_DAYS),
+    SegmentRule("Риск оттока", older_than_days=CHURN_DAYS, no_transactions=True),
+), default="Обычный")
+
+RULE_SETS = {LOYALTY_RULES.name: LOYALTY_RULES}
+
+def load_rules(path):
+    """
+    Набор правил из JSON-файла:
+    {"name": "...", "default": "...", "rules": [{"segment": "...", "min_revenue": "50000",
+     "within_days": 60, "older_than_days": null, "no_transactions": false}, ...]}
+    """
+    with open(path, encoding="utf-8") as source:
+        data = json.load(source)
+    rules = []
+    for rule in data["rules"]:
+        rule = dict(rule)
+        if rule.get("min_revenue") is not None:
+            rule["min_revenue"] = money.Money.from_decimal(str(rule["min_revenue"]))
+        rules.append(SegmentRule(**rule))
+    return RuleSet(data["name"], tuple(rules), data["default"])
+
+# --- Сегментация в БД ---
+
+def segment_case(rule_set, today):
+    """
+    Выражение CASE для сегмента и его параметры. Пороги и даты отсечения
+    передаются параметрами, поэтому текст запроса зависит только от вида
+    правил и подготовленный оператор берется из кэша соединения.
+    """
+    branches, params = [], []
+    for rule in rule_set.rules:
+        conditions = []
+        if rule.min_revenue is not None:
+            conditions.append("gross_revenue > ?")
+            params.append(rule.min_revenue.minor)
+        recency = []
+        if rule.within_days is not None:
+            recency.append("last_txn_day > ?")
+            params.append(today - rule.within_days)
+        if rule.older_than_days is not None:
+            recency.append("last_txn_day <= ?")
+            params.append(today - rule.older_than_days)
+        if recency:
+            condition = " AND ".join(recency)
+            conditions.append(f"(last_txn_day IS NULL OR {condition})" if rule.no_transactions else condition)
+        branches.append(f"WHEN {' AND '.join(conditions) or '1'} THEN ?")
+        params.append(rule.segment)
+    params.append(rule_set.default)
+    return f"CASE {' '.join(branches)} ELSE ? END", params
+
+def segment_counts_sql(conn, rule_set, today):
+    """
+    Число пользователей и выручка по сегментам одним запросом в БД.
+    Выручка после миграции 2 только целая, поэтому встроенный SUM точен и
+    заметно быстрее money_sum, который вызывает Python на каждую строку.
+    """
+    case, params = segment_case(rule_set, today)
+    rows = conn.execute(f"""
+    SELECT segment, COUNT(*), SUM(gross_revenue)
+    FROM (SELECT {case} AS segment, gross_revenue FROM {TABLE_NAME})
+    GROUP BY segment;
+    """, params).fetchall()
+    counts = {segment: (0, money.Money(0)) for segment in rule_set.segments}
+    for segment, users, revenue in rows:
+        counts[segment] = (users, money.Money(revenue or 0))
+    return counts
+
+# --- Сегментация в NumPy ---
+
+def classify_columns(revenue, days, rule_set, today):
+    """
+    Векторная классификация по массивам столбцов (NULL заменены на NO_REVENUE
+    и NO_DAY). Возвращает массив номеров правил; len(rule_set.rules) - default.
+    """
+    classes = numpy.full(len(days), len(rule_set.rules), dtype=numpy.int32)
+    unassigned = numpy.ones(len(days), dtype=bool)
+    never = days == NO_DAY
+    for index, rule in enumerate(rule_set.rules):
+        mask = unassigned.copy()
+        if rule.min_revenue is not None:
+            mask &= revenue > rule.min_revenue.minor
+        if rule.has_recency:
+            recency = ~never
+            if rule.within_days is not None:
+                recency &= days > today - rule.within_days
+            if rule.older_than_days is not None:
+                recency &= days <= today - rule.older_than_days
+            mask &= (recency | never) if rule.no_transactions else recency
+        classes[mask] = index
+        unassigned &= ~mask
+    return classes
+
+def segment_counts_numpy(conn, rule_set, today, chunk_rows=CHUNK_ROWS):
+    """
+    Те же итоги, что segment_counts_sql, но классификация - в NumPy: столбцы
+    читаются пачками по chunk_rows строк, итоги копятся по пачкам.
+    """
+    if numpy is None:
+        raise RuntimeError("Для сегментации в NumPy нужен установленный пакет numpy")
+    segments = rule_set.segments
+    index_of = [segments.index(rule.segment) for rule in rule_set.rules] + [segments.index(rule_set.default)]
+    users = [0] * len(segments)
+    revenue = [0] * len(segments)
+    cursor = conn.execute(
+        f"SELECT COALESCE(gross_revenue, ?), COALESCE(last_txn_day, ?) FROM {TABLE_NAME};", (NO_REVENUE, NO_DAY))
+    while True:
+        # Строки курсора сразу в массив, без промежуточного списка кортежей
+        columns = numpy.fromiter(itertools.islice(cursor, chunk_rows), dtype=COLUMNS_DTYPE)
+        if not len(columns):
+            break
+        classes = classify_columns(columns["revenue"], columns["day"], rule_set, today)
+        known_revenue = columns["revenue"] != NO_REVENUE
+        for index, count in enumerate(numpy.bincount(classes, minlength=len(index_of))):
+            in_class = classes == index
+            users[index_of[index]] += int(count)
+            revenue[index_of[index]] += int(columns["revenue"][in_class & known_revenue].sum())
+    return {segment: (users[i], money.Money(revenue[i])) for i, segment in enumerate(segments)}
+
+# --- Итоги по сегментам ---
+
+def segment_counts(conn, rule_set, today, engine="sql"):
+    """
+    Итоги {сегмент: (пользователей, выручка)} на день today (номер дня).
+    engine: "sql" - в БД, "numpy" - векторно в NumPy. Для данных из SQLite
+    быстрее "sql": в NumPy-пути почти все время уходит на чтение строк, а
+    classify_columns полезен для столбцов, которые уже лежат в массивах.
+    """
+    if engine == "numpy":
+        return segment_counts_numpy(conn, rule_set, today)
+    return segment_counts_sql(conn, rule_set, today)
+
+def write_segment_counts(conn, rule_set, today, counts):
+    """Записывает итоги в SegmentCounts одной транзакцией, заменяя прежние на тот же день."""
+    conn.execute("BEGIN;")
+    try:
+        conn.execute(f"DELETE FROM {COUNTS_TABLE} WHERE rule_set = ? AND as_of_day = ?;", (rule_set.name, today))
+        conn.executemany(
+            f"INSERT INTO {COUNTS_TABLE} (rule_set, as_of_day, segment, users, revenue) VALUES (?, ?, ?, ?, ?);",
+            [(rule_set.name, today, segment, users, revenue) for segment, (users, revenue) in counts.items()])
+        conn.execute("COMMIT;")
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+
+def setup_database(db_file):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+    conn = migrations.open_database(db_file, MIGRATIONS, detect_types=money.DETECT_TYPES)
+    money.register(conn)
+    cursor = conn.cursor()
     return conn, cursor
 
 def insert_data(cursor):
     """Вставляет синтетические данные в таблицу UserActivity."""
-    current_datetime = datetime.today()
-    
-    # Данные для вставки: user_pk, alias_name, last_txn_date, gross_revenue
+    today = day_number(date.today())
+
+    # Данные для вставки: user_pk, alias_name, last_txn_day, gross_revenue
     user_data = [
         # Пользователь 1: Соответствует VIP-условию
-        (101, "Phoenix", (current_datetime - timedelta(days=10)).strftime('%Y-%m-%d'), 60000), 
-        
+        (101, "Phoenix", today - 10, money.Money.from_decimal(60000)),
+
         # Пользователь 2: Соответствует Удержанию (прошло > 180 дней)
-        (102, "Rider_77", (current_datetime - timedelta(days=200)).strftime('%Y-%m-%d'), 30000), 
-        
+        (102, "Rider_77", today - 200, money.Money.from_decimal(30000)),
+
         # Пользователь 3: Соответствует Обычному (Сумма < 50k, или активность > 60 дней)
-        (103, "ShadowLord", (current_datetime - timedelta(days=100)).strftime('%Y-%m-%d'), 40000), 
-        
+        (103, "ShadowLord", today - 100, money.Money.from_decimal(40000)),
+
         # Пользователь 4: Соответствует Обычному (Активность < 60 дней, но Сумма < 50k)
-        (104, "Viktoria_S", (current_datetime - timedelta(days=30)).strftime('%Y-%m-%d'), 20000), 
-        
-        # Пользователь 5: Соответствует Удержанию (last_txn_date IS NULL)
-        (105, "Anna_K", None, 70000), 
+        (104, "Viktoria_S", today - 30, money.Money.from_decimal(20000)),
+
+        # Пользователь 5: Соответствует Удержанию (last_txn_day IS NULL)
+        (105, "Anna_K", None, money.Money.from_decimal(70000)),
     ]
-    
-    cursor.executemany(f"INSERT INTO {TABLE_NAME} VALUES (?, ?, ?, ?);", user_data)
 
-def execute_segmentation_query(cursor):
+    cursor.executemany(
+        f"INSERT INTO {TABLE_NAME} (user_pk, alias_name, last_txn_day, gross_revenue) VALUES (?, ?, ?, ?);",
+        user_data)
+
+def execute_segmentation_query(cursor, rule_set=LOYALTY_RULES, today=None):
     """Выполняет SQL-запрос с CASE для статуса пользователей."""
-    
-    # Обратите внимание на переписанный CASE-оператор и использование f-строки
+    if today is None:
+        today = day_number(date.today())
+    case, params = segment_case(rule_set, today)
     query = f"""
-    SELECT alias_name,
-           CASE
-                -- Условие 1: Премиум (VIP)
-                WHEN gross_revenue > {VIP_THRESHOLD} AND last_txn_date IS NOT NULL AND julianday('now') - julianday(last_txn_date) <= {RECENT_DAYS} THEN 'VIP'
-                
-                -- Условие 2: Риск оттока
-                WHEN (last_txn_date IS NULL) OR (julianday('now') - julianday(last_txn_date) > {CHURN_DAYS}) THEN 'Риск оттока'
-                
-                -- Условие 3: Обычный
-                ELSE 'Обычный'
-           END AS user_segment
+    SELECT alias_name, {case} AS user_segment
     FROM {TABLE_NAME}
     ORDER BY alias_name;
     """
-    
-    cursor.execute(query)
-    
+
+    cursor.execute(query, params)
+
     print("Результаты статуса пользователей:")
     print("---------------------------------")
-    for row in cursor.fetchall():
-        print(f"Имя: {row[0]:<15} | Статус: {row[1]}")
+    output.print_rows(cursor, lambda row: f"Имя: {row[0]:<15} | Статус: {row[1]}")
     print("---------------------------------")
 
+def print_segment_counts(rule_set, today, counts):
+    print(f"\nСегменты ({rule_set.name}) на {day_date(today).isoformat()}:")
+    for segment, (users, revenue) in counts.items():
+        print(f"{segment:<15} | Пользователей: {users:>9} | Выручка: {revenue}")
+
 
 def segment_users_by_loyalty():
     """Главная функция для выполнения всех шагов."""
+    parser = argparse.ArgumentParser(description="Сегментация пользователей по выручке и давности транзакций")
+    parser.add_argument("--rules", metavar="ФАЙЛ", help="JSON-файл с набором правил (по умолчанию loyalty)")
+    parser.add_argument("--engine", choices=["sql", "numpy"], default="sql",
+                        help="Где считать итоги по сегментам")
+    parser.add_argument("--as-of", type=date.fromisoformat, metavar="ГГГГ-ММ-ДД",
+                        help="День, на который считается давность (по умолчанию сегодня)")
+    parser.add_argument("--counts", action="store_true", help="Напечатать итоги по сегментам")
+    args = parser.parse_args()
+    if args.engine == "numpy" and numpy is None:
+        parser.error("для --engine numpy нужен установленный пакет numpy")
+    rule_set = load_rules(args.rules) if args.rules else LOYALTY_RULES
+    today = day_number(args.as_of or date.today())
+
     conn = None
     try:
         conn, cursor = setup_database(DB_NAME)
-        insert_data(cursor)
-        conn.commit()
-        execute_segmentation_query(cursor)
+        # Синтетические данные загружаются только в пустую БД
+        if migrations.is_empty(conn, TABLE_NAME):
+            insert_data(cursor)
+            conn.commit()
+        counts = segment_counts(conn, rule_set, today, args.engine)
+        write_segment_counts(conn, rule_set, today, counts)
+        connection.apply_profile(conn, "read-report")
+        execute_segmentation_query(cursor, rule_set, today)
+        if args.counts:
+            print_segment_counts(rule_set, today, counts)
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     segment_users_by_loyalty()
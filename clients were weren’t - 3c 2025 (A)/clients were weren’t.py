@@ -1,60 +1,112 @@
 # Импорт необходимых модулей
+import argparse
 import sqlite3
 import os
+import sys
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import changelog, connection, migrations, output, tablediff
 
 # --- Константы ---
 DB_PATH = "clients were weren’t.db"
 TABLE_A = "InitialMembers"
 TABLE_B = "FinalMembers"
+# Журналы изменений списков и поддерживаемое по ним сравнение
+CAPTURE_A = changelog.Capture(TABLE_A, "UserID_PK", ("DisplayName",))
+CAPTURE_B = changelog.Capture(TABLE_B, "UserID_PK", ("DisplayName",))
+MEMBER_COMPARISON = changelog.Comparison("MemberComparison", CAPTURE_A, CAPTURE_B)
+# Контрольная точка для вывода изменений (--changes)
+REPORT_CHECKPOINT = "report"
+# Хэши диапазонов ключей для сравнения с другим файлом БД (--diff-with)
+MEMBER_HASHES = [tablediff.RangeHashes(capture.table, capture.key, capture.columns)
+                 for capture in (CAPTURE_A, CAPTURE_B)]
+
+# --- Миграции схемы ---
+MIGRATIONS = [
+    (1, f"Таблицы {TABLE_A} и {TABLE_B}", f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_A} (
+        UserID_PK INTEGER PRIMARY KEY,
+        DisplayName TEXT NOT NULL
+    );
 
-def execute_comparison_query(cursor, source_table, target_table, title):
+    CREATE TABLE IF NOT EXISTS {TABLE_B} (
+        UserID_PK INTEGER PRIMARY KEY,
+        DisplayName TEXT NOT NULL
+    );
+    """),
+    (2, "Журналы изменений и сравнение списков",
+     CAPTURE_A.script() + CAPTURE_B.script() + MEMBER_COMPARISON.script()),
+    (3, "Хэши диапазонов ключей", "".join(hashes.script() for hashes in MEMBER_HASHES)),
+    # Хэши пересчитываются заново, а таблицы отмечаются как хэшируемые
+    (4, "Отметка таблиц с хэшами диапазонов", "".join(hashes.script() for hashes in MEMBER_HASHES)),
+]
+
+def execute_comparison_query(cursor, side, title):
     """
-    Выполняет SQL-запрос с EXCEPT для сравнения двух таблиц
-    и выводит результат.
+    Выводит записи списка side ("left" - TABLE_A, "right" - TABLE_B), которых
+    нет в другом списке: то же, что EXCEPT, но по поддерживаемому сравнению.
     """
     print(f"\n--- {title} ---")
-    
-    # Запрос для нахождения уникальных записей в исходной таблице (Source)
-    # по сравнению с целевой таблицей (Target)
-    query = f"""
-    SELECT UserID_PK, DisplayName FROM {source_table}
-    EXCEPT
-    SELECT UserID_PK, DisplayName FROM {target_table};
-    """
-    cursor.execute(query)
-    
-    results = cursor.fetchall()
-    
-    if results:
-        for row in results:
-            print(f"ID: {row[0]:<5} Имя: {row[1]}")
-    else:
-        print("Не найдено.")
+
+    cursor.execute(MEMBER_COMPARISON.except_sql(side))
+
+    output.print_rows(cursor, lambda row: f"ID: {row[0]:<5} Имя: {row[1]}", empty="Не найдено.")
+
+def take_changes(conn, name=REPORT_CHECKPOINT):
+    """Изменения обоих списков с контрольной точки name; точка сдвигается на прочитанное."""
+    changes = [(capture, capture.changes_since(conn, name)) for capture in (CAPTURE_A, CAPTURE_B)]
+    for capture, table_changes in changes:
+        capture.checkpoint(conn, name, table_changes.until)
+        capture.prune(conn)
+    conn.commit()
+    return changes
+
+def print_changes(changes):
+    for capture, table_changes in changes:
+        print(f"\n--- Изменения {capture.table} с прошлой проверки ---")
+        for row in table_changes.added:
+            print(f"Добавлен:  ID: {row[0]:<5} Имя: {row[1]}")
+        for row in table_changes.removed:
+            print(f"Удален:    ID: {row[0]:<5} Имя: {row[1]}")
+        for before, after in table_changes.changed:
+            print(f"Изменен:   ID: {before[0]:<5} Имя: {before[1]} -> {after[1]}")
+        if not (table_changes.added or table_changes.removed or table_changes.changed):
+            print("Изменений нет.")
+
+def print_snapshot_diff(conn, path):
+    """Разница обоих списков с теми же списками в другом файле БД (один проход на список)."""
+    snapshot = tablediff.open_snapshot(path)
+    try:
+        for hashes in MEMBER_HASHES:
+            diff = tablediff.symmetric_diff(conn, hashes, snapshot, hashes)
+            print(f"\n--- Разница {hashes.table} со снимком {path} ---")
+            for row in diff.only_left:
+                print(f"Только здесь:    ID: {row[0]:<5} Имя: {row[1]}")
+            for row in diff.only_right:
+                print(f"Только в снимке: ID: {row[0]:<5} Имя: {row[1]}")
+            for here, there in diff.changed:
+                print(f"Различается:     ID: {here[0]:<5} Имя: {there[1]} -> {here[1]}")
+            if not (diff.only_left or diff.only_right or diff.changed):
+                print("Различий нет.")
+    finally:
+        snapshot.close()
 
 def run_flow_analysis():
     """Главная функция для настройки БД, вставки данных и выполнения анализа."""
-
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    parser = argparse.ArgumentParser(description="Сравнение списков клиентов 2024 и 2025 годов")
+    parser.add_argument("--changes", action="store_true",
+                        help="Показать изменения списков с прошлого запуска с --changes")
+    parser.add_argument("--diff-with", metavar="ФАЙЛ",
+                        help="Сравнить списки с теми же списками в другом файле БД (снимке)")
+    args = parser.parse_args()
 
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        # Открываем существующую БД, схема доводится до актуальной версии
+        conn = migrations.open_database(DB_PATH, MIGRATIONS)
         cursor = conn.cursor()
 
-        # Создаем две таблицы с новыми именами и структурой
-        cursor.executescript(f"""
-        CREATE TABLE {TABLE_A} (
-            UserID_PK INTEGER PRIMARY KEY,
-            DisplayName TEXT NOT NULL
-        );
-
-        CREATE TABLE {TABLE_B} (
-            UserID_PK INTEGER PRIMARY KEY,
-            DisplayName TEXT NOT NULL
-        );
-        """)
-
         # Данные для Group A (Изначальный список)
         group_a_data = [
             (1, "Maxim Galkin"),
@@ -71,32 +123,42 @@ def run_flow_analysis():
             (6, "Elena Romanova")
         ]
 
-        # Вставляем данные
-        cursor.executemany(f"INSERT INTO {TABLE_A} VALUES (?, ?);", group_a_data)
-        cursor.executemany(f"INSERT INTO {TABLE_B} VALUES (?, ?);", group_b_data)
-        conn.commit()
+        # Вставляем данные (только в пустую БД)
+        if migrations.is_empty(conn, TABLE_A):
+            cursor.executemany(f"INSERT INTO {TABLE_A} VALUES (?, ?);", group_a_data)
+            cursor.executemany(f"INSERT INTO {TABLE_B} VALUES (?, ?);", group_b_data)
+            conn.commit()
+        # Сравнение пересчитывается только по ключам, измененным с прошлого запуска
+        MEMBER_COMPARISON.refresh(conn)
+        changes = take_changes(conn) if args.changes else None
+        for hashes in MEMBER_HASHES:
+            hashes.refresh(conn)
+        connection.apply_profile(conn, "read-report")
 
         # Клиенты, которые были в 2024, но нет в 2025
         execute_comparison_query(
-            cursor, 
-            TABLE_A, 
-            TABLE_B, 
+            cursor,
+            "left",
             "Клиенты, которые были в 2024, но отсутствуют в 2025"
         )
 
         # Клиенты, которые появились только в 2025, отсутствуют в 2024
         execute_comparison_query(
-            cursor, 
-            TABLE_B, 
-            TABLE_A, 
+            cursor,
+            "right",
             "Клиенты, которые появились только в 2025, отсутствуют в 2024"
         )
 
+        if changes is not None:
+            print_changes(changes)
+        if args.diff_with:
+            print_snapshot_diff(conn, args.diff_with)
+
     except sqlite3.Error as e:
         print(f"Произошла ошибка базы данных: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     run_flow_analysis()
@@ -1,38 +1,152 @@
 # Импорт необходимых модулей
 import sqlite3
 import os
+import sys
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, migrations, output
 
 # --- Константы ---
 DB_PATH = "company_contacts.db"
 TABLE_SALES = "Dept_Sales"
 TABLE_HR = "Dept_HR"
 TABLE_OPS = "Dept_Operations"
+DEPARTMENT_TABLES = (TABLE_SALES, TABLE_HR, TABLE_OPS)
+# Сводный справочник: по строке на канонический ключ (имя, телефон)
+DIRECTORY_TABLE = "ContactDirectory"
+# Заглавные буквы кириллицы: lower() в SQLite без ICU меняет регистр только у латиницы
+_CYRILLIC_UPPER = "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+# Разделители в записи номера: "+7 (900) 123-45-67" и "89001234567" - один номер
+_PHONE_SEPARATORS = " -().+"
+# Пробельные символы имени кроме пробела: таб, перевод строки, вертикальный таб,
+# перевод страницы, CR и char(1) - метка при сжатии пробелов (во входных данных
+# тоже считается пробелом)
+_ALIAS_WHITESPACE = (1, 9, 10, 11, 12, 13)
 
-def setup_database(db_file):
-    """Настраивает подключение, удаляет старый файл и создает таблицы."""
-    if os.path.exists(db_file):
-        os.remove(db_file)
+def alias_key_sql(expr):
+    """
+    SQL-выражение канонического ключа имени: без пробелов по краям, с одиночными
+    пробелами внутри и в нижнем регистре (латиница и кириллица). Замены букв
+    разбиты на вложенные подзапросы: иначе переполняется стек парсера SQLite.
 
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
+    Серия пробелов любой длины сжимается за три замены: после каждого пробела
+    ставится метка, пары "метка, пробел" удаляются, затем удаляются метки.
+    """
+    spaced = expr
+    for code in _ALIAS_WHITESPACE:
+        spaced = f"replace({spaced}, char({code}), ' ')"
+    collapsed = f"replace(replace(replace({spaced}, ' ', ' ' || char(1)), char(1) || ' ', ''), char(1), '')"
+    query = f"SELECT trim({collapsed}) AS a"
+    for start in range(0, len(_CYRILLIC_UPPER), 11):
+        folded = "a"
+        for letter in _CYRILLIC_UPPER[start:start + 11]:
+            folded = f"replace({folded}, '{letter}', '{letter.lower()}')"
+        query = f"SELECT {folded} AS a FROM ({query})"
+    return f"(SELECT coalesce(lower(a), '') FROM ({query}))"
+
+def phone_key_sql(expr):
+    """
+    SQL-выражение канонического ключа телефона: только цифры, 11-значный
+    номер с 7 или 8 в начале - без кода страны. Пустая строка - номер не указан.
+    """
+    digits = expr
+    for separator in _PHONE_SEPARATORS:
+        digits = f"replace({digits}, '{separator}', '')"
+    return (f"(SELECT coalesce(CASE WHEN length(d) = 11 AND substr(d, 1, 1) IN ('7', '8') "
+            f"THEN substr(d, 2) ELSE d END, '') FROM (SELECT {digits} AS d))")
+
+def directory_script():
+    """
+    SQL-скрипт для шага миграции: справочник, триггеры отделов и заполнение по
+    уже загруженным строкам. sources - сколько строк отделов дают этот ключ;
+    показываются имя и телефон первой из них. Триггеры написаны на чистом SQL,
+    поэтому справочник поддерживается при любой записи в таблицы отделов.
+    """
+    def key_values(row):
+        return f"{alias_key_sql(f'{row}.Contact_Alias')}, {phone_key_sql(f'{row}.Mobile_Num')}"
 
-    # Создаем три таблицы для разных отделов
-    cursor.executescript(f"""
-    CREATE TABLE {TABLE_SALES} (
+    def add(row):
+        return f"""
+        INSERT INTO {DIRECTORY_TABLE} (alias_key, phone_key, Contact_Alias, Mobile_Num, sources)
+        VALUES ({key_values(row)}, {row}.Contact_Alias, {row}.Mobile_Num, 1)
+        ON CONFLICT (alias_key, phone_key) DO UPDATE SET sources = sources + 1;"""
+
+    def remove(row):
+        where = f"(alias_key, phone_key) = ({key_values(row)})"
+        return f"""
+        UPDATE {DIRECTORY_TABLE} SET sources = sources - 1 WHERE {where};
+        DELETE FROM {DIRECTORY_TABLE} WHERE {where} AND sources = 0;"""
+
+    script = f"""
+    CREATE TABLE IF NOT EXISTS {DIRECTORY_TABLE} (
+        alias_key TEXT NOT NULL,
+        phone_key TEXT NOT NULL,
+        Contact_Alias TEXT,
+        Mobile_Num TEXT,
+        sources INTEGER NOT NULL,
+        PRIMARY KEY (alias_key, phone_key)
+    ) WITHOUT ROWID;
+
+    -- Покрывающий индекс: вывод справочника - просмотр индекса без сортировки
+    CREATE INDEX IF NOT EXISTS idx_{DIRECTORY_TABLE}_alias ON {DIRECTORY_TABLE} (Contact_Alias, Mobile_Num);
+    """
+    for table in DEPARTMENT_TABLES:
+        script += f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_directory_insert AFTER INSERT ON {table}
+    BEGIN{add("new")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_directory_update AFTER UPDATE OF Contact_Alias, Mobile_Num ON {table}
+    BEGIN{remove("old")}{add("new")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_directory_delete AFTER DELETE ON {table}
+    BEGIN{remove("old")}
+    END;
+    """
+    all_contacts = " UNION ALL ".join(f"SELECT Contact_Alias, Mobile_Num FROM {table}" for table in DEPARTMENT_TABLES)
+    return script + f"""
+    -- WHERE true - чтобы ON CONFLICT не принимался за часть соединения
+    INSERT INTO {DIRECTORY_TABLE} (alias_key, phone_key, Contact_Alias, Mobile_Num, sources)
+    SELECT {alias_key_sql("C.Contact_Alias")}, {phone_key_sql("C.Mobile_Num")}, C.Contact_Alias, C.Mobile_Num, 1
+    FROM ({all_contacts}) C
+    WHERE true
+    ON CONFLICT (alias_key, phone_key) DO UPDATE SET sources = sources + 1;
+    """
+
+# --- Миграции схемы ---
+MIGRATIONS = [
+    # Три таблицы для разных отделов
+    (1, f"Таблицы {TABLE_SALES}, {TABLE_HR} и {TABLE_OPS}", f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_SALES} (
         Contact_Alias TEXT,
         Mobile_Num TEXT
     );
 
-    CREATE TABLE {TABLE_HR} (
+    CREATE TABLE IF NOT EXISTS {TABLE_HR} (
         Contact_Alias TEXT,
         Mobile_Num TEXT
     );
 
-    CREATE TABLE {TABLE_OPS} (
+    CREATE TABLE IF NOT EXISTS {TABLE_OPS} (
         Contact_Alias TEXT,
         Mobile_Num TEXT
     );
-    """)
+    """),
+    (2, f"Сводный справочник {DIRECTORY_TABLE} с дедупликацией по каноническим ключам", directory_script()),
+    # Ключ имени сжимал не больше четырех пробелов подряд и не считал пробелами
+    # переводы строк: триггеры пересоздаются, справочник заполняется заново
+    (3, f"Пересчет ключей имени в {DIRECTORY_TABLE} со сжатием любых пробелов",
+     "".join(f"DROP TRIGGER IF EXISTS trg_{table}_directory_{operation};\n"
+             for table in DEPARTMENT_TABLES for operation in ("insert", "update", "delete"))
+     + f"DELETE FROM {DIRECTORY_TABLE};\n" + directory_script()),
+]
+
+def setup_database(db_file):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+    conn = migrations.open_database(db_file, MIGRATIONS)
+    cursor = conn.cursor()
     return conn, cursor
 
 def insert_sample_data(cursor, conn):
@@ -67,25 +181,16 @@ def insert_sample_data(cursor, conn):
 
 def run_consolidation_query(cursor):
     """
-    Выполняет запрос для объединения всех таблиц, 
-    замены NULL и удаления дубликатов.
+    Выводит сводный справочник контактов всех отделов с заменой NULL.
+    Дубликаты (в том числе в разной записи имени и телефона) уже сведены
+    триггерами при вставке, поэтому чтение - просмотр покрывающего индекса.
     """
-    
-    # Используем CTE для объединения данных перед применением DISTINCT и COALESCE.
     cursor.execute(f"""
-    WITH AllContacts AS (
-        SELECT Contact_Alias, Mobile_Num FROM {TABLE_SALES}
-        UNION ALL
-        SELECT Contact_Alias, Mobile_Num FROM {TABLE_HR}
-        UNION ALL
-        SELECT Contact_Alias, Mobile_Num FROM {TABLE_OPS}
-    )
-    
-    SELECT 
-        DISTINCT Contact_Alias, 
+    SELECT
+        Contact_Alias,
         COALESCE(Mobile_Num, 'UNKNOWN') AS Mobile_Number
-    FROM AllContacts
-    ORDER BY Contact_Alias;
+    FROM {DIRECTORY_TABLE}
+    ORDER BY Contact_Alias, Mobile_Num;
     """)
 
     # Вывод результатов
@@ -94,9 +199,8 @@ def run_consolidation_query(cursor):
     print(f"{'Имя':<20} | {'Телефон':<15}")
     print("-" * 50)
     
-    for row in cursor.fetchall():
-        # Форматированный вывод
-        print(f"{row[0]:<20} | {row[1]:<15}")
+    # Форматированный вывод
+    output.print_rows(cursor, lambda row: f"{row[0]:<20} | {row[1]:<15}")
     print("-" * 50)
 
 
@@ -105,13 +209,16 @@ def consolidate_company_contacts():
     conn = None
     try:
         conn, cursor = setup_database(DB_PATH)
-        insert_sample_data(cursor, conn)
+        # Таблицы без первичного ключа - повторная вставка дала бы дубликаты
+        if migrations.is_empty(conn, TABLE_SALES):
+            insert_sample_data(cursor, conn)
+        connection.apply_profile(conn, "read-report")
         run_consolidation_query(cursor)
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     consolidate_company_contacts()
@@ -1,42 +1,44 @@
-import sqlite3
 import os
+import sys
 
-def run_database_operation():
-    """
-    Выполняет все операции с базой данных:
-    создание, заполнение и выполнение запроса INNER JOIN.
-    """
-    # 1. Определение имени файла базы данных
-    data_file = "company_records.db"
-
-    # 2. Удаление старого файла БД для чистого запуска
-    if os.path.exists(data_file):
-        os.remove(data_file)
-        
-    # 3. Установление соединения и получение курсора
-    db_connection = sqlite3.connect(data_file)
-    db_cursor = db_connection.cursor()
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, migrations, output
 
-    # 4. Создание таблиц
-    # Таблица для отделов/команд
-    db_cursor.execute("""
-    CREATE TABLE Teams (
+# Миграции схемы: таблица команд и таблица сотрудников
+MIGRATIONS = [
+    (1, "Таблицы Teams и Workers", """
+    CREATE TABLE IF NOT EXISTS Teams (
         TeamID INTEGER PRIMARY KEY,
         GroupName TEXT NOT NULL,
         TeamLeadID INTEGER
     );
-    """)
 
-    # Таблица для сотрудников
-    db_cursor.execute("""
-    CREATE TABLE Workers (
+    CREATE TABLE IF NOT EXISTS Workers (
         WorkerID INTEGER PRIMARY KEY,
         Name TEXT NOT NULL,
         Surname TEXT NOT NULL,
         TeamRefID INTEGER,
         FOREIGN KEY (TeamRefID) REFERENCES Teams(TeamID)
     );
-    """)
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+]
+
+def run_database_operation():
+    """
+    Выполняет все операции с базой данных:
+    создание, заполнение и выполнение запроса INNER JOIN.
+    """
+    # 1. Определение имени файла базы данных
+    data_file = "company_records.db"
+
+    # 2-4. Открытие существующей БД и доведение схемы до актуальной версии
+    db_connection = migrations.open_database(data_file, MIGRATIONS)
+    db_cursor = db_connection.cursor()
+
+    # Тестовые данные загружаются только в пустую БД
+    needs_seed = migrations.is_empty(db_connection, "Teams")
 
     # 5. Подготовка и вставка в таблицу Teams
     teams_data = [
@@ -44,7 +46,8 @@ def run_database_operation():
         (2, "Marketing", 502),
         (3, "Sales", 503)
     ]
-    db_cursor.executemany("INSERT INTO Teams VALUES (?, ?, ?);", teams_data)
+    if needs_seed:
+        db_cursor.executemany("INSERT INTO Teams VALUES (?, ?, ?);", teams_data)
 
     # 6. Подготовка и вставка в таблицу Workers
     workers_data = [
@@ -53,12 +56,14 @@ def run_database_operation():
         (3, "Джессика", "Мур", 5), # Не связан (TeamID 5 не существует)
         (4, "Тимур", "Сафиуллин", None) # Не связан (Нет TeamID)
     ]
-    db_cursor.executemany("INSERT INTO Workers VALUES (?, ?, ?, ?);", workers_data)
+    if needs_seed:
+        db_cursor.executemany("INSERT INTO Workers VALUES (?, ?, ?, ?);", workers_data)
     
     # Сохранение изменений
     db_connection.commit()
 
     # 7. Выполнение запроса INNER JOIN
+    connection.apply_profile(db_connection, "read-report")
     # Соединяем таблицу Workers и таблицу Teams по общему полю ID
     db_cursor.execute("""
     SELECT 
@@ -72,13 +77,11 @@ def run_database_operation():
     """)
 
     # 8. Извлечение и вывод результатов
-    results = db_cursor.fetchall()
     print("--- Результат запроса INNER JOIN ---")
-    for row in results:
-        print(row)
+    output.print_rows(db_cursor)
 
     # 9. Закрытие соединения
-    db_connection.close()
+    connection.release(db_connection)
 
 if __name__ == "__main__":
     run_database_operation()
\ No newline at end of file
@@ -0,0 +1 @@
+"""Общие модули для отчетов: подключение к SQLite и сопутствующая инфраструктура."""
@@ -0,0 +1,242 @@
+# Бенчмарк запросов всех отчетов на синтетических данных разного масштаба
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from db_common import connection, reports, synthetic
+
+DEFAULT_SCALES = [10**3, 10**4, 10**5]
+DEFAULT_REPEAT = 5
+# Замедление p50 во столько раз считается регрессией при сравнении прогонов
+DEFAULT_THRESHOLD = 1.2
+# Аргументы командной строки отчетов, которые без них не выполняют запросов
+# чтения: literary_archive ищет по каталогу только слова из аргументов
+REPORT_ARGS = {
+    "literary_archive": ("love",),
+}
+
+
+def first_keyword(sql):
+    """Первое ключевое слово запроса без учета ведущих комментариев."""
+    for line in sql.splitlines():
+        line = line.strip()
+        if line and not line.startswith("--"):
+            return line.split()[0].upper().rstrip(";")
+    return ""
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по ближайшему рангу (для малого числа повторов - без интерполяции)."""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class StatementRecorder:
+    """
+    Запоминает файл БД и SELECT-запросы, выполненные отчетом после перехода
+    соединения в профиль "read-report". Каждый запрос получает имя
+    "<функция отчета>#<номер>", стабильное между прогонами. Запросы модулей
+    виртуальных таблиц (FTS5 читает свои теневые таблицы) не записываются.
+    """
+
+    def __init__(self, script_path):
+        self.script_path = os.path.abspath(script_path)
+        self.db_file = None
+        self.statements = []
+        self._counters = {}
+        self._shadow_tables = ()
+
+    def hook(self, conn, profile):
+        if self.db_file is None:
+            self.db_file = conn.execute("PRAGMA database_list;").fetchone()[2]
+        if profile == "read-report":
+            self._shadow_tables = tuple(
+                row[1] for row in conn.execute("PRAGMA table_list;") if row[2] == "shadow")
+            conn.set_trace_callback(self._trace)
+
+    def _caller_name(self):
+        frame = sys._getframe(2)
+        while frame is not None:
+            if os.path.abspath(frame.f_code.co_filename) == self.script_path:
+                return frame.f_code.co_name
+            frame = frame.f_back
+        return "<unknown>"
+
+    def _trace(self, sql):
+        if first_keyword(sql) not in ("SELECT", "WITH", "VALUES"):
+            return
+        sql = sql.strip()
+        if any(f"'{table}'" in sql for table in self._shadow_tables):
+            return
+        function = self._caller_name()
+        if any(recorded == sql for _, recorded in self.statements):
+            return
+        self._counters[function] = self._counters.get(function, 0) + 1
+        self.statements.append((f"{function}#{self._counters[function]}", sql))
+
+
+def run_report(report, workdir, recorder, quiet=True, args=()):
+    """Запускает точку входа отчета в workdir с args (при quiet - с подавленным выводом)."""
+    connection.add_profile_hook(recorder.hook)
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            reports.run_entry_point(report, workdir, args)
+    finally:
+        connection.remove_profile_hook(recorder.hook)
+    return recorder
+
+
+def time_statement(conn, sql, repeat):
+    """Выполняет запрос repeat раз, полностью выбирая результат; возвращает (времена, строк)."""
+    durations = []
+    result_rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result_rows = sum(1 for _ in conn.execute(sql))
+        durations.append(time.perf_counter() - started)
+    return sorted(durations), result_rows
+
+
+def run_worker(key, rows, repeat, workdir):
+    """
+    Замер одного отчета на одном масштабе. Выполняется в отдельном процессе,
+    чтобы пиковый RSS относился только к этому отчету.
+    """
+    report = reports.find(key)
+    recorder = run_report(report, workdir, StatementRecorder(report.path), args=REPORT_ARGS.get(key, ()))
+
+    conn = connection.connect(recorder.db_file, "read-report")
+    results = []
+    try:
+        for name, sql in recorder.statements:
+            durations, result_rows = time_statement(conn, sql, repeat)
+            p50 = percentile(durations, 0.50)
+            results.append({
+                "report": key,
+                "scale": rows,
+                "query": name,
+                "sql": sql,
+                "p50_ms": round(p50 * 1000, 3),
+                "p95_ms": round(percentile(durations, 0.95) * 1000, 3),
+                "result_rows": result_rows,
+                # Строк результата в секунду; rows - размер синтетических данных, не выборки
+                "result_rows_per_sec": round(result_rows / p50) if p50 else None,
+            })
+    finally:
+        connection.release(conn)
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for result in results:
+        result["peak_rss_kb"] = peak_rss_kb
+    return results
+
+
+def benchmark_report(key, scales, repeat, seed, workdir):
+    """Готовит БД отчета на каждом масштабе и замеряет его запросы в подпроцессе."""
+    report = reports.find(key)
+    os.makedirs(workdir, exist_ok=True)
+    # Пробный запуск на встроенных данных: узнаем, какой файл БД открывает отчет
+    db_file = run_report(report, workdir, StatementRecorder(report.path), args=REPORT_ARGS.get(key, ())).db_file
+    if db_file is None:
+        return []
+
+    results = []
+    for rows in scales:
+        synthetic.generate(key, db_file, rows, seed=seed)
+        with tempfile.NamedTemporaryFile("r", suffix=".json") as output:
+            subprocess.run(
+                [sys.executable, "-m", "db_common.bench", "--worker", key, str(rows),
+                 "--repeat", str(repeat), "--workdir", workdir, "--output", output.name],
+                cwd=reports.REPO_ROOT, check=True,
+            )
+            scale_results = json.load(output)
+        for result in scale_results:
+            print(f"{key:<30} {rows:>10} {result['query']:<36} "
+                  f"p50={result['p50_ms']:>10.3f} мс  p95={result['p95_ms']:>10.3f} мс")
+        results.extend(scale_results)
+    return results
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Возвращает список регрессий: запросы, чей p50 вырос больше чем в threshold раз."""
+    def key(result):
+        return result["report"], result["scale"], result["query"]
+
+    old = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = old.get(key(result))
+        if before and before["p50_ms"] > 0 and result["p50_ms"] / before["p50_ms"] > threshold:
+            regressions.append((key(result), before["p50_ms"], result["p50_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк запросов отчетов на разных масштабах")
+    parser.add_argument("--reports", nargs="*", help="Ключи отчетов (по умолчанию все)")
+    parser.add_argument("--scales", default=",".join(str(s) for s in DEFAULT_SCALES),
+                        help="Размеры основной таблицы через запятую, например 1e3,1e4,1e7")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=synthetic.DEFAULT_SEED)
+    parser.add_argument("--output", default="bench_results.json", help="Файл с результатами JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="Сравнить с прошлым файлом результатов")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--workdir", help="Каталог для БД (по умолчанию временный)")
+    parser.add_argument("--worker", nargs=2, metavar=("REPORT", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        key, rows = args.worker
+        results = run_worker(key, int(rows), args.repeat, args.workdir)
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, ensure_ascii=False)
+        return 0
+
+    scales = [int(float(scale)) for scale in args.scales.split(",")]
+    keys = args.reports or [report.key for report in reports.discover()]
+
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory())
+        results = []
+        for key in keys:
+            results.extend(benchmark_report(key, scales, args.repeat, args.seed,
+                                            os.path.join(workdir, key)))
+
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "scales": scales,
+        },
+        "results": sorted(results, key=lambda r: (r["report"], r["scale"], r["query"])),
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(document, output, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Результаты записаны в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as source:
+            regressions = compare(json.load(source), document, args.threshold)
+        for (key, rows, query), before, after in regressions:
+            print(f"РЕГРЕССИЯ {key} [{rows}] {query}: {before:.3f} мс -> {after:.3f} мс")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+# Кэш результатов запросов отчетов с проверкой актуальности по PRAGMA data_version
+import re
+import sqlite3
+import sys
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Бюджет памяти кэша по умолчанию (оценка размера строк результата)
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+# Таблица счетчиков изменений, которые отмечает пишущий код (см. record_changes)
+COUNTER_TABLE = "table_changes"
+
+# Таблица, в которую пишет оператор в теле триггера
+_WRITE_TARGET = re.compile(
+    r"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)"
+    r"\s+(?!SET\b)(?:main\.)?[\"`\[]?(\w+)", re.IGNORECASE)
+_TRIGGER_BODY = re.compile(r"\bBEGIN\b", re.IGNORECASE)
+
+
+def change_counter_script(tables):
+    """
+    SQL-скрипт для шага миграции: таблица счетчиков изменений со строками для
+    tables. По счетчикам кэш понимает, что запись в БД не затронула таблицы
+    конкретного запроса. Счетчики увеличивает пишущий код через record_changes
+    один раз на транзакцию, поэтому в tables - только таблицы, все записи в
+    которые идут через него (ingest.bulk_insert делает это сам). Производные
+    таблицы, которые ведут триггеры, не указываются: запросы к ним
+    перепроверяются только по PRAGMA data_version.
+    """
+    values = ", ".join(f"('{table}', 0)" for table in tables)
+    return f"""
+    CREATE TABLE IF NOT EXISTS {COUNTER_TABLE} (
+        name TEXT PRIMARY KEY,
+        changes INTEGER NOT NULL
+    );
+
+    INSERT OR IGNORE INTO {COUNTER_TABLE} (name, changes) VALUES {values};
+    """
+
+
+def untrack_tables_script(tables):
+    """
+    SQL-скрипт для шага миграции: удаляет построчные триггеры счетчиков
+    прежней версии и строки счетчиков tables.
+    """
+    parts = []
+    for table in tables:
+        for operation in ("insert", "update", "delete"):
+            parts.append(f"DROP TRIGGER IF EXISTS trg_{table}_changes_{operation};\n")
+        parts.append(f"DELETE FROM {COUNTER_TABLE} WHERE name = '{table}';\n")
+    return "".join(parts)
+
+
+def _has_counter_table(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (COUNTER_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def written_tables(conn, tables):
+    """tables и все таблицы, в которые (в том числе по цепочке) пишут их триггеры."""
+    triggers = conn.execute("SELECT tbl_name, sql FROM sqlite_master WHERE type = 'trigger';").fetchall()
+    result, pending = set(), list(tables)
+    while pending:
+        table = pending.pop()
+        if table in result:
+            continue
+        result.add(table)
+        for trigger_table, sql in triggers:
+            body = _TRIGGER_BODY.search(sql or "")
+            if trigger_table == table and body:
+                pending.extend(match.group(1) for match in _WRITE_TARGET.finditer(sql, body.end()))
+    return result
+
+
+def record_changes(conn, tables):
+    """
+    Отмечает для кэша результатов, что транзакция изменила tables (и таблицы,
+    в которые пишут их триггеры). Вызывается пишущим кодом внутри той же
+    транзакции - один UPDATE на транзакцию вместо триггера на каждую строку;
+    фиксировать транзакцию нужно через commit(). Без таблицы счетчиков ничего
+    не делает.
+    """
+    if not _has_counter_table(conn):
+        return
+    names = sorted(written_tables(conn, tables))
+    conn.execute(f"UPDATE {COUNTER_TABLE} SET changes = changes + 1 WHERE name IN ({', '.join('?' * len(names))});",
+                 names)
+
+
+# Кэши процесса: commit() сообщает им об отмеченных фиксациях
+_caches = weakref.WeakSet()
+
+
+def commit(conn):
+    """
+    Фиксирует транзакцию, отмеченную record_changes, и сообщает об этом кэшам
+    процесса. Кэш доверяет счетчикам, только если каждая фиксация в БД с
+    момента сохранения результата прошла через commit(): до COMMIT (запись
+    еще заблокирована) кэш проверяет, что версия БД не менялась после
+    предыдущей такой фиксации, а после - запоминает новую версию.
+    PRAGMA data_version самого соединения меняется только от чужих фиксаций:
+    если она сдвинулась сразу после COMMIT, новую версию кэш не запоминает.
+    """
+    db_file = conn.execute("PRAGMA database_list;").fetchone()[2]
+    own_version = conn.execute("PRAGMA main.data_version;").fetchone()[0]
+    caches = list(_caches)
+    for result_cache in caches:
+        result_cache._before_commit(db_file)
+    conn.commit()
+    alone = conn.execute("PRAGMA main.data_version;").fetchone()[0] == own_version
+    for result_cache in caches:
+        result_cache._after_commit(db_file, alone)
+
+
+def normalize_sql(sql):
+    """Текст запроса без различий в пробелах и завершающей точке с запятой."""
+    return " ".join(sql.split()).rstrip(";").rstrip()
+
+
+def estimate_size(rows):
+    """Грубая оценка памяти под строки результата в байтах."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class CachedResult:
+    """Готовый результат с интерфейсом чтения курсора (fetchone/fetchmany/fetchall)."""
+
+    def __init__(self, rows, description=None):
+        self._rows = rows
+        self._position = 0
+        self.description = description
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows) - self._position)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+
+@dataclass
+class _Entry:
+    rows: list
+    description: tuple
+    size: int
+    versions: tuple
+    tables: tuple
+    counters: tuple
+
+
+class ResultCache:
+    """
+    LRU-кэш результатов SELECT с ключом (файл БД, подключенные базы,
+    нормализованный SQL, параметры).
+
+    Для проверки актуальности у кэша есть собственное соединение-наблюдатель
+    с каждым файлом, к которому подключены (ATTACH) те же базы, что и к
+    соединению отчета. PRAGMA data_version наблюдателя меняется после любой
+    фиксации в другом соединении, в том числе в соединении отчета. Если
+    сдвинулась версия подключенной базы, запись устаревает. Если сдвинулась
+    версия основной БД, запись остается действительной, только когда все
+    фиксации после ее сохранения прошли через commit() (непрерывная цепочка
+    версий, см. _chains) и не изменились счетчики (record_changes) тех таблиц
+    основной БД, которые читает запрос. Любая другая фиксация, запрос к
+    таблице без счетчика или к подключенной базе перепроверяются по
+    data_version. Служебные запросы идут через наблюдателя, поэтому не
+    попадают в трассировку соединения отчета.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.hits = self.misses = self.invalidations = self.evictions = self.bypasses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._observers = {}
+        # Файл БД -> [первая, последняя] версия main наблюдателя в цепочке, где
+        # каждая фиксация прошла через commit(); версии растут монотонно
+        self._chains = {}
+        _caches.add(self)
+
+    # --- Соединения-наблюдатели ---
+
+    def _observer(self, db_file):
+        conn = self._observers.get(db_file)
+        if conn is None:
+            # Без кэша подготовленных операторов: авторизатор должен видеть каждый разбор
+            conn = self._observers[db_file] = sqlite3.connect(db_file, cached_statements=0)
+        return conn
+
+    def _sync_attached(self, db_file, attached):
+        """Подключает к наблюдателю базы attached ((схема, файл), ...) и отключает лишние."""
+        observer = self._observer(db_file)
+        current = {name: path for _, name, path in observer.execute("PRAGMA database_list;").fetchall()
+                   if name not in ("main", "temp")}
+        for name, path in current.items():
+            if (name, path) not in attached:
+                observer.execute(f"DETACH DATABASE {name};")
+        for name, path in attached:
+            if current.get(name) != path:
+                observer.execute(f"ATTACH DATABASE ? AS {name};", (path,))
+
+    def _before_commit(self, db_file):
+        """Перед отмеченной фиксацией: продолжает цепочку версий или начинает новую."""
+        observer = self._observers.get(db_file)
+        if observer is None:
+            return
+        # Пишущее соединение держит блокировку: не ждать ее, а разорвать цепочку
+        observer.execute("PRAGMA busy_timeout = 0;")
+        try:
+            version = observer.execute("PRAGMA main.data_version;").fetchone()[0]
+        except sqlite3.OperationalError:
+            self._chains.pop(db_file, None)
+            return
+        finally:
+            observer.execute("PRAGMA busy_timeout = 5000;")
+        chain = self._chains.get(db_file)
+        if chain is None or chain[1] != version:
+            self._chains[db_file] = [version, version]
+
+    def _after_commit(self, db_file, alone):
+        """После отмеченной фиксации: новая версия продолжает цепочку, если чужих фиксаций не было."""
+        observer, chain = self._observers.get(db_file), self._chains.get(db_file)
+        if observer is None or chain is None:
+            return
+        version = observer.execute("PRAGMA main.data_version;").fetchone()[0]
+        if alone:
+            chain[1] = version
+        else:
+            del self._chains[db_file]
+
+    def _versions(self, db_file, attached):
+        observer = self._observer(db_file)
+        return tuple((name, observer.execute(f"PRAGMA {name}.data_version;").fetchone()[0])
+                     for name in ("main", *(name for name, _ in attached)))
+
+    def _counters(self, db_file, tables):
+        """Счетчики tables или None, если у какой-то таблицы счетчика нет."""
+        observer = self._observer(db_file)
+        if not _has_counter_table(observer):
+            return None
+        counters = dict(observer.execute(f"SELECT name, changes FROM {COUNTER_TABLE};").fetchall())
+        if any(table not in counters for table in tables):
+            return None
+        return tuple(counters[table] for table in tables)
+
+    def _read_tables(self, db_file, sql, params):
+        """
+        Таблицы основной БД, которые читает запрос, по данным авторизатора при
+        разборе, или None, если наблюдатель не может разобрать запрос (например,
+        он читает временные таблицы соединения отчета).
+        """
+        tables = set()
+
+        def authorizer(action, table, column, database, source):
+            if action == sqlite3.SQLITE_READ and table and database == "main":
+                tables.add(table)
+            return sqlite3.SQLITE_OK
+
+        observer = self._observer(db_file)
+        observer.set_authorizer(authorizer)
+        try:
+            observer.execute("EXPLAIN " + sql, params).fetchall()
+        except sqlite3.Error:
+            return None
+        finally:
+            observer.set_authorizer(None)
+        return tuple(sorted(tables))
+
+    # --- Выполнение запросов ---
+
+    def execute(self, cursor, sql, params=()):
+        """
+        Выполняет SELECT через курсор отчета или возвращает сохраненный результат.
+        Возвращает объект с fetchone/fetchmany/fetchall: CachedResult или сам курсор,
+        если кэш неприменим (БД или подключенная база в памяти, запрос к временным
+        таблицам или открытая транзакция с незафиксированными изменениями, которых
+        наблюдатель не видит).
+        """
+        conn = cursor.connection
+        databases = conn.execute("PRAGMA database_list;").fetchall()
+        db_file = databases[0][2]
+        attached = tuple((name, path) for _, name, path in databases if name not in ("main", "temp"))
+        if not db_file or conn.in_transaction or any(not path for _, path in attached):
+            self.bypasses += 1
+            return cursor.execute(sql, params)
+
+        self._sync_attached(db_file, attached)
+        key = (db_file, attached, normalize_sql(sql), tuple(params))
+        versions = self._versions(db_file, attached)
+        entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(db_file, entry, versions):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return CachedResult(entry.rows, entry.description)
+
+        if entry is not None:
+            self.invalidations += 1
+            self._remove(key)
+
+        # Версии и счетчики снимаем до выполнения: запись, зафиксированная
+        # между ними и запросом, лишь приведет к лишней перепроверке
+        tables = self._read_tables(db_file, sql, params)
+        if tables is None:
+            self.bypasses += 1
+            return cursor.execute(sql, params)
+        self.misses += 1
+        counters = self._counters(db_file, tables)
+        rows = cursor.execute(sql, params).fetchall()
+        self._store(key, _Entry(rows, cursor.description, estimate_size(rows), versions, tables, counters))
+        return CachedResult(rows, cursor.description)
+
+    def _is_fresh(self, db_file, entry, versions):
+        if entry.versions == versions:
+            return True
+        # Подключенные базы (архив) счетчиков не ведут
+        if entry.versions[1:] != versions[1:] or entry.counters is None:
+            return False
+        # Все фиксации между сохранением записи и текущей версией - отмеченные
+        chain = self._chains.get(db_file)
+        if chain is None or versions[0][1] != chain[1] or entry.versions[0][1] < chain[0]:
+            return False
+        if self._counters(db_file, entry.tables) != entry.counters:
+            return False
+        entry.versions = versions
+        return True
+
+    def _store(self, key, entry):
+        if entry.size > self.memory_budget:
+            return
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.memory_budget:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def close(self):
+        """Очищает кэш и закрывает соединения-наблюдатели."""
+        self.clear()
+        for conn in self._observers.values():
+            conn.close()
+        self._observers.clear()
+        self._chains.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "bypasses": self.bypasses,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "memory_budget": self.memory_budget,
+        }
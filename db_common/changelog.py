@@ -0,0 +1,267 @@
+# Журнал изменений таблиц (CDC): триггеры записывают вставки, изменения и удаления,
+# а разница с контрольной точкой собирается по журналу, без повторного сканирования таблиц
+from dataclasses import dataclass
+
+# Контрольные точки: до какого номера записи журнала изменения уже учтены
+CHECKPOINT_TABLE = "change_checkpoints"
+# Контрольная точка по умолчанию
+DEFAULT_CHECKPOINT = "default"
+
+_CHECKPOINT_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+    name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (name, table_name)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class Changes:
+    """
+    Итоговая разница таблицы между контрольной точкой и текущим состоянием.
+    Строки - кортежи (ключ, столбцы...): added - текущие, removed - на момент
+    точки, changed - пары (было, стало). Промежуточные состояния не видны:
+    вставленная и затем удаленная строка не попадет никуда.
+    """
+    added: list
+    removed: list
+    changed: list
+    since: int
+    until: int
+
+
+@dataclass(frozen=True)
+class Capture:
+    """
+    Журнал изменений таблицы table с первичным ключом key и столбцами columns.
+    Журнал <table>_log хранит по записи на изменение строки: ключ и образ строки
+    до изменения (existed = 0, если строки с этим ключом до изменения не было).
+    Текущее состояние берется из самой таблицы поиском по ключу, поэтому для
+    итоговой разницы достаточно первой записи журнала по каждому ключу после точки.
+    """
+    table: str
+    key: str
+    columns: tuple
+
+    @property
+    def log_table(self):
+        return f"{self.table}_log"
+
+    def script(self):
+        """SQL-скрипт для шага миграции: таблица журнала, таблица контрольных точек и триггеры."""
+        names = ", ".join(self.columns)
+        old = ", ".join(f"old.{column}" for column in self.columns)
+        nulls = ", ".join("NULL" for _ in self.columns)
+        changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in (self.key, *self.columns))
+        image = f"{self.key}, operation, existed, {names}"
+        current = ", ".join(f"T.{column}" for column in self.columns)
+        return _CHECKPOINT_SQL + f"""
+    -- AUTOINCREMENT: номера записей не переиспользуются и после очистки журнала
+    CREATE TABLE IF NOT EXISTS {self.log_table} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        {self.key},
+        operation TEXT NOT NULL,
+        existed INTEGER NOT NULL,
+        {", ".join(self.columns)}
+    );
+
+    -- INSERT OR REPLACE и INSERT OR IGNORE не вызывают триггер удаления:
+    -- прежний образ строки с тем же ключом записывается до вставки
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_log_replace BEFORE INSERT ON {self.table}
+    WHEN EXISTS (SELECT 1 FROM {self.table} WHERE {self.key} = new.{self.key})
+    BEGIN
+        INSERT INTO {self.log_table} ({image})
+        SELECT {self.key}, 'insert', 1, {current} FROM {self.table} T WHERE {self.key} = new.{self.key};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_log_insert AFTER INSERT ON {self.table}
+    BEGIN
+        INSERT INTO {self.log_table} ({image}) VALUES (new.{self.key}, 'insert', 0, {nulls});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_log_update AFTER UPDATE ON {self.table}
+    WHEN {changed}
+    BEGIN
+        INSERT INTO {self.log_table} ({image}) VALUES (old.{self.key}, 'update', 1, {old});
+        INSERT INTO {self.log_table} ({image})
+        SELECT new.{self.key}, 'update', 0, {nulls} WHERE new.{self.key} IS NOT old.{self.key};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_log_delete AFTER DELETE ON {self.table}
+    BEGIN
+        INSERT INTO {self.log_table} ({image}) VALUES (old.{self.key}, 'delete', 1, {old});
+    END;
+    """
+
+    def last_seq(self, conn):
+        """Номер последней записи журнала (0, если изменений еще не было)."""
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?;", (self.log_table,)).fetchone()
+        return row[0] if row else 0
+
+    def checkpoint_seq(self, conn, name=DEFAULT_CHECKPOINT):
+        """Номер записи контрольной точки name (0 - с начала журнала)."""
+        row = conn.execute(
+            f"SELECT seq FROM {CHECKPOINT_TABLE} WHERE name = ? AND table_name = ?;", (name, self.table)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def checkpoint(self, conn, name=DEFAULT_CHECKPOINT, seq=None):
+        """
+        Передвигает контрольную точку name на номер seq (по умолчанию - на
+        последнюю запись журнала). Вызывается в транзакции вызывающего кода.
+        """
+        if seq is None:
+            seq = self.last_seq(conn)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (name, table_name, seq) VALUES (?, ?, ?);",
+            (name, self.table, seq))
+        return seq
+
+    def changes_since(self, conn, name=DEFAULT_CHECKPOINT):
+        """
+        Добавленные, удаленные и измененные строки с контрольной точки name.
+        Читаются только записи журнала после точки и строки таблицы с этими
+        ключами. Точка не сдвигается: для этого - checkpoint(conn, name, changes.until).
+        """
+        since, until = self.checkpoint_seq(conn, name), self.last_seq(conn)
+        columns = ", ".join(f"L.{column}" for column in self.columns)
+        current = ", ".join(f"T.{column}" for column in self.columns)
+        rows = conn.execute(f"""
+        WITH First AS (
+            SELECT MIN(seq) AS seq FROM {self.log_table}
+            WHERE seq > ? AND seq <= ?
+            GROUP BY {self.key}
+        )
+        SELECT L.{self.key}, L.existed, {columns}, T.{self.key} IS NOT NULL, {current}
+        FROM First F
+        JOIN {self.log_table} L ON L.seq = F.seq
+        LEFT JOIN {self.table} T ON T.{self.key} = L.{self.key}
+        ORDER BY L.{self.key};
+        """, (since, until)).fetchall()
+
+        width = len(self.columns)
+        changes = Changes([], [], [], since, until)
+        for row in rows:
+            key, existed, exists = row[0], row[1], row[2 + width]
+            before, after = (key, *row[2:2 + width]), (key, *row[3 + width:])
+            if exists and not existed:
+                changes.added.append(after)
+            elif existed and not exists:
+                changes.removed.append(before)
+            elif existed and before != after:
+                changes.changed.append((before, after))
+        return changes
+
+    def prune(self, conn):
+        """
+        Удаляет записи журнала, которые учтены всеми контрольными точками таблицы.
+        Без контрольных точек журнал не очищается. Вызывается после сдвига
+        точки в той же транзакции; потребитель, который заведет точку позже,
+        увидит журнал только с момента последней очистки.
+        """
+        row = conn.execute(
+            f"SELECT MIN(seq) FROM {CHECKPOINT_TABLE} WHERE table_name = ?;", (self.table,)).fetchone()
+        if row[0] is None:
+            return 0
+        return conn.execute(f"DELETE FROM {self.log_table} WHERE seq <= ?;", (row[0],)).rowcount
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """
+    Сравнение двух таблиц с одинаковыми ключом и столбцами (left и right),
+    которое поддерживается по журналам изменений. Таблица name хранит только
+    различающиеся ключи со статусом: 'left' - ключ только в left, 'right' -
+    только в right, 'changed' - ключ в обеих, но столбцы различаются.
+    refresh() пересчитывает лишь ключи, изменившиеся с прошлого обновления.
+    """
+    name: str
+    left: Capture
+    right: Capture
+
+    def _status_sql(self, keys):
+        """Подзапрос (ключ, статус) для ключей из подзапроса keys; одинаковые строки - без статуса."""
+        key = self.left.key
+        differs = " OR ".join(f"L.{column} IS NOT R.{column}" for column in self.left.columns)
+        return f"""
+        SELECT K.{key} AS {key},
+               CASE WHEN L.{key} IS NULL THEN 'right'
+                    WHEN R.{key} IS NULL THEN 'left'
+                    WHEN {differs} THEN 'changed'
+               END AS status
+        FROM ({keys}) K
+        LEFT JOIN {self.left.table} L ON L.{key} = K.{key}
+        LEFT JOIN {self.right.table} R ON R.{key} = K.{key}
+        WHERE L.{key} IS NOT NULL OR R.{key} IS NOT NULL"""
+
+    def script(self):
+        """
+        SQL-скрипт для шага миграции (после script() обоих журналов): таблица
+        сравнения с начальным полным сравнением и контрольные точки журналов.
+        """
+        key = self.left.key
+        keys = (f"SELECT {key} FROM {self.left.table} UNION "
+                f"SELECT {key} FROM {self.right.table}")
+        return f"""
+    CREATE TABLE IF NOT EXISTS {self.name} (
+        {key} PRIMARY KEY,
+        status TEXT NOT NULL
+    ) WITHOUT ROWID;
+
+    INSERT OR REPLACE INTO {self.name} ({key}, status)
+    SELECT {key}, status FROM ({self._status_sql(keys)}) WHERE status IS NOT NULL;
+
+    INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (name, table_name, seq) VALUES
+        ('{self.name}', '{self.left.table}', COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{self.left.log_table}'), 0)),
+        ('{self.name}', '{self.right.table}', COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{self.right.log_table}'), 0));
+    """
+
+    def refresh(self, conn):
+        """
+        Пересчитывает статусы ключей, затронутых изменениями обеих таблиц
+        после контрольной точки name, сдвигает ее и очищает учтенную всеми
+        точками часть журналов. Возвращает число ключей.
+        """
+        key = self.left.key
+        conn.execute("BEGIN;")
+        try:
+            bounds = []
+            for capture in (self.left, self.right):
+                bounds += [capture.checkpoint_seq(conn, self.name), capture.last_seq(conn)]
+            touched = (f"SELECT {key} FROM {self.left.log_table} WHERE seq > ? AND seq <= ? UNION "
+                       f"SELECT {key} FROM {self.right.log_table} WHERE seq > ? AND seq <= ?")
+            conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {self.name}Touched ({key} PRIMARY KEY) WITHOUT ROWID;")
+            conn.execute(f"DELETE FROM temp.{self.name}Touched;")
+            count = conn.execute(f"INSERT INTO temp.{self.name}Touched {touched};", bounds).rowcount
+            conn.execute(f"DELETE FROM {self.name} WHERE {key} IN (SELECT {key} FROM temp.{self.name}Touched);")
+            conn.execute(f"""
+            INSERT INTO {self.name} ({key}, status)
+            SELECT {key}, status FROM ({self._status_sql(f"SELECT {key} FROM temp.{self.name}Touched")})
+            WHERE status IS NOT NULL;
+            """)
+            self.left.checkpoint(conn, self.name, bounds[1])
+            self.right.checkpoint(conn, self.name, bounds[3])
+            self.left.prune(conn)
+            self.right.prune(conn)
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return count
+
+    def except_sql(self, side):
+        """
+        Запрос, равносильный "side EXCEPT другая таблица" ("left" или "right"):
+        строки side, которых нет в другой таблице целиком, по возрастанию ключа.
+        """
+        capture = self.left if side == "left" else self.right
+        columns = ", ".join(f"T.{column}" for column in (capture.key, *capture.columns))
+        return f"""
+        SELECT {columns}
+        FROM {self.name} C
+        JOIN {capture.table} T ON T.{capture.key} = C.{capture.key}
+        WHERE C.status IN ('{side}', 'changed')
+        ORDER BY C.{capture.key};
+        """
@@ -0,0 +1,164 @@
+# Общий слой подключения к SQLite для всех отчетов
+import os
+import sqlite3
+import atexit
+
+# --- Профили PRAGMA ---
+# Каждый профиль задает все PRAGMA соединения, которые меняет хотя бы один
+# профиль, чтобы переключение между профилями на одном соединении не оставляло
+# "хвостов" от предыдущего. journal_mode - свойство файла, а не соединения: его
+# задают только пишущие профили и только для main (без схемы PRAGMA затронул бы
+# и подключенные только для чтения базы). query_only - последним.
+PROFILES = {
+    # Поведение sqlite3.connect() по умолчанию
+    "default": {
+        "main.journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,        # ~2 МБ, значение SQLite по умолчанию
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+        "query_only": "OFF",
+    },
+    # Загрузка данных: без fsync, большой кэш, временные структуры в памяти
+    "bulk-load": {
+        "main.journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -262144,      # ~256 МБ (отрицательное значение - в КиБ)
+        "temp_store": "MEMORY",
+        "mmap_size": 0,
+        "query_only": "OFF",
+    },
+    # Выполнение отчетов: только чтение, страницы через mmap; режим журнала
+    # файла не меняется, synchronous - как по умолчанию
+    "read-report": {
+        "synchronous": "FULL",
+        "cache_size": -65536,       # ~64 МБ
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456,     # 256 МБ
+        "query_only": "ON",
+    },
+}
+
+# Файлы, которые SQLite создает рядом с основным файлом БД
+SIDECAR_SUFFIXES = ("-wal", "-shm", "-journal")
+
+# Функции hook(conn, profile), вызываемые после каждого применения профиля
+_profile_hooks = []
+
+
+def add_profile_hook(hook):
+    """Регистрирует наблюдателя за сменой профиля (для замеров и инструментирования)."""
+    _profile_hooks.append(hook)
+
+
+def remove_profile_hook(hook):
+    _profile_hooks.remove(hook)
+
+
+def apply_profile(conn, profile):
+    """Применяет именованный профиль PRAGMA к открытому соединению."""
+    try:
+        pragmas = PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Неизвестный профиль подключения: {profile!r}") from None
+
+    # Запрет записи от прежнего профиля снимается до смены journal_mode
+    conn.execute("PRAGMA query_only = OFF;")
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value};")
+    for hook in list(_profile_hooks):
+        hook(conn, profile)
+    return conn
+
+
+def remove_database(db_file):
+    """Удаляет файл БД вместе с журналами WAL/SHM, оставшимися от прошлых запусков."""
+    for path in (db_file,) + tuple(db_file + suffix for suffix in SIDECAR_SUFFIXES):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# --- Пул соединений ---
+
+class ConnectionPool:
+    """
+    Хранит открытые соединения между запусками отчетов в одном процессе,
+    чтобы не терять прогретый кэш страниц и не переоткрывать файл заново.
+    """
+
+    def __init__(self):
+        self._connections = {}
+
+    def acquire(self, db_file, profile="default", detect_types=0):
+        """Возвращает соединение из пула (или открывает новое) с нужным профилем."""
+        # detect_types задается только при открытии, поэтому входит в ключ
+        key = (os.path.abspath(db_file), detect_types)
+        conn = self._connections.get(key)
+
+        # Файл могли удалить между запусками - такое соединение уже бесполезно
+        if conn is not None and not os.path.exists(key[0]):
+            self._discard(key)
+            conn = None
+
+        if conn is None:
+            conn = sqlite3.connect(db_file, detect_types=detect_types)
+            self._connections[key] = conn
+
+        return apply_profile(conn, profile)
+
+    def release(self, conn):
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию."""
+        if conn.in_transaction:
+            conn.rollback()
+
+    def owns(self, conn):
+        return any(pooled is conn for pooled in self._connections.values())
+
+    def _discard(self, key):
+        conn = self._connections.pop(key)
+        conn.close()
+
+    def close_all(self):
+        """Закрывает все соединения пула."""
+        for key in list(self._connections):
+            self._discard(key)
+
+
+_pool = None
+
+
+def enable_pooling():
+    """Включает переиспользование соединений в текущем процессе."""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool()
+        atexit.register(_pool.close_all)
+    return _pool
+
+
+def disable_pooling():
+    """Закрывает все соединения пула и возвращается к обычному режиму."""
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+        atexit.unregister(_pool.close_all)
+        _pool = None
+
+
+def connect(db_file, profile="default", detect_types=0):
+    """
+    Открывает соединение с БД и применяет профиль PRAGMA.
+    detect_types передается в sqlite3.connect (например, для конвертеров money).
+    При включенном пуле соединение берется из пула.
+    """
+    if _pool is not None and db_file != ":memory:":
+        return _pool.acquire(db_file, profile, detect_types)
+    return apply_profile(sqlite3.connect(db_file, detect_types=detect_types), profile)
+
+
+def release(conn):
+    """Закрывает соединение или возвращает его в пул, если оно оттуда."""
+    if _pool is not None and _pool.owns(conn):
+        _pool.release(conn)
+    else:
+        conn.close()
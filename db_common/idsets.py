@@ -0,0 +1,241 @@
+# Множества id платформ как битовые карты: пересечения, объединения и диаграммы
+# Венна для любого числа платформ в памяти, с хранимым кэшем и обновлением по журналу изменений
+import json
+import struct
+from dataclasses import dataclass
+
+from db_common import changelog
+
+# Хранимые битовые карты платформ
+BITMAPS_TABLE = "id_bitmaps"
+# Блок битовой карты покрывает 2^CHUNK_BITS подряд идущих id (512 байт)
+CHUNK_BITS = 12
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Заголовок блока в хранимом виде: номер блока (int64) и длина битов в байтах
+_CHUNK_HEADER = struct.Struct("<qH")
+# Номера установленных битов для каждого значения байта
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def _check_id(id_):
+    if type(id_) is not int and (isinstance(id_, bool) or not isinstance(id_, int)):
+        raise ValueError(f"id должен быть целым числом, получено {id_!r}")
+
+
+class IdSet:
+    """
+    Неизменяемое множество целых id из блоков битовых карт: id делится на
+    номер блока (id >> CHUNK_BITS) и бит внутри блока, непустые блоки -
+    целые Python в словаре chunks. Пересечение, объединение и мощность -
+    операции над целыми по общим блокам, на C без цикла по id. Память
+    зависит от числа непустых блоков, а не от максимального id, поэтому
+    разреженные и отрицательные id (любые INTEGER SQLite) тоже подходят.
+    """
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks=None):
+        object.__setattr__(self, "chunks", chunks or {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("IdSet неизменяем")
+
+    @classmethod
+    def from_ids(cls, ids):
+        # id из таблицы обычно идут по возрастанию ключа: блок меняется редко
+        buffers, current, buffer = {}, None, None
+        for id_ in ids:
+            _check_id(id_)
+            if id_ >> CHUNK_BITS != current:
+                current = id_ >> CHUNK_BITS
+                buffer = buffers.get(current)
+                if buffer is None:
+                    buffer = buffers[current] = bytearray(1 << CHUNK_BITS - 3)
+            offset = id_ & _CHUNK_MASK
+            buffer[offset >> 3] |= 1 << (offset & 7)
+        return cls({chunk: int.from_bytes(buffer, "little") for chunk, buffer in buffers.items()})
+
+    @classmethod
+    def from_bytes(cls, data):
+        chunks, position = {}, 0
+        while position < len(data):
+            chunk, size = _CHUNK_HEADER.unpack_from(data, position)
+            position += _CHUNK_HEADER.size
+            chunks[chunk] = int.from_bytes(data[position:position + size], "little")
+            position += size
+        return cls(chunks)
+
+    def to_bytes(self):
+        parts = []
+        for chunk in sorted(self.chunks):
+            bits = self.chunks[chunk]
+            raw = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+            parts += [_CHUNK_HEADER.pack(chunk, len(raw)), raw]
+        return b"".join(parts)
+
+    def with_changes(self, added=(), removed=()):
+        """Новое множество: self плюс added минус removed."""
+        return (self | IdSet.from_ids(added)) - IdSet.from_ids(removed)
+
+    def __len__(self):
+        return sum(bits.bit_count() for bits in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __contains__(self, id_):
+        return (isinstance(id_, int) and not isinstance(id_, bool)
+                and self.chunks.get(id_ >> CHUNK_BITS, 0) >> (id_ & _CHUNK_MASK) & 1 == 1)
+
+    def __iter__(self):
+        """id по возрастанию."""
+        for chunk in sorted(self.chunks):
+            bits = self.chunks[chunk]
+            for index, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+                if byte:
+                    base = (chunk << CHUNK_BITS) + (index << 3)
+                    for bit in _BYTE_BITS[byte]:
+                        yield base + bit
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        return IdSet({chunk: bits for chunk, bits in
+                      ((chunk, bits & large.get(chunk, 0)) for chunk, bits in small.items()) if bits})
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for chunk, bits in other.chunks.items():
+            chunks[chunk] = chunks.get(chunk, 0) | bits
+        return IdSet(chunks)
+
+    def __sub__(self, other):
+        return IdSet({chunk: bits for chunk, bits in
+                      ((chunk, bits & ~other.chunks.get(chunk, 0)) for chunk, bits in self.chunks.items()) if bits})
+
+    def __eq__(self, other):
+        return isinstance(other, IdSet) and self.chunks == other.chunks
+
+    def __hash__(self):
+        return hash(frozenset(self.chunks.items()))
+
+    def __repr__(self):
+        return f"IdSet({len(self)} id)"
+
+
+def intersection(sets):
+    """Пересечение любого числа множеств (пустой список - пустое множество)."""
+    sets = list(sets)
+    if not sets:
+        return IdSet()
+    result = sets[0]
+    for id_set in sets[1:]:
+        result &= id_set
+    return result
+
+
+def union(sets):
+    result = IdSet()
+    for id_set in sets:
+        result |= id_set
+    return result
+
+
+def venn(named_sets):
+    """
+    Области диаграммы Венна: {frozenset(имена): IdSet} для непустых областей,
+    где область - id, входящие ровно в эти множества. Области делятся по
+    очереди каждым множеством, пустые сразу отбрасываются, поэтому работы
+    меньше, чем 2^N пересечений.
+    """
+    regions = {frozenset(): union(named_sets.values())}
+    for name, id_set in named_sets.items():
+        split = {}
+        for members, region in regions.items():
+            inside, outside = region & id_set, region - id_set
+            if inside:
+                split[members | {name}] = inside
+            if outside:
+                split[members] = outside
+        regions = split
+    return regions
+
+
+def venn_counts(named_sets):
+    """Мощности областей диаграммы Венна: {frozenset(имена): число id}."""
+    return {members: len(region) for members, region in venn(named_sets).items()}
+
+
+def ids_json(id_set):
+    """id множества как JSON-массив - для json_each(?) в запросах (без записи во временные таблицы)."""
+    return json.dumps(list(id_set))
+
+
+@dataclass(frozen=True)
+class PlatformIds:
+    """
+    Множество id платформы: ключи таблицы capture.table. Битовая карта хранится
+    в id_bitmaps; refresh() применяет к ней только ключи, измененные по журналу
+    capture с прошлого обновления. Журнал (capture.script()) создается в
+    миграции вместе со script().
+    """
+    name: str
+    capture: changelog.Capture
+
+    @property
+    def checkpoint_name(self):
+        return f"{BITMAPS_TABLE}:{self.name}"
+
+    @staticmethod
+    def script():
+        """SQL-скрипт для шага миграции: таблица хранимых битовых карт."""
+        return f"""
+    CREATE TABLE IF NOT EXISTS {BITMAPS_TABLE} (
+        name TEXT PRIMARY KEY,
+        members INTEGER NOT NULL,
+        bits BLOB NOT NULL
+    );
+    """
+
+    def _build(self, conn):
+        return IdSet.from_ids(key for (key,) in conn.execute(f"SELECT {self.capture.key} FROM {self.capture.table};"))
+
+    def refresh(self, conn):
+        """
+        Возвращает актуальное множество id и сохраняет его. Первый раз карта
+        строится по всей таблице, дальше - по журналу изменений; учтенные
+        всеми контрольными точками записи журнала удаляются.
+        """
+        key, table, log = self.capture.key, self.capture.table, self.capture.log_table
+        conn.execute("BEGIN;")
+        try:
+            until = self.capture.last_seq(conn)
+            row = conn.execute(f"SELECT bits FROM {BITMAPS_TABLE} WHERE name = ?;", (self.name,)).fetchone()
+            if row is None:
+                id_set = self._build(conn)
+            else:
+                since = self.capture.checkpoint_seq(conn, self.checkpoint_name)
+                if since == until:
+                    conn.execute("COMMIT;")
+                    return IdSet.from_bytes(row[0])
+                added, removed = [], []
+                for touched, present in conn.execute(f"""
+                SELECT K.{key}, T.{key} IS NOT NULL
+                FROM (SELECT DISTINCT {key} FROM {log} WHERE seq > ? AND seq <= ?) K
+                LEFT JOIN {table} T ON T.{key} = K.{key};
+                """, (since, until)):
+                    (added if present else removed).append(touched)
+                id_set = IdSet.from_bytes(row[0]).with_changes(added, removed)
+            conn.execute(f"INSERT OR REPLACE INTO {BITMAPS_TABLE} (name, members, bits) VALUES (?, ?, ?);",
+                         (self.name, len(id_set), id_set.to_bytes()))
+            self.capture.checkpoint(conn, self.checkpoint_name, until)
+            self.capture.prune(conn)
+            conn.execute("COMMIT;")
+        except ValueError as error:
+            # Нецелый ключ: сообщение с таблицей, а не с одним значением
+            conn.execute("ROLLBACK;")
+            raise ValueError(f"{table}.{key}: {error}") from None
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return id_set
+
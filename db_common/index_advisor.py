@@ -0,0 +1,251 @@
+# Индексы по внешним ключам и советник по индексам на основе EXPLAIN QUERY PLAN
+import argparse
+import contextlib
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass
+
+from db_common import bench, connection, reports, synthetic
+
+# Шаги плана, которые советник считает проблемными
+_AUTOMATIC_RE = re.compile(r"^SEARCH (\S+) USING AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.+)\)$")
+# Просмотр по индексу (в том числе покрывающему) - "SCAN t USING ... INDEX" - не проблема
+_SCAN_RE = re.compile(r"^SCAN (\S+)$")
+_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+_NOT_ALIASES = {
+    "WHERE", "JOIN", "LEFT", "RIGHT", "FULL", "INNER", "OUTER", "CROSS", "NATURAL", "ON",
+    "USING", "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+}
+
+
+@dataclass(frozen=True)
+class Finding:
+    """Проблемный шаг плана запроса и, если получилось, предлагаемый индекс."""
+    kind: str
+    table: str
+    detail: str
+    ddl: str = None
+
+
+def index_name(table, columns):
+    return "idx_" + "_".join([table, *columns])
+
+
+def index_ddl(table, columns):
+    column_list = ", ".join(columns)
+    return f"CREATE INDEX IF NOT EXISTS {index_name(table, columns)} ON {table} ({column_list});"
+
+
+def user_tables(conn):
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name;"
+    ).fetchall()
+    return [name for name, in rows]
+
+
+def has_leading_index(conn, table, columns):
+    """Есть ли у таблицы индекс (или первичный ключ), начинающийся с данных столбцов."""
+    columns = [column.lower() for column in columns]
+    primary_key = [row[1].lower() for row in sorted(
+        (row for row in conn.execute(f'PRAGMA table_info("{table}");') if row[5]),
+        key=lambda row: row[5],
+    )]
+    if primary_key[:len(columns)] == columns:
+        return True
+    for index in conn.execute(f'PRAGMA index_list("{table}");').fetchall():
+        indexed = [row[2].lower() for row in conn.execute(f'PRAGMA index_info("{index[1]}");')
+                   if row[2] is not None]
+        if indexed[:len(columns)] == columns:
+            return True
+    return False
+
+
+def missing_foreign_key_indexes(conn):
+    """Список (таблица, столбец) внешних ключей, по которым нет индекса."""
+    missing = []
+    for table in user_tables(conn):
+        for row in conn.execute(f'PRAGMA foreign_key_list("{table}");').fetchall():
+            column = row[3]
+            if not has_leading_index(conn, table, [column]) and (table, column) not in missing:
+                missing.append((table, column))
+    return missing
+
+
+def create_foreign_key_indexes(conn):
+    """
+    Создает индексы по всем внешним ключам без индекса. Подходит как шаг
+    миграции: migrations.migrate вызывает его внутри транзакции шага.
+    Возвращает список выполненных CREATE INDEX.
+    """
+    created = []
+    for table, column in missing_foreign_key_indexes(conn):
+        ddl = index_ddl(table, [column])
+        conn.execute(ddl)
+        created.append(ddl)
+    return created
+
+
+# --- Разбор плана запроса ---
+
+def explain(conn, sql):
+    """Строки EXPLAIN QUERY PLAN: (id, parent, detail)."""
+    return [(row[0], row[1], row[3]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def read_columns(conn, sql):
+    """
+    Столбцы, которые запрос читает из каждой таблицы: {таблица: [столбцы]}.
+    Собираются авторизатором SQLite при подготовке запроса.
+    """
+    columns = {}
+
+    def authorizer(action, table, column, database, source):
+        if action == sqlite3.SQLITE_READ and table and column and database == "main":
+            table_columns = columns.setdefault(table, [])
+            if column not in table_columns:
+                table_columns.append(column)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return columns
+
+
+def table_aliases(sql, tables):
+    """Сопоставляет имена из плана (псевдонимы) с реальными таблицами."""
+    known = {table.lower(): table for table in tables}
+    aliases = {table: table for table in tables}
+    for name, alias in _ALIAS_RE.findall(sql):
+        table = known.get(name.lower())
+        if table and alias and alias.upper() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def advise(conn, sql):
+    """
+    Разбирает план запроса и возвращает список Finding:
+    AUTOMATIC - SQLite строит временный индекс на каждый запуск; предлагается
+    постоянный покрывающий индекс (столбцы поиска + прочие читаемые столбцы).
+    SCAN - полный просмотр таблицы без индекса; если запрос читает внешний
+    ключ без индекса, предлагается индекс по нему.
+    """
+    tables = user_tables(conn)
+    aliases = table_aliases(sql, tables)
+    columns = read_columns(conn, sql)
+    unindexed = missing_foreign_key_indexes(conn)
+
+    findings = []
+    for _, _, detail in explain(conn, sql):
+        automatic = _AUTOMATIC_RE.match(detail)
+        if automatic:
+            table = aliases.get(automatic.group(1))
+            if table is None:
+                findings.append(Finding("AUTOMATIC", automatic.group(1), detail))
+                continue
+            keys = [term.split("=")[0].split(">")[0].split("<")[0].strip()
+                    for term in automatic.group(2).split(" AND ")]
+            extra = [column for column in columns.get(table, []) if column not in keys]
+            findings.append(Finding("AUTOMATIC", table, detail, index_ddl(table, keys + extra)))
+            continue
+
+        scan = _SCAN_RE.match(detail)
+        if scan:
+            table = aliases.get(scan.group(1))
+            if table is None:
+                continue  # подзапрос или CTE, а не таблица
+            foreign_keys = [column for t, column in unindexed
+                            if t == table and column in columns.get(table, [])]
+            if not foreign_keys:
+                findings.append(Finding("SCAN", table, detail))
+            for column in foreign_keys:
+                findings.append(Finding("SCAN", table, detail, index_ddl(table, [column])))
+    return findings
+
+
+def proposals(findings):
+    """Уникальные предлагаемые CREATE INDEX в порядке появления."""
+    seen = []
+    for finding in findings:
+        if finding.ddl and finding.ddl not in seen:
+            seen.append(finding.ddl)
+    return seen
+
+
+# --- Проверка отчетов ---
+
+def advise_report(key, workdir, rows=None, seed=synthetic.DEFAULT_SEED, apply=False):
+    """
+    Запускает отчет, собирает его запросы и возвращает {имя запроса: [Finding]}.
+    rows - перегенерировать БД синтетическими данными такого объема перед
+    разбором (на реальных объемах план может отличаться от встроенных данных).
+    apply=True создает предложенные индексы в БД отчета.
+    """
+    report = reports.find(key)
+    os.makedirs(workdir, exist_ok=True)
+    recorder = bench.run_report(report, workdir, bench.StatementRecorder(report.path))
+    if recorder.db_file is None:
+        return {}
+    if rows:
+        synthetic.generate(key, recorder.db_file, rows, seed=seed)
+
+    conn = connection.connect(recorder.db_file)
+    try:
+        conn.execute("ANALYZE;")
+        result = {name: advise(conn, sql) for name, sql in recorder.statements}
+        if apply:
+            for ddl in proposals(finding for findings in result.values() for finding in findings):
+                conn.execute(ddl)
+            conn.execute("ANALYZE;")
+            conn.commit()
+    finally:
+        connection.release(conn)
+    return result
+
+
+def print_report(key, result):
+    print(f"=== {key} ===")
+    for name, findings in result.items():
+        if not findings:
+            continue
+        print(f"  {name}")
+        for finding in findings:
+            print(f"    [{finding.kind}] {finding.detail}")
+            if finding.ddl:
+                print(f"      -> {finding.ddl}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Советник по индексам для запросов отчетов")
+    parser.add_argument("--reports", nargs="*", help="Ключи отчетов (по умолчанию все)")
+    parser.add_argument("--rows", type=lambda value: int(float(value)),
+                        help="Перед разбором заполнить БД синтетическими данными такого объема")
+    parser.add_argument("--seed", type=int, default=synthetic.DEFAULT_SEED)
+    parser.add_argument("--apply", action="store_true", help="Создать предложенные индексы в БД отчета")
+    parser.add_argument("--workdir", help="Каталог для БД (по умолчанию временный)")
+    args = parser.parse_args(argv)
+
+    keys = args.reports or [report.key for report in reports.discover()]
+    total = []
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory())
+        for key in keys:
+            result = advise_report(key, os.path.join(workdir, key), args.rows, args.seed, args.apply)
+            print_report(key, result)
+            total.extend(finding for findings in result.values() for finding in findings)
+
+    ddl = proposals(total)
+    print(f"\nПредложено индексов: {len(ddl)}")
+    for statement in ddl:
+        print(statement)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
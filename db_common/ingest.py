@@ -0,0 +1,192 @@
+# Потоковая загрузка строк из CSV/JSONL в таблицы SQLite
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from itertools import islice
+
+from db_common import cache, connection, migrations
+
+# Размер пачки строк на одну транзакцию по умолчанию
+DEFAULT_BATCH_SIZE = 50_000
+# С какого числа загруженных строк индексы непустой таблицы откладываются:
+# перестроение обходит всю таблицу и окупается только на больших загрузках
+DEFER_INDEXES_MIN_ROWS = 100_000
+
+
+@dataclass
+class IngestStats:
+    """Итог загрузки: сколько строк, за сколько секунд и сколько пачек."""
+    table: str
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.table}: {self.rows} строк, {self.batches} пачек, "
+                f"{self.seconds:.2f} с ({self.rows_per_sec:,.0f} строк/с)")
+
+
+# --- Источники строк (генераторы) ---
+
+def read_csv(path, columns=None, null_value=""):
+    """
+    Построчно читает CSV с заголовком и отдает кортежи в порядке columns.
+    Значение null_value превращается в NULL.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        reader = csv.reader(source)
+        header = next(reader)
+        order = [header.index(name) for name in columns] if columns else range(len(header))
+        for record in reader:
+            yield tuple(None if record[i] == null_value else record[i] for i in order)
+
+
+def read_jsonl(path, columns):
+    """Построчно читает JSONL (один объект на строку) и отдает кортежи в порядке columns."""
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            if line.strip():
+                record = json.loads(line)
+                yield tuple(record.get(name) for name in columns)
+
+
+def read_file(path, columns=None):
+    """Выбирает читатель по расширению файла (.csv или .jsonl)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return read_csv(path, columns)
+    if extension in (".jsonl", ".ndjson"):
+        if not columns:
+            raise ValueError("Для JSONL нужно явно указать список столбцов")
+        return read_jsonl(path, columns)
+    raise ValueError(f"Неподдерживаемый формат файла: {path}")
+
+
+def batched(rows, size):
+    """Нарезает поток строк на списки длиной не больше size."""
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# --- Отложенное построение индексов ---
+
+def drop_table_indexes(conn, table):
+    """
+    Удаляет неуникальные индексы таблицы, созданные CREATE INDEX, и
+    запоминает их DDL (migrations.record_deferred_indexes). Уникальные
+    индексы и индексы ограничений остаются: без них вставка не проверит
+    дубликаты. Вызывается в транзакции; возвращает число удаленных индексов.
+    """
+    rows = conn.execute("""
+    SELECT M.name, M.sql
+    FROM pragma_index_list(?) I
+    JOIN sqlite_master M ON M.type = 'index' AND M.name = I.name
+    WHERE I."unique" = 0 AND I.origin = 'c' AND M.sql IS NOT NULL;
+    """, (table,)).fetchall()
+    migrations.record_deferred_indexes(conn, table, rows)
+    for name, _ in rows:
+        conn.execute(f'DROP INDEX "{name}";')
+    return len(rows)
+
+
+# --- Загрузка ---
+
+def bulk_insert(conn, table, columns, rows, batch_size=DEFAULT_BATCH_SIZE,
+                defer_indexes=True, progress=None, defer_min_rows=DEFER_INDEXES_MIN_ROWS):
+    """
+    Вставляет поток строк в таблицу пачками: каждая пачка - executemany
+    в собственной явной транзакции. Память не зависит от объема входных
+    данных. При defer_indexes неуникальные индексы таблицы удаляются и
+    строятся один раз в конце: сразу, если таблица пуста, иначе - когда
+    загружено defer_min_rows строк. Удаленные индексы записаны в БД, и
+    если загрузка прервется, их восстановит следующий migrations.migrate().
+    Каждая пачка отмечается в счетчиках изменений кэша (cache.record_changes/commit).
+    progress(stats) вызывается после каждой пачки.
+    """
+    if conn.in_transaction:
+        conn.commit()
+
+    placeholders = ", ".join("?" for _ in columns)
+    column_list = ", ".join(columns)
+    sql = f"INSERT INTO {table} ({column_list}) VALUES ({placeholders});"
+
+    stats = IngestStats(table)
+    started = time.perf_counter()
+
+    deferred = False
+    if defer_indexes and migrations.is_empty(conn, table):
+        defer_min_rows = 0
+
+    try:
+        for batch in batched(rows, batch_size):
+            conn.execute("BEGIN;")
+            try:
+                if defer_indexes and not deferred and stats.rows >= defer_min_rows:
+                    drop_table_indexes(conn, table)
+                    deferred = True
+                conn.executemany(sql, batch)
+                cache.record_changes(conn, [table])
+                cache.commit(conn)
+            except Exception:
+                conn.execute("ROLLBACK;")
+                raise
+            stats.rows += len(batch)
+            stats.batches += 1
+            stats.seconds = time.perf_counter() - started
+            if progress:
+                progress(stats)
+    finally:
+        if deferred:
+            migrations.restore_deferred_indexes(conn, table)
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def ingest_file(conn, table, path, columns, batch_size=DEFAULT_BATCH_SIZE,
+                defer_indexes=True, progress=None):
+    """Загружает CSV/JSONL-файл в таблицу через bulk_insert."""
+    return bulk_insert(conn, table, columns, read_file(path, columns),
+                       batch_size=batch_size, defer_indexes=defer_indexes, progress=progress)
+
+
+def print_progress(stats):
+    print(f"\r{stats}", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковая загрузка CSV/JSONL в таблицу SQLite")
+    parser.add_argument("database", help="Файл БД")
+    parser.add_argument("table", help="Целевая таблица")
+    parser.add_argument("source", help="Входной файл .csv или .jsonl")
+    parser.add_argument("--columns", required=True, help="Столбцы через запятую (порядок вставки)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--keep-indexes", action="store_true",
+                        help="Не откладывать построение индексов до конца загрузки")
+    args = parser.parse_args(argv)
+
+    conn = connection.connect(args.database, "bulk-load")
+    try:
+        stats = ingest_file(conn, args.table, args.source, args.columns.split(","),
+                            batch_size=args.batch_size, defer_indexes=not args.keep_indexes,
+                            progress=print_progress)
+    finally:
+        connection.release(conn)
+    print(file=sys.stderr)
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
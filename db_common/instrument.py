@@ -0,0 +1,254 @@
+# Замеры запросов на общем соединении: время, строки, шаги VM и журнал медленных запросов
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import urllib.parse
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from db_common import bench, connection, reports
+
+# Запросы дольше порога попадают в журнал медленных запросов
+DEFAULT_SLOW_MS = 100.0
+# Через сколько инструкций VM SQLite вызывает обработчик прогресса
+DEFAULT_PROGRESS_STEP = 1000
+# Управление транзакцией: основное время COMMIT - запись журнала и fsync,
+# без колбэков, поэтому замер для них не имеет смысла и в журнал они не попадают
+TRANSACTION_KEYWORDS = {"BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE"}
+
+
+@dataclass
+class StatementStats:
+    """
+    Один выполненный оператор SQL. seconds - приближение снизу: от trace-колбэка
+    до последней выданной строки или последнего вызова обработчика прогресса.
+    """
+    sql: str
+    profile: str
+    started_at: str
+    seconds: float = 0.0
+    rows: int = 0
+    vm_steps: int = 0
+    plan: list = field(default_factory=list)
+
+    @property
+    def ms(self):
+        return self.seconds * 1000
+
+
+class _ConnectionTracer:
+    """
+    Колбэки одного соединения. Trace-колбэк вызывается в начале каждого
+    оператора и закрывает предыдущий; конец оператора - момент последней
+    выданной строки или последнего вызова обработчика прогресса.
+    Строки считаются через row_factory соединения.
+
+    Это приближение: исчерпание курсора SQLite колбэком не сообщает, а время
+    до следующего trace-колбэка включало бы работу приложения между
+    операторами. Поэтому не учитывается работа после последнего колбэка
+    (последние до progress_step инструкций VM, запись страниц, fsync при
+    COMMIT), и короткий оператор без строк показывает около нуля.
+    """
+
+    def __init__(self, profiler, conn):
+        self.profiler = profiler
+        self.conn = conn
+        self.profile = None
+        self.current = None
+        self._started = self._last_activity = 0.0
+        self._previous_row_factory = conn.row_factory
+
+        conn.set_trace_callback(self._trace)
+        conn.set_progress_handler(self._progress, profiler.progress_step)
+        conn.row_factory = self._row
+
+    def _trace(self, sql):
+        self.finish()
+        # Операторы внутри триггеров SQLite сообщает как "-- TRIGGER имя"
+        if sql.lstrip().startswith("--"):
+            return
+        self._started = self._last_activity = time.perf_counter()
+        self.current = StatementStats(sql.strip(), self.profile,
+                                      datetime.now().isoformat(timespec="milliseconds"))
+
+    def _progress(self):
+        if self.current is not None:
+            self.current.vm_steps += self.profiler.progress_step
+            self._last_activity = time.perf_counter()
+        return 0
+
+    def _row(self, cursor, row):
+        if self.current is not None:
+            self.current.rows += 1
+            self._last_activity = time.perf_counter()
+        if self._previous_row_factory is not None:
+            return self._previous_row_factory(cursor, row)
+        return row
+
+    def finish(self):
+        if self.current is not None:
+            self.current.seconds = self._last_activity - self._started
+            self.profiler.record(self.current)
+            self.current = None
+
+    def detach(self):
+        """Снимает колбэки, если соединение еще открыто (например, осталось в пуле)."""
+        try:
+            self.conn.set_trace_callback(None)
+            self.conn.set_progress_handler(None, 0)
+            self.conn.row_factory = self._previous_row_factory
+        except sqlite3.ProgrammingError:
+            pass
+
+
+class Profiler:
+    """
+    Инструментирование соединений через хук профилей connection.
+    Подключается к каждому соединению при первом применении профиля,
+    поэтому курсоры, созданные отчетом после connect(), уже учитываются.
+    """
+
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, slow_log=None, progress_step=DEFAULT_PROGRESS_STEP):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.progress_step = progress_step
+        self.statements = []
+        self.slow = []
+        self._tracers = {}
+        self._db_files = {}
+
+    def hook(self, conn, profile):
+        # Трассировщик держит ссылку на соединение, поэтому id не переиспользуется
+        tracer = self._tracers.get(id(conn))
+        if tracer is None:
+            self._db_files[id(conn)] = conn.execute("PRAGMA database_list;").fetchone()[2]
+            tracer = self._tracers[id(conn)] = _ConnectionTracer(self, conn)
+        tracer.profile = profile
+
+    def record(self, stats):
+        self.statements.append(stats)
+        if stats.ms >= self.slow_ms and bench.first_keyword(stats.sql) not in TRANSACTION_KEYWORDS:
+            self.slow.append(stats)
+
+    def __enter__(self):
+        connection.add_profile_hook(self.hook)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection.remove_profile_hook(self.hook)
+        self.finish()
+
+    def finish(self):
+        """Закрывает незавершенные операторы, строит планы медленных запросов и пишет журнал."""
+        for tracer in self._tracers.values():
+            tracer.finish()
+            tracer.detach()
+        self._tracers.clear()
+        db_files = set(self._db_files.values())
+        for stats in self.slow:
+            if not stats.plan:
+                stats.plan = _explain(db_files, stats.sql)
+        if self.slow_log and self.slow:
+            write_slow_log(self.slow_log, self.slow)
+
+    def summary(self, report=None):
+        """Сводка по операторам, сгруппированным по тексту SQL (самые долгие сверху)."""
+        groups = {}
+        for stats in self.statements:
+            group = groups.setdefault(" ".join(stats.sql.split()), {
+                "sql": " ".join(stats.sql.split()), "calls": 0, "total_ms": 0.0,
+                "max_ms": 0.0, "rows": 0, "vm_steps": 0,
+            })
+            group["calls"] += 1
+            group["total_ms"] += stats.ms
+            group["max_ms"] = max(group["max_ms"], stats.ms)
+            group["rows"] += stats.rows
+            group["vm_steps"] += stats.vm_steps
+
+        statements = sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
+        for group in statements:
+            group["total_ms"] = round(group["total_ms"], 3)
+            group["max_ms"] = round(group["max_ms"], 3)
+        return {
+            "report": report,
+            "statements": len(self.statements),
+            "total_ms": round(sum(stats.ms for stats in self.statements), 3),
+            "rows": sum(stats.rows for stats in self.statements),
+            "vm_steps": sum(stats.vm_steps for stats in self.statements),
+            "slow_ms": self.slow_ms,
+            "slow": [asdict(stats) for stats in self.slow],
+            "by_statement": statements,
+        }
+
+
+def _explain(db_files, sql):
+    """
+    EXPLAIN QUERY PLAN через отдельное соединение: отчет к этому моменту
+    мог уже закрыть свое. Для не-SELECT операторов и :memory: план пуст.
+    """
+    if bench.first_keyword(sql) not in ("SELECT", "WITH", "VALUES"):
+        return []
+    for db_file in db_files:
+        if not db_file or not os.path.exists(db_file):
+            continue
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(db_file)}?mode=ro", uri=True)
+        try:
+            return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        except sqlite3.Error:
+            continue
+        finally:
+            conn.close()
+    return []
+
+
+def write_slow_log(path, slow):
+    """Дописывает медленные запросы в текстовый журнал."""
+    with open(path, "a", encoding="utf-8") as log:
+        for stats in slow:
+            log.write(f"# {stats.started_at}  {stats.ms:.3f} мс  строк={stats.rows}  "
+                      f"шагов VM={stats.vm_steps}  профиль={stats.profile}\n")
+            log.write(stats.sql + "\n")
+            for line in stats.plan:
+                log.write(f"--   {line}\n")
+            log.write("\n")
+
+
+def print_summary(summary, limit=10, file=sys.stderr):
+    print(f"\n=== {summary['report']}: {summary['statements']} операторов, "
+          f"{summary['total_ms']:.3f} мс, строк {summary['rows']}, шагов VM {summary['vm_steps']}, "
+          f"медленных (>= {summary['slow_ms']} мс) {len(summary['slow'])} ===", file=file)
+    for group in summary["by_statement"][:limit]:
+        sql = group["sql"] if len(group["sql"]) <= 80 else group["sql"][:77] + "..."
+        print(f"{group['total_ms']:>10.3f} мс  x{group['calls']:<4} строк={group['rows']:<8} {sql}",
+              file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запуск отчета с замером каждого запроса")
+    parser.add_argument("report", help="Ключ отчета (имя скрипта без .py)")
+    parser.add_argument("--slow-ms", type=float, default=DEFAULT_SLOW_MS,
+                        help="Порог медленного запроса в миллисекундах")
+    parser.add_argument("--slow-log", help="Файл журнала медленных запросов (дописывается)")
+    parser.add_argument("--export", help="Записать сводку по отчету в JSON")
+    parser.add_argument("--workdir", help="Рабочий каталог отчета (по умолчанию каталог скрипта)")
+    args = parser.parse_args(argv)
+
+    report = reports.find(args.report)
+    profiler = Profiler(args.slow_ms, args.slow_log)
+    # run_report сам регистрирует profiler.hook на время запуска
+    bench.run_report(report, args.workdir or report.directory, profiler, quiet=False)
+    profiler.finish()
+
+    summary = profiler.summary(report.key)
+    print_summary(summary)
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as output:
+            json.dump(summary, output, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
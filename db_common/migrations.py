@@ -0,0 +1,144 @@
+# Версионные миграции схемы вместо удаления и пересоздания БД
+import sqlite3
+from datetime import datetime
+
+from db_common import connection
+
+# Таблица, в которой хранится история примененных шагов
+VERSION_TABLE = "schema_version"
+# DDL индексов, временно удаленных на время массовой загрузки (ingest.bulk_insert)
+DEFERRED_INDEXES_TABLE = "deferred_indexes"
+
+
+def split_statements(script):
+    """Разбивает SQL-скрипт на отдельные операторы (с учетом тел триггеров)."""
+    statements = []
+    buffer = ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        statements.append(buffer.strip())
+    return statements
+
+
+def ensure_version_table(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    );
+    """)
+
+
+def current_version(conn):
+    """Возвращает номер последней примененной миграции (0 для пустой БД)."""
+    ensure_version_table(conn)
+    row = conn.execute(f"SELECT MAX(version) FROM {VERSION_TABLE};").fetchone()
+    return row[0] or 0
+
+
+def record_deferred_indexes(conn, table, index_sql):
+    """Запоминает DDL удаляемых индексов table; вызывается в той же транзакции, что и удаление."""
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {DEFERRED_INDEXES_TABLE} (
+        name TEXT PRIMARY KEY,
+        tbl_name TEXT NOT NULL,
+        sql TEXT NOT NULL
+    );
+    """)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {DEFERRED_INDEXES_TABLE} (name, tbl_name, sql) VALUES (?, ?, ?);",
+        [(name, table, sql) for name, sql in index_sql])
+
+
+def restore_deferred_indexes(conn, table=None):
+    """
+    Пересоздает индексы, удаленные на время загрузки (все или только table),
+    и убирает их из списка отложенных. Так индексы возвращаются и после
+    аварийно прерванной загрузки - при следующем открытии БД. Возвращает
+    число восстановленных индексов. Вызывается вне транзакции.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (DEFERRED_INDEXES_TABLE,)).fetchone()
+    if not exists:
+        return 0
+    condition, params = ("WHERE tbl_name = ?", (table,)) if table else ("", ())
+    conn.execute("BEGIN;")
+    try:
+        rows = conn.execute(f"SELECT name, sql FROM {DEFERRED_INDEXES_TABLE} {condition};", params).fetchall()
+        for name, sql in rows:
+            present = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?;", (name,)).fetchone()
+            if not present:
+                conn.execute(sql)
+        conn.execute(f"DELETE FROM {DEFERRED_INDEXES_TABLE} {condition};", params)
+        conn.execute("COMMIT;")
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+    return len(rows)
+
+
+def _check_steps(steps):
+    versions = [version for version, _, _ in steps]
+    if versions != sorted(set(versions)) or (versions and versions[0] < 1):
+        raise ValueError(f"Номера миграций должны строго возрастать начиная с 1: {versions}")
+
+
+def migrate(conn, steps):
+    """
+    Применяет к БД все шаги новее текущей версии.
+    Каждый шаг - кортеж (версия, описание, SQL-скрипт или функция(conn)),
+    выполняется в отдельной транзакции вместе с записью в schema_version.
+    Перед шагами восстанавливаются индексы, оставшиеся удаленными после
+    прерванной загрузки. Возвращает пару (версия до, версия после).
+    """
+    _check_steps(steps)
+    start = current_version(conn)
+    conn.commit()
+    restore_deferred_indexes(conn)
+
+    version = start
+    for step_version, description, step in steps:
+        if step_version <= version:
+            continue
+
+        conn.execute("BEGIN;")
+        try:
+            if callable(step):
+                step(conn)
+            else:
+                for statement in split_statements(step):
+                    conn.execute(statement)
+            conn.execute(
+                f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (?, ?, ?);",
+                (step_version, description, datetime.now().isoformat(timespec="seconds")),
+            )
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        version = step_version
+
+    return start, version
+
+
+def open_database(db_file, steps, profile="bulk-load", rebuild=False, detect_types=0):
+    """
+    Открывает существующую БД (или создает новую) и доводит схему до
+    актуальной версии. rebuild=True удаляет файл перед открытием.
+    """
+    if rebuild:
+        connection.remove_database(db_file)
+    conn = connection.connect(db_file, profile, detect_types)
+    migrate(conn, steps)
+    return conn
+
+
+def is_empty(conn, table):
+    """Проверяет, что в таблице нет ни одной строки (для однократной загрузки данных)."""
+    return conn.execute(f"SELECT NOT EXISTS (SELECT 1 FROM {table});").fetchone()[0] == 1
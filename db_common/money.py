@@ -0,0 +1,197 @@
+# Денежные суммы в целых минимальных единицах (копейках) вместо REAL
+import sqlite3
+from decimal import ROUND_HALF_EVEN, Decimal
+
+# Минимальных единиц в одной денежной единице (два знака после запятой)
+MINOR_UNITS = 100
+# Объявленный тип столбца: первое слово выбирает конвертер sqlite3 (PARSE_DECLTYPES),
+# а "INTEGER" дает столбцу целочисленное сродство
+DECLARED_TYPE = "MONEY INTEGER"
+# Для соединений, которые должны возвращать Money из столбцов DECLARED_TYPE
+DETECT_TYPES = sqlite3.PARSE_DECLTYPES
+
+_EXPONENT = Decimal(1) / MINOR_UNITS
+
+
+class Money:
+    """
+    Неизменяемая денежная сумма: целое число минимальных единиц.
+    Сложение и умножение на целое точные, поэтому итоги не зависят от порядка
+    суммирования: частичные суммы по разделам складываются бит в бит.
+    """
+
+    __slots__ = ("minor",)
+
+    def __init__(self, minor):
+        if isinstance(minor, bool) or not isinstance(minor, int):
+            raise TypeError(f"Сумма задается целым числом минимальных единиц, получено {minor!r}")
+        object.__setattr__(self, "minor", minor)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money неизменяем")
+
+    @classmethod
+    def from_decimal(cls, value):
+        """
+        Сумма из десятичного значения: Decimal, строки, int или float.
+        float берется по кратчайшей десятичной записи (12.5 -> "12.5"), а не по
+        двоичному значению; лишние знаки округляются к четному.
+        """
+        if isinstance(value, float):
+            value = repr(value)
+        amount = Decimal(value).quantize(_EXPONENT, rounding=ROUND_HALF_EVEN)
+        return cls(int(amount * MINOR_UNITS))
+
+    def to_decimal(self):
+        return Decimal(self.minor) / MINOR_UNITS
+
+    def __float__(self):
+        return self.minor / MINOR_UNITS
+
+    def __str__(self):
+        sign = "-" if self.minor < 0 else ""
+        units, cents = divmod(abs(self.minor), MINOR_UNITS)
+        return f"{sign}{units}.{cents:0{len(str(MINOR_UNITS)) - 1}d}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and self.minor == other.minor
+
+    def __lt__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.minor < other.minor
+
+    def __le__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.minor <= other.minor
+
+    def __gt__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.minor > other.minor
+
+    def __ge__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.minor >= other.minor
+
+    def __hash__(self):
+        return hash(self.minor)
+
+    def __add__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.minor + other.minor)
+
+    def __radd__(self, other):
+        # sum() начинает с 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.minor - other.minor)
+
+    def __neg__(self):
+        return Money(-self.minor)
+
+    def __mul__(self, count):
+        if isinstance(count, bool) or not isinstance(count, int):
+            return NotImplemented
+        return Money(self.minor * count)
+
+    __rmul__ = __mul__
+
+
+def to_minor(value):
+    """
+    Значение столбца в минимальные единицы: для переноса старых REAL-сумм
+    (через десятичную запись, без ошибок вида 1.005 * 100 = 100.49999...).
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return value * MINOR_UNITS
+    return Money.from_decimal(value).minor
+
+
+def total(amounts):
+    """Точная сумма Money (например, частичных итогов по разделам)."""
+    return sum(amounts, Money(0))
+
+
+def format_row(row):
+    """Строка результата как кортеж, но суммы Money - в десятичной записи: (1, 'Имя', 750.00)."""
+    values = [str(value) if isinstance(value, Money) else repr(value) for value in row]
+    return "(" + ", ".join(values) + ("," if len(values) == 1 else "") + ")"
+
+
+class MoneySum:
+    """
+    Агрегат money_sum(столбец): точная сумма минимальных единиц. В отличие от
+    встроенного SUM, который молча переходит на REAL при первом дробном
+    значении, отклоняет нецелые значения - так не пройдут незамеченными
+    непереведенные суммы.
+    """
+
+    def __init__(self):
+        self.minor = 0
+        self.rows = 0
+
+    def step(self, value):
+        if value is None:
+            return
+        if not isinstance(value, int):
+            raise TypeError(f"money_sum: ожидались минимальные единицы (INTEGER), получено {value!r}")
+        self.minor += value
+        self.rows += 1
+
+    def finalize(self):
+        return self.minor if self.rows else None
+
+
+def _money_text(minor):
+    return None if minor is None else str(Money(minor))
+
+
+def register(conn):
+    """Регистрирует на соединении to_minor(x), money_text(minor) и агрегат money_sum(minor)."""
+    conn.create_function("to_minor", 1, to_minor, deterministic=True)
+    conn.create_function("money_text", 1, _money_text, deterministic=True)
+    conn.create_aggregate("money_sum", 1, MoneySum)
+    return conn
+
+
+def convert_column(conn, table, column, not_null=True):
+    """
+    Шаг миграции: переводит REAL-столбец с суммами в DECLARED_TYPE (минимальные
+    единицы). SQLite не меняет тип столбца на месте, поэтому старый столбец
+    переименовывается, рядом создается новый, а затем старый удаляется.
+    Индексы и триггеры, где упоминается столбец, нужно удалить до вызова.
+    Новый столбец становится последним в таблице.
+    """
+    register(conn)
+    legacy = f"{column}_real"
+    constraint = " NOT NULL DEFAULT 0" if not_null else ""
+    conn.execute(f"ALTER TABLE {table} RENAME COLUMN {column} TO {legacy};")
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {DECLARED_TYPE}{constraint};")
+    conn.execute(f"UPDATE {table} SET {column} = to_minor({legacy});")
+    conn.execute(f"ALTER TABLE {table} DROP COLUMN {legacy};")
+
+
+def _adapt(money):
+    return money.minor
+
+
+def _convert(data):
+    return Money(int(data))
+
+
+sqlite3.register_adapter(Money, _adapt)
+sqlite3.register_converter(DECLARED_TYPE.split()[0], _convert)
@@ -0,0 +1,73 @@
+# Потоковый вывод результатов отчетов: строки читаются пачками и печатаются через буфер
+import sys
+
+# Сколько строк забирать из курсора за один fetchmany
+DEFAULT_FETCH_SIZE = 1000
+# Сколько напечатанных строк копить перед записью в поток вывода
+DEFAULT_CHUNK_LINES = 1000
+
+
+def iter_rows(cursor, size=DEFAULT_FETCH_SIZE):
+    """Отдает строки результата по одной, забирая их из курсора пачками по size."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+class BufferedWriter:
+    """
+    Копит строки вывода и пишет их в поток кусками по chunk_lines.
+    Первая строка сбрасывается сразу, чтобы результат появлялся без ожидания
+    всего набора. Поток берется в момент записи, поэтому redirect_stdout работает.
+    """
+
+    def __init__(self, file=None, chunk_lines=DEFAULT_CHUNK_LINES):
+        self._file = file
+        self.chunk_lines = chunk_lines
+        self.lines = 0
+        self._buffer = []
+
+    @property
+    def file(self):
+        return self._file if self._file is not None else sys.stdout
+
+    def write_line(self, line):
+        self._buffer.append(line)
+        self.lines += 1
+        if self.lines == 1 or len(self._buffer) >= self.chunk_lines:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+def print_rows(cursor, format_row=str, header=(), empty=None, file=None,
+               fetch_size=DEFAULT_FETCH_SIZE, chunk_lines=DEFAULT_CHUNK_LINES):
+    """
+    Печатает результат уже выполненного запроса, не держа его в памяти целиком.
+    header - строки, которые печатаются перед первой строкой результата (только
+    если результат не пуст); empty - сообщение для пустого результата.
+    Возвращает число напечатанных строк результата.
+    """
+    count = 0
+    with BufferedWriter(file, chunk_lines) as writer:
+        for row in iter_rows(cursor, fetch_size):
+            if count == 0:
+                for line in header:
+                    writer.write_line(line)
+            writer.write_line(format_row(row))
+            count += 1
+        if count == 0 and empty is not None:
+            writer.write_line(empty)
+    return count
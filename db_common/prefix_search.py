@@ -0,0 +1,116 @@
+# Поиск по префиксу строки через диапазоны индекса вместо LIKE 'префикс%'
+import sys
+
+# Верхняя граница "без ограничения": в SQLite любой TEXT меньше любого BLOB
+UNBOUNDED = b""
+# Суррогатные кодовые точки не кодируются в UTF-8 и в строках SQLite не встречаются
+_SURROGATES = range(0xD800, 0xE000)
+# Сколько ASCII-букв префикса раскрывается по регистру: n букв дают 2^n диапазонов,
+# поэтому длинный префикс обрезается, а остаток проверяется через LIKE
+MAX_CASE_LETTERS = 5
+
+
+def like_prefix(pattern):
+    """
+    Возвращает префикс, если шаблон LIKE имеет вид 'префикс%' без других
+    подстановочных символов; иначе None (такой шаблон диапазоном не выразить).
+    """
+    prefix = pattern.rstrip("%")
+    if prefix == pattern or "%" in prefix or "_" in prefix:
+        return None
+    return prefix
+
+
+def upper_bound(prefix):
+    """
+    Наименьшая строка, большая всех строк с данным префиксом.
+    Строки с колляцией BINARY сравниваются побайтно в UTF-8, а порядок байтов
+    UTF-8 совпадает с порядком кодовых точек, поэтому достаточно увеличить
+    последний символ (перескакивая суррогаты). Если увеличивать нечего,
+    возвращается UNBOUNDED.
+    """
+    chars = list(prefix)
+    while chars:
+        code = ord(chars.pop()) + 1
+        if code in _SURROGATES:
+            code = _SURROGATES.stop
+        if code <= sys.maxunicode:
+            return "".join(chars) + chr(code)
+    return UNBOUNDED
+
+
+def case_variants(prefix):
+    """
+    Варианты регистра для ASCII-букв префикса. Встроенный LIKE SQLite
+    не различает регистр только у ASCII, а прочие символы (в том числе
+    кириллицу) сравнивает точно - диапазоны повторяют это поведение.
+    """
+    variants = [""]
+    for char in prefix:
+        if char.isascii() and char.isalpha():
+            variants = [variant + case for variant in variants for case in (char.upper(), char.lower())]
+        else:
+            variants = [variant + char for variant in variants]
+    return variants
+
+
+def range_prefix(prefix, ascii_case_insensitive=True):
+    """
+    Часть префикса, по которой строятся диапазоны: без учета регистра -
+    до MAX_CASE_LETTERS-й ASCII-буквы включительно, иначе весь префикс.
+    """
+    if not ascii_case_insensitive:
+        return prefix
+    letters = 0
+    for position, char in enumerate(prefix):
+        if char.isascii() and char.isalpha():
+            if letters == MAX_CASE_LETTERS:
+                return prefix[:position]
+            letters += 1
+    return prefix
+
+
+def ranges_exact(prefixes, ascii_case_insensitive=True):
+    """True, если диапазоны prefix_ranges() совпадают с префиксами без остаточной проверки LIKE."""
+    return all(range_prefix(prefix, ascii_case_insensitive) == prefix for prefix in prefixes)
+
+
+def merge_ranges(ranges):
+    """Сливает пересекающиеся полуинтервалы [low, high), чтобы строки не дублировались."""
+    def order(bound):
+        # UNBOUNDED больше любой строки
+        return (1, "") if bound == UNBOUNDED else (0, bound)
+
+    merged = []
+    for low, high in sorted(ranges, key=lambda r: (r[0], order(r[1]))):
+        if merged and order(low) <= order(merged[-1][1]):
+            if order(high) > order(merged[-1][1]):
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def prefix_ranges(prefixes, ascii_case_insensitive=True):
+    """
+    Полуинтервалы [low, high) для набора префиксов (без пересечений, по возрастанию).
+    Длинные префиксы обрезаются (range_prefix): диапазоны тогда шире, и
+    если ranges_exact() ложно, строки нужно дополнительно проверить LIKE.
+    """
+    ranges = []
+    for prefix in prefixes:
+        prefix = range_prefix(prefix, ascii_case_insensitive)
+        variants = case_variants(prefix) if ascii_case_insensitive else [prefix]
+        ranges.extend((variant, upper_bound(variant)) for variant in set(variants))
+    return merge_ranges(ranges)
+
+
+def ranges_cte(name, ranges):
+    """
+    CTE "name(low, high) AS (VALUES ...)" и параметры к нему. Соединение
+    таблицы с CTE по условию column >= low AND column < high дает один
+    проход, в котором каждый диапазон - отдельный поиск по индексу.
+    """
+    values = ", ".join("(?, ?)" for _ in ranges)
+    params = [bound for low_high in ranges for bound in low_high]
+    return f"{name} (low, high) AS (VALUES {values})", params
@@ -0,0 +1,96 @@
+# Реестр скриптов-отчетов: поиск, загрузка модулей и точек входа
+import ast
+import glob
+import importlib.util
+import os
+import sys
+from dataclasses import dataclass
+
+# Корень репозитория (каталог, в котором лежит пакет db_common)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Каталоги отчетов: "<название> - 3c 2025 (A)"
+REPORT_DIR_PATTERN = "* - 3c 2025 (A)"
+
+_modules = {}
+
+
+@dataclass(frozen=True)
+class Report:
+    """Скрипт-отчет: ключ (имя файла без .py), путь и функция из блока __main__."""
+    key: str
+    path: str
+    entry_point: str
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.path)
+
+
+def _main_entry_point(path):
+    """Находит функцию, вызываемую в блоке if __name__ == "__main__"."""
+    with open(path, encoding="utf-8") as source:
+        tree = ast.parse(source.read(), filename=path)
+
+    for node in tree.body:
+        if (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+                and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__"):
+            for statement in node.body:
+                if (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call)
+                        and isinstance(statement.value.func, ast.Name)):
+                    return statement.value.func.id
+    return None
+
+
+def discover(root=REPO_ROOT):
+    """Возвращает все скрипты-отчеты репозитория, отсортированные по ключу."""
+    found = []
+    for path in glob.glob(os.path.join(glob.escape(root), REPORT_DIR_PATTERN, "*.py")):
+        entry_point = _main_entry_point(path)
+        if entry_point:
+            key = os.path.splitext(os.path.basename(path))[0]
+            found.append(Report(key, path, entry_point))
+    return sorted(found, key=lambda report: report.key)
+
+
+def find(key):
+    """Ищет отчет по ключу (имени скрипта без расширения)."""
+    for report in discover():
+        if report.key == key:
+            return report
+    raise KeyError(f"Отчет не найден: {key!r}")
+
+
+def load_module(report):
+    """
+    Импортирует скрипт отчета как модуль (без запуска точки входа).
+    Имена файлов содержат пробелы, поэтому обычный import не подходит.
+    """
+    if report.path not in _modules:
+        name = "report_" + "".join(ch if ch.isalnum() else "_" for ch in report.key)
+        spec = importlib.util.spec_from_file_location(name, report.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[report.path] = module
+    return _modules[report.path]
+
+
+def run_entry_point(report, workdir=None, args=()):
+    """
+    Вызывает точку входа отчета так, как при запуске "python скрипт.py args":
+    рабочий каталог - workdir (по умолчанию каталог скрипта, где отчет держит
+    свою БД), sys.argv - путь к скрипту и args. Возвращает код завершения.
+    """
+    module = load_module(report)
+    previous_dir, previous_argv = os.getcwd(), sys.argv
+    try:
+        os.chdir(workdir or report.directory)
+        sys.argv = [report.path, *args]
+        getattr(module, report.entry_point)()
+    except SystemExit as exit_:
+        code = exit_.code
+        return code if isinstance(code, int) else (0 if code is None else 1)
+    finally:
+        os.chdir(previous_dir)
+        sys.argv = previous_argv
+    return 0
@@ -0,0 +1,119 @@
+# Параллельный запуск всех отчетов в пуле процессов
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from db_common import reports
+
+
+@dataclass
+class RunResult:
+    """Итог запуска одного отчета: код завершения, время и перехваченный вывод."""
+    key: str
+    exit_code: int
+    seconds: float
+    stdout: str
+    stderr: str
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+
+def run_one(key, workdir=None):
+    """
+    Запускает отчет в текущем процессе, перехватывая stdout и stderr.
+    Необработанное исключение отчета превращается в код 1 и трассировку в stderr.
+    """
+    report = reports.find(key)
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            exit_code = reports.run_entry_point(report, workdir)
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+    return RunResult(key, exit_code, time.perf_counter() - started, stdout.getvalue(), stderr.getvalue())
+
+
+def run_all(keys, workers=None, workdir=None, on_done=None):
+    """
+    Запускает отчеты в пуле из workers процессов (по умолчанию - по числу ядер).
+    Каждый отчет работает со своим файлом БД, поэтому они не мешают друг другу.
+    workdir - общий каталог, в котором каждый отчет получает подкаталог со своей БД
+    (по умолчанию отчеты работают в своих каталогах, как при обычном запуске).
+    on_done(result) вызывается по мере завершения. Возвращает результаты в порядке keys.
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_one, key, os.path.join(workdir, key) if workdir else None): key
+            for key in keys
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.key] = result
+            if on_done:
+                on_done(result)
+    return [results[key] for key in keys]
+
+
+def write_outputs(results, output_dir):
+    """Сохраняет вывод каждого отчета в <output_dir>/<ключ>.txt (stderr - в конце файла)."""
+    os.makedirs(output_dir, exist_ok=True)
+    for result in results:
+        with open(os.path.join(output_dir, result.key + ".txt"), "w", encoding="utf-8") as output:
+            output.write(result.stdout)
+            if result.stderr:
+                output.write("\nSTDERR:\n" + result.stderr)
+
+
+def print_result(result):
+    status = "OK" if result.ok else f"ОШИБКА ({result.exit_code})"
+    print(f"{result.key:<32} {result.seconds:>9.3f} с  {status}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Параллельный запуск всех отчетов")
+    parser.add_argument("--reports", nargs="*", help="Ключи отчетов (по умолчанию все)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Число процессов пула")
+    parser.add_argument("--workdir", help="Каталог для БД отчетов (по умолчанию - каталоги скриптов)")
+    parser.add_argument("--output-dir", help="Каталог для вывода отчетов (<ключ>.txt)")
+    parser.add_argument("--verbose", action="store_true", help="Напечатать вывод каждого отчета")
+    args = parser.parse_args(argv)
+
+    keys = args.reports or [report.key for report in reports.discover()]
+    started = time.perf_counter()
+    results = run_all(keys, args.workers, args.workdir, on_done=print_result)
+    wall = time.perf_counter() - started
+
+    if args.verbose:
+        for result in results:
+            print(f"\n===== {result.key} =====")
+            print(result.stdout, end="")
+            if result.stderr:
+                print(result.stderr, end="", file=sys.stderr)
+    if args.output_dir:
+        write_outputs(results, args.output_dir)
+
+    total = sum(result.seconds for result in results)
+    failed = [result.key for result in results if not result.ok]
+    print(f"\nОтчетов: {len(results)}, процессов: {args.workers}, общее время: {wall:.3f} с, "
+          f"сумма по отчетам: {total:.3f} с (ускорение x{total / wall if wall else 0:.1f})")
+    if failed:
+        print("С ошибками: " + ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+# Детерминированный генератор синтетических данных для всех схем отчетов
+import argparse
+import os
+import random
+from bisect import bisect
+from datetime import date, datetime, timedelta
+from itertools import accumulate, cycle
+
+from db_common import connection, ingest, migrations, money, reports
+
+DEFAULT_SEED = 42
+# Опорная дата: все даты строятся от нее, а не от "сегодня", ради воспроизводимости
+REFERENCE_DATE = date(2025, 1, 1)
+
+# --- Словари для правдоподобных значений ---
+
+FIRST_NAMES_RU = ["Иван", "Мария", "Игорь", "Алексей", "Ирина", "Ольга", "Дмитрий", "Елена",
+                  "Сергей", "Анна", "Виктор", "Екатерина", "Глеб", "Марина", "Олег", "Светлана"]
+SURNAME_STEMS_RU = ["Ива", "Пет", "Ис", "Смир", "Иль", "Кузн", "Вол", "Зай", "Орл", "Крот",
+                    "Лев", "Дым", "Сем", "Гал", "Коз", "Бур", "Саф", "Ков", "Абр", "Юд",
+                    "Эр", "Яш", "Щер", "Шум", "Цар", "Хар", "Фед", "Ус", "Тих", "Руд",
+                    "Ник", "Мак", "Лап", "Ким", "Жук", "Ег", "Дан", "Гер", "Вас", "Бел"]
+SURNAME_MIDDLES_RU = ["", "ан", "ор", "ил", "ет"]
+SURNAME_ENDINGS_RU = ["ов", "ев", "ин", "ский", "енко"]
+NICKNAMES = ["Phoenix", "Rider", "Warden", "Valkyrie", "Ghost", "Shadow", "Viper", "Nova",
+             "Raven", "Titan", "Blaze", "Frost", "Storm", "Echo", "Falcon", "Wolf"]
+DEPARTMENTS_RU = ["Отдел продаж", "Разработка", "Маркетинг", "Финансы", "ИТ", "Кадры", "Логистика"]
+WORDS = ["novel", "story", "deep", "magnificent", "complex", "boring", "classic", "love",
+         "war", "peace", "crime", "punishment", "poetry", "hero", "journey", "mystery",
+         "science", "future", "history", "reading", "again", "breath", "author", "style",
+         "plot", "character", "ending", "brilliant", "slow", "masterpiece"]
+CITIES = {"Shenzhen": "Asia", "Taipei": "Asia", "Kyoto": "Asia", "Seoul": "Asia",
+          "Munich": "Europe", "Paris": "Europe", "Milan": "Europe", "Prague": "Europe",
+          "New York": "Americas", "Toronto": "Americas", "Lima": "Americas"}
+
+
+# --- Вспомогательные распределения ---
+
+def zipf_sampler(rng, n, s=1.1):
+    """
+    Возвращает функцию, выбирающую id из 1..n по закону Ципфа:
+    немногие "горячие" id встречаются значительно чаще остальных.
+    Горячие id перемешаны, чтобы не совпадать с наименьшими номерами.
+    """
+    cumulative = list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+    total = cumulative[-1]
+    ids = list(range(1, n + 1))
+    rng.shuffle(ids)
+    return lambda: ids[bisect(cumulative, rng.random() * total)]
+
+
+def random_date(rng, span_days, end=REFERENCE_DATE):
+    return (end - timedelta(days=rng.randrange(span_days))).isoformat()
+
+
+def random_datetime(rng, span_days, end=REFERENCE_DATE):
+    moment = datetime(end.year, end.month, end.day) - timedelta(seconds=rng.randrange(span_days * 86400))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def russian_surname(rng):
+    return rng.choice(SURNAME_STEMS_RU) + rng.choice(SURNAME_MIDDLES_RU) + rng.choice(SURNAME_ENDINGS_RU)
+
+
+def russian_full_name(rng):
+    return f"{rng.choice(FIRST_NAMES_RU)} {russian_surname(rng)}"
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize() + "."
+
+
+def bernoulli_ids(rng, span, probability):
+    """Поток возрастающих id из 1..span, каждый включается с заданной вероятностью."""
+    return (i for i in range(1, span + 1) if rng.random() < probability)
+
+
+# --- Генераторы по схемам ---
+# Каждый генератор отдает (таблица, столбцы, поток строк) в порядке,
+# при котором родительские таблицы заполняются раньше дочерних.
+
+def _academic_records(rng, rows):
+    pupils = max(rows // 3, 1)
+    disciplines = 40
+    yield "Pupils", ["PupilID", "Name", "Surname"], (
+        (i, rng.choice(FIRST_NAMES_RU), russian_surname(rng)) for i in range(1, pupils + 1))
+    yield "Disciplines", ["DisciplineID", "Title"], (
+        (i, f"Дисциплина {i}") for i in range(1, disciplines + 1))
+    discipline = zipf_sampler(rng, disciplines)
+    yield "Assignments", ["AssignmentID", "PupilID", "DisciplineID"], (
+        (i, rng.randint(1, pupils), discipline()) for i in range(1, rows + 1))
+
+
+def _accounts_report(rng, rows):
+    # Около половины пространства id в каждой платформе, пересечение ~25%
+    yield "DesktopClients", ["AccountID", "ScreenName"], (
+        (i, f"user{i}") for i in bernoulli_ids(rng, 2 * rows, 0.5))
+    yield "MobileClients", ["AccountID", "ScreenName"], (
+        (i, f"user{i}") for i in bernoulli_ids(rng, 2 * rows, 0.5))
+
+
+def _clients_status(rng, rows):
+    # Дата последней транзакции - номер дня от 1970-01-01
+    reference_day = (REFERENCE_DATE - date(1970, 1, 1)).days
+
+    def user(i):
+        # ~7% пользователей без транзакций вовсе
+        last_txn = None if rng.random() < 0.07 else reference_day - rng.randrange(730)
+        return i, f"user_{i}", last_txn, money.to_minor(round(rng.lognormvariate(9.5, 1.2), 2))
+    yield "UserActivity", ["user_pk", "alias_name", "last_txn_day", "gross_revenue"], (
+        user(i) for i in range(1, rows + 1))
+
+
+def _clients_were_werent(rng, rows):
+    span = rows * 5 // 4
+    yield "InitialMembers", ["UserID_PK", "DisplayName"], (
+        (i, f"Member {i}") for i in bernoulli_ids(rng, span, 0.8))
+    # ~3% оставшихся участников сменили отображаемое имя
+    yield "FinalMembers", ["UserID_PK", "DisplayName"], (
+        (i, f"Member {i}" + (" (renamed)" if rng.random() < 0.03 else ""))
+        for i in bernoulli_ids(rng, span, 0.8))
+
+
+def _phone_variant(rng, number):
+    """Один и тот же номер в разных форматах записи (как в реальных справочниках)."""
+    digits = f"{number:010d}"
+    variants = [
+        digits,
+        "8" + digits,
+        f"+7 ({digits[:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}",
+        f"{digits[:3]}-{digits[3:6]}-{digits[6:8]}-{digits[8:]}",
+    ]
+    return rng.choice(variants)
+
+
+def _company_contacts(rng, rows):
+    people = max(rows // 2, 1)
+
+    def contact(person):
+        alias = f"{FIRST_NAMES_RU[person % len(FIRST_NAMES_RU)]} {SURNAME_STEMS_RU[person // len(FIRST_NAMES_RU) % len(SURNAME_STEMS_RU)]}ов {person}"
+        if rng.random() < 0.05:
+            alias = "  " + alias.lower()
+        if rng.random() < 0.15:
+            return alias, None
+        return alias, _phone_variant(rng, 9_000_000_000 + person * 7919 % 1_000_000_000)
+
+    per_department = max(rows // 3, 1)
+    for table in ("Dept_Sales", "Dept_HR", "Dept_Operations"):
+        yield table, ["Contact_Alias", "Mobile_Num"], (
+            contact(rng.randint(1, people)) for _ in range(per_department))
+
+
+def _company_records(rng, rows):
+    teams = max(rows // 50, 1)
+    yield "Teams", ["TeamID", "GroupName", "TeamLeadID"], (
+        (i, f"Team {i}", 500 + i) for i in range(1, teams + 1))
+
+    def team_ref():
+        roll = rng.random()
+        if roll < 0.05:
+            return None
+        if roll < 0.07:
+            return teams + rng.randint(1, 10)   # ссылка на несуществующую команду
+        return rng.randint(1, teams)
+    yield "Workers", ["WorkerID", "Name", "Surname", "TeamRefID"], (
+        (i, rng.choice(FIRST_NAMES_RU), russian_surname(rng), team_ref()) for i in range(1, rows + 1))
+
+
+def _devops_productivity(rng, rows):
+    tools = 40
+    developers = max(rows // 100, 3)
+    yield "SoftwareTools", ["ToolID", "ToolName", "UsageArea"], (
+        (i, f"Tool {i}", rng.choice(["Code Management", "Project Planning", "Operations", "Development"]))
+        for i in range(1, tools + 1))
+    yield "Developers", ["DevID", "DevName", "Seniority"], (
+        (i, russian_full_name(rng), rng.choice(["Junior", "Middle", "Senior"])) for i in range(1, developers + 1))
+    developer = zipf_sampler(rng, developers)
+    tool = zipf_sampler(rng, tools, s=1.3)
+    yield "ActivityLog", ["LogID", "DevID", "ToolID", "LogDate", "Description"], (
+        (i, developer(), tool(), random_datetime(rng, 730), sentence(rng, 2, 6)) for i in range(1, rows + 1))
+
+
+def _employees_projects(rng, rows):
+    employees = max(rows // 2, 1)
+    yield "employees", ["employee_id", "employee_name", "department"], (
+        (i, russian_full_name(rng), rng.choice(DEPARTMENTS_RU)) for i in range(1, employees + 1))
+    # ~40% проектов без назначенного сотрудника
+    yield "projects", ["project_id", "project_name", "assigned_employee_id"], (
+        (i, f"Проект {i}", None if rng.random() < 0.4 else rng.randint(1, employees))
+        for i in range(1, rows + 1))
+
+
+def _game_stats_reports(rng, rows):
+    users = max(rows // 20, 10)
+    titles = 50
+    sessions = max(rows // 6, 1)
+    yield "Users", ["UserID", "Username", "JoinedDate"], (
+        (i, f"{rng.choice(NICKNAMES)}{i}", random_date(rng, 1095)) for i in range(1, users + 1))
+    yield "Titles", ["TitleID", "GameName"], (
+        ((1, "Cyber Arena"), (2, "Space Battle"), (3, "Mystic Quest"))
+        + tuple((i, f"Game {i}") for i in range(4, titles + 1)))
+    title = zipf_sampler(rng, titles)
+    yield "GameSessions", ["SessionID", "TitleRefID", "SessionTime"], (
+        (i, title(), random_date(rng, 730)) for i in range(1, sessions + 1))
+
+    player = zipf_sampler(rng, users)
+
+    def log_rows():
+        produced = 0
+        for session in cycle(range(1, sessions + 1)):
+            # Состав сессии: 2-10 игроков, популярные игроки встречаются чаще (Ципф)
+            lineup = list(dict.fromkeys(player() for _ in range(rng.randint(2, 10))))
+            scores = [max(0, int(rng.gauss(1000, 250))) for _ in lineup]
+            best = max(scores)
+            for user_id, score in zip(lineup, scores):
+                yield (session, user_id, score, rng.randint(0, 30), rng.randint(0, 25), int(score == best))
+                produced += 1
+                if produced == rows:
+                    return
+    yield "PerformanceLog", ["SessionRefID", "UserRefID", "FinalScore", "Frags", "Deaths", "IsVictory"], log_rows()
+
+
+def _hopeless_students(rng, rows):
+    students = max(rows // 5, 1)
+    yield "StudentsList", ["student_id", "full_name", "group_num"], (
+        (i, russian_full_name(rng), f"Группа {rng.randint(1, 40)}") for i in range(1, students + 1))
+    student = zipf_sampler(rng, students, s=0.9)
+    yield "SubmissionsLog", ["submission_pk", "assignment_code", "student_ref_id", "grade"], (
+        (i, f"A{rng.randint(1, 20)}", student(), round(rng.uniform(40, 100), 1)) for i in range(1, rows + 1))
+
+
+def _inventory_status(rng, rows):
+    codes = [0, 1, 2, 3, 99]
+    weights = [40, 20, 20, 15, 5]
+    yield "Items", ["item_id", "code_inventory"], (
+        (i, rng.choices(codes, weights)[0]) for i in range(1, rows + 1))
+
+
+def _literary_archive(rng, rows):
+    members = max(rows // 10, 1)
+    creators = max(rows // 1000, 10)
+    categories = ["Classic Literature", "Science Fiction", "Mystery", "Poetry", "History",
+                  "Biography", "Fantasy", "Drama", "Philosophy", "Travel"]
+    entries = max(rows // 20, 10)
+    yield "Members", ["member_id", "display_name", "login_email", "secure_hash", "join_date"], (
+        (i, f"Member {i}", f"member{i}@archive.com", f"hash_{i:x}", random_date(rng, 1095))
+        for i in range(1, members + 1))
+    yield "Creators", ["creator_id", "display_full_name", "year_born"], (
+        (i, f"Author {i}", rng.randint(1750, 1990)) for i in range(1, creators + 1))
+    yield "Categories", ["category_id", "category_title"], enumerate(categories, start=1)
+    creator = zipf_sampler(rng, creators)
+    yield "LibraryEntries", ["entry_id", "entry_title", "publication_year", "creator_ref_id", "category_ref_id"], (
+        (i, sentence(rng, 1, 4).rstrip("."), rng.randint(1800, 2024), creator(), rng.randint(1, len(categories)))
+        for i in range(1, entries + 1))
+    entry = zipf_sampler(rng, entries)
+    yield "UserFeedback", ["feedback_id", "member_ref_id", "entry_ref_id", "grade", "feedback_text", "feedback_date"], (
+        (i, rng.randint(1, members), entry(), rng.choices([1, 2, 3, 4, 5], [5, 10, 20, 35, 30])[0],
+         sentence(rng, 5, 20), random_date(rng, 730))
+        for i in range(1, rows + 1))
+
+
+def _product(rng, rows):
+    cities = list(CITIES)
+
+    def item(i, kind):
+        city = rng.choice(cities)
+        return i, f"{kind} item {i}", city, CITIES[city]
+    tech = rows // 2
+    yield "Tech_Inventory", ["Prod_ID", "Item_Name", "Mfg_City", "Mfg_Region"], (
+        item(i, "Tech") for i in range(1, tech + 1))
+    yield "Home_Inventory", ["Prod_ID", "Item_Name", "Mfg_City", "Mfg_Region"], (
+        item(i, "Home") for i in range(1, rows - tech + 1))
+
+
+def _service_cross_check(rng, rows):
+    yield "PlatformA_Users", ["PID", "Alias"], (
+        (i, f"user{i}") for i in bernoulli_ids(rng, 2 * rows, 0.5))
+    yield "PlatformB_Users", ["PID", "Alias"], (
+        (i, f"user{i}") for i in bernoulli_ids(rng, 2 * rows, 0.5))
+
+
+def _staff_division(rng, rows):
+    span = rows * 5 // 4
+
+    def worker_name(i):
+        return f"{FIRST_NAMES_RU[i % len(FIRST_NAMES_RU)]} {SURNAME_STEMS_RU[i % len(SURNAME_STEMS_RU)]}ов"
+
+    def division(i):
+        return DEPARTMENTS_RU[i % len(DEPARTMENTS_RU)]
+    yield "CurrentStaff", ["StaffID", "WorkerName", "Division"], (
+        (i, worker_name(i), division(i)) for i in bernoulli_ids(rng, span, 0.8))
+    # ~5% сотрудников в исторических записях числились в другом подразделении
+    yield "PastRecords", ["StaffID", "WorkerName", "Division"], (
+        (i, worker_name(i), division(i + 1) if rng.random() < 0.05 else division(i))
+        for i in bernoulli_ids(rng, span, 0.8))
+
+
+def _teachers_without_classes(rng, rows):
+    faculty = max(rows // 10, 1)
+    yield "Faculty", ["teacher_id", "full_name", "department"], (
+        (i, russian_full_name(rng), rng.choice(["Математика", "Физика", "История", "Информатика", "Химия"]))
+        for i in range(1, faculty + 1))
+    teacher = zipf_sampler(rng, faculty, s=0.9)
+    yield "ClassAssignments", ["assignment_id", "teacher_ref_id", "class_code", "semester"], (
+        (i, teacher(), f"CL{rng.randint(100, 999)}", f"{rng.choice(['Осень', 'Весна'])} {rng.randint(2020, 2025)}")
+        for i in range(1, rows + 1))
+
+
+def _transactions_list_total_sum(rng, rows):
+    clients = max(rows // 20, 3)
+    groups = 20
+    items = max(rows // 100, 10)
+    transactions = max(rows // 4, 1)
+    yield "Clients", ["client_pk", "full_name", "contact_email"], (
+        (i, russian_full_name(rng), f"client{i}@mail.com") for i in range(1, clients + 1))
+    yield "Groups", ["group_pk", "group_title"], ((i, f"Группа товаров {i}") for i in range(1, groups + 1))
+    yield "StoreItems", ["item_pk", "item_name", "unit_price", "group_ref_id"], (
+        (i, f"Товар {i}", money.to_minor(round(rng.lognormvariate(3.5, 1.0), 2)), rng.randint(1, groups)) for i in range(1, items + 1))
+    # "Горячие" клиенты делают непропорционально много заказов
+    client = zipf_sampler(rng, clients)
+    yield "Transactions", ["transaction_pk", "client_ref_id", "transaction_date"], (
+        (i, client(), random_date(rng, 1460)) for i in range(1, transactions + 1))
+    item = zipf_sampler(rng, items)
+    yield "TransactionDetails", ["detail_pk", "transaction_ref_id", "item_ref_id", "purchased_count"], (
+        (i, (i - 1) * transactions // rows + 1, item(), rng.randint(1, 5)) for i in range(1, rows + 1))
+
+
+GENERATORS = {
+    "academic_records": _academic_records,
+    "accounts report": _accounts_report,
+    "clients status": _clients_status,
+    "clients were weren’t": _clients_were_werent,
+    "company contacts": _company_contacts,
+    "company_records": _company_records,
+    "devops_productivity": _devops_productivity,
+    "employees_projects": _employees_projects,
+    "game stats reports": _game_stats_reports,
+    "hopeless students": _hopeless_students,
+    "inventory status": _inventory_status,
+    "literary_archive": _literary_archive,
+    "product": _product,
+    "service_cross_check": _service_cross_check,
+    "staff division": _staff_division,
+    "teachers without classes": _teachers_without_classes,
+    "transactions list total sum": _transactions_list_total_sum,
+}
+
+
+def generate(key, db_file, rows, seed=DEFAULT_SEED, batch_size=ingest.DEFAULT_BATCH_SIZE):
+    """
+    Пересоздает БД отчета key по его миграциям и заполняет ее примерно rows
+    строками основной таблицы. Одинаковые seed и rows дают одинаковые данные.
+    Возвращает список IngestStats по таблицам.
+    """
+    module = reports.load_module(reports.find(key))
+    conn = migrations.open_database(db_file, module.MIGRATIONS, rebuild=True)
+    rng = random.Random(seed)
+    results = []
+    try:
+        for table, columns, table_rows in GENERATORS[key](rng, rows):
+            results.append(ingest.bulk_insert(conn, table, columns, table_rows, batch_size=batch_size))
+    finally:
+        connection.release(conn)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных для схем отчетов")
+    parser.add_argument("report", nargs="?", help="Ключ отчета (имя скрипта без .py)")
+    parser.add_argument("database", nargs="?", help="Файл БД для заполнения (пересоздается)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Размер основной таблицы")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--all", metavar="DIR", help="Сгенерировать все схемы в каталог DIR")
+    args = parser.parse_args(argv)
+
+    if args.all:
+        os.makedirs(args.all, exist_ok=True)
+        targets = [(key, os.path.join(args.all, f"{key}.db")) for key in GENERATORS]
+    elif args.report and args.database:
+        targets = [(args.report, args.database)]
+    else:
+        parser.error("нужно указать отчет и файл БД либо --all DIR")
+
+    for key, db_file in targets:
+        print(f"--- {key} -> {db_file}")
+        for stats in generate(key, db_file, args.rows, seed=args.seed):
+            print(f"    {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# Симметричная разница двух таблиц за один проход слиянием по первичному ключу,
+# с хэшами диапазонов ключей (в духе дерева Меркла): совпавшие диапазоны не читаются
+import hashlib
+import os
+import sqlite3
+from dataclasses import dataclass
+
+# Ширина диапазона ключей, для которого хранится хэш
+DEFAULT_RANGE_SIZE = 1024
+# Хэши диапазонов и диапазоны, которые нужно пересчитать (помечают триггеры)
+RANGES_TABLE = "diff_ranges"
+DIRTY_TABLE = "diff_dirty_ranges"
+# Таблицы, для которых хэши ведутся (есть триггеры), и ширина их диапазонов
+HASHED_TABLE = "diff_hashed_tables"
+
+_TABLES_SQL = f"""
+CREATE TABLE IF NOT EXISTS {RANGES_TABLE} (
+    table_name TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (table_name, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} (
+    table_name TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    PRIMARY KEY (table_name, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS {HASHED_TABLE} (
+    table_name TEXT PRIMARY KEY,
+    range_size INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class SymmetricDiff:
+    """
+    Разница left и right: строки только слева, только справа и пары
+    (слева, справа) с одинаковым ключом и разными столбцами - по возрастанию ключа.
+    ranges - сколько диапазонов сравнивалось, skipped - сколько пропущено по хэшу.
+    """
+    only_left: list
+    only_right: list
+    changed: list
+    ranges: int = 0
+    skipped: int = 0
+
+
+@dataclass(frozen=True)
+class RangeHashes:
+    """
+    Хэши строк таблицы по диапазонам целочисленного первичного ключа:
+    диапазон номер b - ключи [b * range_size, (b + 1) * range_size).
+    Диапазоны выровнены одинаково в любой БД, поэтому хэши таблиц из разных
+    файлов сравниваются напрямую. Хэши хранятся в БД; триггеры помечают
+    измененные диапазоны, и refresh() пересчитывает только их. Хранимым
+    хэшам верят, только если таблица отмечена в diff_hashed_tables с той
+    же шириной диапазона; иначе хэши считаются заново по всей таблице.
+    """
+    table: str
+    key: str
+    columns: tuple
+    range_size: int = DEFAULT_RANGE_SIZE
+
+    def _bucket(self, value):
+        # Деление с округлением вниз и для отрицательных ключей (в SQLite "/" отбрасывает дробь)
+        return (f"CASE WHEN {value} >= 0 THEN {value} / {self.range_size} "
+                f"ELSE ({value} - {self.range_size - 1}) / {self.range_size} END")
+
+    def script(self):
+        """SQL-скрипт для шага миграции: таблицы хэшей, триггеры, пометка всех диапазонов и отметка таблицы."""
+        mark = f"INSERT OR IGNORE INTO {DIRTY_TABLE} (table_name, bucket) VALUES ('{self.table}', "
+        return _TABLES_SQL + f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_ranges_insert AFTER INSERT ON {self.table}
+    BEGIN
+        {mark}{self._bucket(f"new.{self.key}")});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_ranges_update AFTER UPDATE ON {self.table}
+    BEGIN
+        {mark}{self._bucket(f"old.{self.key}")});
+        {mark}{self._bucket(f"new.{self.key}")});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{self.table}_ranges_delete AFTER DELETE ON {self.table}
+    BEGIN
+        {mark}{self._bucket(f"old.{self.key}")});
+    END;
+
+    DELETE FROM {RANGES_TABLE} WHERE table_name = '{self.table}';
+
+    INSERT OR IGNORE INTO {DIRTY_TABLE} (table_name, bucket)
+    SELECT DISTINCT '{self.table}', {self._bucket(self.key)} FROM {self.table};
+
+    INSERT OR REPLACE INTO {HASHED_TABLE} (table_name, range_size) VALUES ('{self.table}', {self.range_size});
+    """
+
+    def rows(self, conn, bucket):
+        """Строки (ключ, столбцы...) диапазона bucket по возрастанию ключа."""
+        return conn.execute(f"""
+        SELECT {self.key}, {", ".join(self.columns)} FROM {self.table}
+        WHERE {self.key} >= ? AND {self.key} < ?
+        ORDER BY {self.key};
+        """, (bucket * self.range_size, (bucket + 1) * self.range_size)).fetchall()
+
+    def range_digest(self, conn, bucket):
+        """
+        (строк, хэш) диапазона bucket или None для пустого. Строки собираются в
+        текст внутри SQLite (quote() каждого значения - с типом), Python хэширует
+        одну строку на диапазон. Порядок склейки задает окно ORDER BY ключа:
+        порядок group_concat по подзапросу с ORDER BY SQLite не гарантирует.
+        Хэш зависит только от значений, а не от имени таблицы; REAL
+        сравниваются с точностью quote().
+        """
+        values = " || ',' || ".join(f"quote({column})" for column in (self.key, *self.columns))
+        row = conn.execute(f"""
+        SELECT COUNT(*) OVER Bucket, group_concat({values}, char(10)) OVER Bucket
+        FROM {self.table}
+        WHERE {self.key} >= ? AND {self.key} < ?
+        WINDOW Bucket AS (ORDER BY {self.key} ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        LIMIT 1;
+        """, (bucket * self.range_size, (bucket + 1) * self.range_size)).fetchone()
+        if row is None:
+            return None
+        rows, text = row
+        return rows, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _is_hashed(self, conn):
+        """Ведутся ли в БД хэши этой таблицы с той же шириной диапазона."""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (HASHED_TABLE,)).fetchone()
+        return exists is not None and conn.execute(
+            f"SELECT 1 FROM {HASHED_TABLE} WHERE table_name = ? AND range_size = ?;",
+            (self.table, self.range_size)).fetchone() is not None
+
+    def _dirty(self, conn):
+        return [bucket for (bucket,) in conn.execute(
+            f"SELECT bucket FROM {DIRTY_TABLE} WHERE table_name = ? ORDER BY bucket;", (self.table,))]
+
+    def _all_buckets(self, conn):
+        return [bucket for (bucket,) in conn.execute(
+            f"SELECT DISTINCT {self._bucket(self.key)} FROM {self.table};")]
+
+    def digests(self, conn):
+        """
+        {диапазон: (строк, хэш)} без записи в БД: сохраненные хэши, а для
+        помеченных диапазонов - посчитанные заново. Подходит и для файла,
+        открытого только для чтения; если хэши таблицы в БД не ведутся,
+        считаются все диапазоны.
+        """
+        if self._is_hashed(conn):
+            digests = {bucket: (rows, digest) for bucket, rows, digest in conn.execute(
+                f"SELECT bucket, rows, digest FROM {RANGES_TABLE} WHERE table_name = ?;", (self.table,))}
+            buckets = self._dirty(conn)
+        else:
+            digests, buckets = {}, self._all_buckets(conn)
+        for bucket in buckets:
+            digest = self.range_digest(conn, bucket)
+            if digest:
+                digests[bucket] = digest
+            else:
+                digests.pop(bucket, None)
+        return digests
+
+    def refresh(self, conn):
+        """
+        Пересчитывает и сохраняет хэши помеченных диапазонов. Возвращает их
+        число. Без отметки таблицы (script() не применен) ничего не делает.
+        """
+        if not self._is_hashed(conn):
+            return 0
+        conn.execute("BEGIN;")
+        try:
+            dirty = self._dirty(conn)
+            for bucket in dirty:
+                digest = self.range_digest(conn, bucket)
+                if digest:
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO {RANGES_TABLE} (table_name, bucket, rows, digest) VALUES (?, ?, ?, ?);",
+                        (self.table, bucket, *digest))
+                else:
+                    conn.execute(f"DELETE FROM {RANGES_TABLE} WHERE table_name = ? AND bucket = ?;",
+                                 (self.table, bucket))
+            conn.execute(f"DELETE FROM {DIRTY_TABLE} WHERE table_name = ?;", (self.table,))
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return len(dirty)
+
+
+def open_snapshot(path):
+    """Соединение только для чтения с другим файлом БД (например, вчерашним снимком)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Файл БД не найден: {path}")
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def merge_rows(left_rows, right_rows, diff):
+    """Слияние двух упорядоченных по ключу списков строк с дописыванием разницы в diff."""
+    i = j = 0
+    while i < len(left_rows) and j < len(right_rows):
+        left, right = left_rows[i], right_rows[j]
+        if left[0] < right[0]:
+            diff.only_left.append(left)
+            i += 1
+        elif left[0] > right[0]:
+            diff.only_right.append(right)
+            j += 1
+        else:
+            if tuple(left) != tuple(right):
+                diff.changed.append((left, right))
+            i += 1
+            j += 1
+    diff.only_left.extend(left_rows[i:])
+    diff.only_right.extend(right_rows[j:])
+
+
+def symmetric_diff(left_conn, left, right_conn, right):
+    """
+    Обе стороны разницы и измененные строки за один проход. left и right -
+    RangeHashes таблиц с одинаковыми столбцами и range_size; соединения могут
+    быть одним (таблицы в одной БД) или разными (два файла). Диапазоны с
+    одинаковыми хэшами пропускаются, остальные читаются поиском по ключу
+    и сливаются по возрастанию ключа.
+    """
+    if left.range_size != right.range_size:
+        raise ValueError("Для сравнения хэшей диапазоны должны быть одной ширины")
+    left_digests, right_digests = left.digests(left_conn), right.digests(right_conn)
+    diff = SymmetricDiff([], [], [])
+    for bucket in sorted(left_digests.keys() | right_digests.keys()):
+        diff.ranges += 1
+        if left_digests.get(bucket) == right_digests.get(bucket):
+            diff.skipped += 1
+            continue
+        left_rows = left.rows(left_conn, bucket) if bucket in left_digests else []
+        right_rows = right.rows(right_conn, bucket) if bucket in right_digests else []
+        merge_rows(left_rows, right_rows, diff)
+    return diff
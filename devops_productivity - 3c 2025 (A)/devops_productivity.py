@@ -1,42 +1,106 @@
 # Импорт необходимых модулей
+import argparse
 import sqlite3
 import os
+import sys
+from datetime import date, timedelta
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, ingest, migrations, output
 
 # --- Константы Базы Данных ---
 DB_FILE = "devops_productivity.db"
 TABLE_DEVS = "Developers"           # Таблица разработчиков
 TABLE_TOOLS = "SoftwareTools"       # Таблица программных инструментов (аналог 'Sessions')
 TABLE_LOGS = "ActivityLog"          # Таблица журнала активности (аналог 'Tickets')
+TABLE_USAGE = "DevToolUsage"        # Сводка использования инструментов по разработчикам
 
-def initialize_db(db_path):
-    """Устанавливает соединение, удаляет старый файл и создает новую схему."""
-    if os.path.exists(db_path):
-        os.remove(db_path)
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def usage_script():
+    """
+    SQL-скрипт для шага миграции: сводка (DevID, ToolID) -> первое и последнее
+    использование и число записей, триггеры журнала и заполнение по уже
+    загруженным записям. Записи без DevID или ToolID в сводку не попадают.
+    """
+    def add(row):
+        return f"""
+        INSERT INTO {TABLE_USAGE} (DevID, ToolID, first_seen, last_seen, uses)
+        SELECT {row}.DevID, {row}.ToolID, {row}.LogDate, {row}.LogDate, 1
+        WHERE {row}.DevID IS NOT NULL AND {row}.ToolID IS NOT NULL
+        ON CONFLICT (DevID, ToolID) DO UPDATE SET
+            first_seen = coalesce(min(first_seen, excluded.first_seen), first_seen, excluded.first_seen),
+            last_seen = coalesce(max(last_seen, excluded.last_seen), last_seen, excluded.last_seen),
+            uses = uses + 1;"""
+
+    def remove(row):
+        # Границы пересчитываются по журналу, только если удалена крайняя дата
+        key = f"DevID = {row}.DevID AND ToolID = {row}.ToolID"
+        return f"""
+        UPDATE {TABLE_USAGE} SET uses = uses - 1 WHERE {key};
+        DELETE FROM {TABLE_USAGE} WHERE {key} AND uses = 0;
+        UPDATE {TABLE_USAGE} SET (first_seen, last_seen) = (
+            SELECT MIN(LogDate), MAX(LogDate) FROM {TABLE_LOGS} WHERE {key}
+        )
+        WHERE {key} AND (first_seen IS {row}.LogDate OR last_seen IS {row}.LogDate);"""
+
+    return f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_USAGE} (
+        DevID INTEGER NOT NULL,
+        ToolID INTEGER NOT NULL,
+        first_seen TEXT,
+        last_seen TEXT,
+        uses INTEGER NOT NULL,
+        PRIMARY KEY (DevID, ToolID)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{TABLE_LOGS}_usage_insert AFTER INSERT ON {TABLE_LOGS}
+    BEGIN{add("new")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{TABLE_LOGS}_usage_update AFTER UPDATE OF DevID, ToolID, LogDate ON {TABLE_LOGS}
+    BEGIN{remove("old")}{add("new")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_{TABLE_LOGS}_usage_delete AFTER DELETE ON {TABLE_LOGS}
+    BEGIN{remove("old")}
+    END;
+
+    INSERT INTO {TABLE_USAGE} (DevID, ToolID, first_seen, last_seen, uses)
+    SELECT DevID, ToolID, MIN(LogDate), MAX(LogDate), COUNT(*)
+    FROM {TABLE_LOGS}
+    WHERE DevID IS NOT NULL AND ToolID IS NOT NULL
+    GROUP BY DevID, ToolID;
+    """
 
-    # 1. Создаем таблицу инструментов
-    cursor.execute("""
-    CREATE TABLE SoftwareTools (
+# Разработчики, использовавшие не менее ? различных инструментов начиная с даты ?
+# (NULL - за все время). Читается только сводка, в порядке ее первичного ключа.
+MULTI_TOOL_DEVS_SQL = f"""
+    SELECT DevID, COUNT(*) AS tools
+    FROM {TABLE_USAGE}
+    WHERE ?2 IS NULL OR last_seen >= ?2
+    GROUP BY DevID
+    HAVING COUNT(*) >= ?1
+"""
+
+# --- Миграции схемы ---
+MIGRATIONS = [
+    (1, "Таблицы инструментов, разработчиков и журнала активности", f"""
+    -- 1. Таблица инструментов
+    CREATE TABLE IF NOT EXISTS SoftwareTools (
         ToolID INTEGER PRIMARY KEY,
         ToolName TEXT NOT NULL,
         UsageArea TEXT
     );
-    """)
 
-    # 2. Создаем таблицу разработчиков
-    cursor.execute("""
-    CREATE TABLE Developers (
+    -- 2. Таблица разработчиков
+    CREATE TABLE IF NOT EXISTS Developers (
         DevID INTEGER PRIMARY KEY,
         DevName TEXT NOT NULL,
         Seniority TEXT
     );
-    """)
 
-    # 3. Создаем таблицу журнала активности (логи использования инструментов)
-    cursor.execute(f"""
-    CREATE TABLE {TABLE_LOGS} (
+    -- 3. Таблица журнала активности (логи использования инструментов)
+    CREATE TABLE IF NOT EXISTS {TABLE_LOGS} (
         LogID INTEGER PRIMARY KEY,
         DevID INTEGER,
         ToolID INTEGER,
@@ -45,8 +109,15 @@ def initialize_db(db_path):
         FOREIGN KEY (DevID) REFERENCES Developers(DevID),
         FOREIGN KEY (ToolID) REFERENCES SoftwareTools(ToolID)
     );
-    """)
-    conn.commit()
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+    (3, f"Сводка {TABLE_USAGE} по разработчикам и инструментам", usage_script()),
+]
+
+def initialize_db(db_path):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+    conn = migrations.open_database(db_path, MIGRATIONS)
+    cursor = conn.cursor()
     return conn, cursor
 
 def populate_data(cursor, conn):
@@ -85,60 +156,95 @@ def populate_data(cursor, conn):
     cursor.executemany("INSERT INTO ActivityLog VALUES (?, ?, ?, ?, ?);", logs)
     conn.commit()
 
-def run_multi_tool_devs_query(cursor):
+# Столбцы журнала активности во входных файлах (LogID назначается автоматически)
+ACTIVITY_LOG_COLUMNS = ["DevID", "ToolID", "LogDate", "Description"]
+
+def ingest_activity_log(conn, path, batch_size=ingest.DEFAULT_BATCH_SIZE):
+    """Потоково загружает журнал активности из CSV/JSONL-файла пачками в транзакциях."""
+    stats = ingest.ingest_file(conn, TABLE_LOGS, path, ACTIVITY_LOG_COLUMNS,
+                               batch_size=batch_size)
+    print(f"Загружено из {path}: {stats}")
+    return stats
+
+def window_start(days, today=None):
+    """Начало окна из days последних дней, включая сегодняшний ('YYYY-MM-DD 00:00:00'), или None."""
+    if days is None:
+        return None
+    return f"{(today or date.today()) - timedelta(days=days - 1)} 00:00:00"
+
+def multi_tool_devs(conn, min_tools=2, days=None):
+    """[(DevID, число инструментов)] - разработчики с min_tools и более инструментами за days последних дней."""
+    return conn.execute(MULTI_TOOL_DEVS_SQL + ";", (min_tools, window_start(days))).fetchall()
+
+def run_multi_tool_devs_query(cursor, min_tools=2, days=None):
     """
-    Выполняет аналитический запрос: находит разработчиков, 
-    которые использовали не менее 2 различных программных инструментов.
+    Выполняет аналитический запрос: находит разработчиков, которые использовали
+    не менее min_tools различных программных инструментов (за days последних
+    дней или за все время), и выводит их записи журнала за тот же период.
+    Разработчики отбираются по сводке, журнал читается только по ним.
     """
-    
+    since = window_start(days)
     cursor.execute(f"""
+    WITH MultiToolDevs AS ({MULTI_TOOL_DEVS_SQL})
     SELECT 
         d.DevName,
         d.Seniority,
         t.ToolName,
         l.LogDate,
         l.Description
-    FROM {TABLE_LOGS} l
+    FROM MultiToolDevs m
+    JOIN {TABLE_LOGS} l ON l.DevID = m.DevID
     JOIN Developers d ON l.DevID = d.DevID
     JOIN SoftwareTools t ON l.ToolID = t.ToolID
-    WHERE l.DevID IN (
-        -- Подзапрос находит DevID, у которых COUNT(DISTINCT ToolID) >= 2
-        SELECT DevID
-        FROM {TABLE_LOGS}
-        GROUP BY DevID
-        HAVING COUNT(DISTINCT ToolID) >= 2
-    )
+    WHERE ?2 IS NULL OR l.LogDate >= ?2
     ORDER BY d.DevName, l.LogDate;
-    """)
+    """, (min_tools, since))
 
     # Вывод результатов
-    print("Разработчики, активно использующие не менее двух различных инструментов:")
+    period = f" за последние {days} дн." if days is not None else ""
+    print(f"Разработчики, активно использующие не менее {min_tools} различных инструментов{period}:")
     print("=" * 100)
     
-    results = cursor.fetchall()
-    if results:
-        # Форматированный вывод
-        print(f"{'Разработчик':<15} | {'Уровень':<8} | {'Инструмент':<25} | {'Дата лога':<20} | {'Описание'}")
-        print("-" * 100)
-        for row in results:
-            print(f"{row[0]:<15} | {row[1]:<8} | {row[2]:<25} | {row[3]:<20} | {row[4]}")
-    else:
-        print("Не найдено разработчиков, использующих два и более уникальных инструмента.")
+    # Форматированный вывод; заголовок таблицы - только если есть строки
+    output.print_rows(
+        cursor,
+        lambda row: f"{row[0]:<15} | {row[1]:<8} | {row[2]:<25} | {row[3]:<20} | {row[4]}",
+        header=[
+            f"{'Разработчик':<15} | {'Уровень':<8} | {'Инструмент':<25} | {'Дата лога':<20} | {'Описание'}",
+            "-" * 100,
+        ],
+        empty=f"Не найдено разработчиков, использующих {min_tools} и более уникальных инструмента.",
+    )
     print("=" * 100)
 
 
 def audit_dev_metrics():
     """Основная функция для запуска аудита."""
+    parser = argparse.ArgumentParser(description="Разработчики, использующие несколько инструментов")
+    parser.add_argument("files", nargs="*", metavar="ФАЙЛ",
+                        help="Дополнительные файлы журнала активности (CSV/JSONL)")
+    parser.add_argument("--min-tools", type=int, default=2, help="Минимум различных инструментов")
+    parser.add_argument("--days", type=int, help="Учитывать только последние N дней")
+    args = parser.parse_args()
+    if args.days is not None and args.days < 1:
+        parser.error("--days должно быть положительным")
+
     conn = None
     try:
         conn, cursor = initialize_db(DB_FILE)
-        populate_data(cursor, conn)
-        run_multi_tool_devs_query(cursor)
+        # Тестовые данные загружаются только в пустую БД
+        if migrations.is_empty(conn, TABLE_DEVS):
+            populate_data(cursor, conn)
+        # Дополнительные файлы журнала активности: аргументы командной строки
+        for path in args.files:
+            ingest_activity_log(conn, path)
+        connection.apply_profile(conn, "read-report")
+        run_multi_tool_devs_query(cursor, args.min_tools, args.days)
     except sqlite3.Error as e:
         print(f"Ошибка БД: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     audit_dev_metrics()
\ No newline at end of file
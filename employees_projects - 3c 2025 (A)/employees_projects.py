@@ -3,35 +3,36 @@ import sqlite3
 import os
 import sys
 
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, migrations, output
+
 # Глобальная константа для названия файла базы данных
 DB_FILENAME = "employees_projects.db"
 
-def initialize_database(db_file):
-    """Устанавливает соединение и создает таблицы 'employees' и 'projects'."""
-    
-    # Очистка среды: удаление старых файлов
-    if os.path.exists(db_file):
-        os.remove(db_file)
-
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-
-    # Скрипт создания таблиц с исправленной ошибкой PRIMARY KEY
-    cursor.executescript("""
-    CREATE TABLE employees (
+# Миграции схемы (шаги применяются по порядку, каждый - один раз)
+MIGRATIONS = [
+    (1, "Таблицы employees и projects", """
+    CREATE TABLE IF NOT EXISTS employees (
         employee_id INTEGER PRIMARY KEY,
         employee_name TEXT NOT NULL,
         department TEXT
     );
 
-    CREATE TABLE projects (
+    CREATE TABLE IF NOT EXISTS projects (
         project_id INTEGER PRIMARY KEY,
         project_name TEXT NOT NULL,
         assigned_employee_id INTEGER,
         FOREIGN KEY (assigned_employee_id) REFERENCES employees(employee_id)
     );
-    """)
-    conn.commit()
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+]
+
+def initialize_database(db_file):
+    """Открывает существующую БД и доводит схему 'employees'/'projects' до актуальной версии."""
+    conn = migrations.open_database(db_file, MIGRATIONS)
+    cursor = conn.cursor()
     return conn, cursor
 
 def populate_initial_data(cursor, conn):
@@ -69,7 +70,6 @@ def print_report_results(cursor, title, sql_query, headers):
     
     try:
         cursor.execute(sql_query)
-        results = cursor.fetchall()
         
         # Печать заголовков
         header_line = f"| {' | '.join(h.ljust(len(h)) for h in headers)}"
@@ -77,14 +77,16 @@ def print_report_results(cursor, title, sql_query, headers):
         print("-" * 90)
         
         # Вывод данных
-        for row in results:
+        def format_row(row):
             formatted_row = []
             for item in row:
                 s = 'НЕТ' if item is None else str(item)
                 formatted_row.append(s)
             
             # предположение, что вывод в консоль не требует сложного выравнивания
-            print(f"| {' | '.join(formatted_row)}") 
+            return f"| {' | '.join(formatted_row)}"
+        
+        output.print_rows(cursor, format_row)
             
     except sqlite3.Error as e:
         print(f"Критическая ОШИБКА SQL: {e}")
@@ -95,7 +97,10 @@ def generate_hr_report():
     """Главная функция, которая запускает все этапы отчета."""
     
     conn, cursor = initialize_database(DB_FILENAME)
-    populate_initial_data(cursor, conn)
+    # Тестовые данные загружаются только в пустую БД
+    if migrations.is_empty(conn, "employees"):
+        populate_initial_data(cursor, conn)
+    connection.apply_profile(conn, "read-report")
 
     # ----------------------------------------------------------------------
     # Запрос 1: Все сотрудники и проекты, в которых они участвуют (включая сотрудников без проектов)
@@ -198,7 +203,7 @@ def generate_hr_report():
         ["Сотрудник", "Проект"]
     )
 
-    conn.close()
+    connection.release(conn)
 
 if __name__ == "__main__":
     generate_hr_report()
\ No newline at end of file
@@ -1,18 +1,21 @@
-import sqlite3
+import argparse
 import os
-from datetime import datetime
+import sys
+import tempfile
+import time
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import cache, connection, index_advisor, ingest, migrations, output, synthetic
 
 # --- 1. Настройка и подключение к базе данных ---
 
 def initialize_db(db_name="game stats reports.db"):
     """
-    Устанавливает соединение с БД и очищает среду, удаляя старые таблицы 
-    и обеспечивая чистый запуск.
+    Устанавливает соединение с существующей БД (файл создается при первом запуске).
+    Накопленные данные сохраняются между запусками.
     """
-    if os.path.exists(db_name):
-        os.remove(db_name)
-
-    conn = sqlite3.connect(db_name)
+    conn = connection.connect(db_name, "bulk-load")
     cursor = conn.cursor()
     # Активация внешних ключей
     cursor.execute("PRAGMA foreign_keys = ON;")
@@ -21,35 +24,145 @@ def initialize_db(db_name="game stats reports.db"):
 
 # --- 2. Создание структуры (Схемы) ---
 
-def create_game_schema(cursor):
-    """Определяет структуру всех таблиц для хранения статистики."""
-    
-    # Сначала удаляем, чтобы избежать конфликтов при повторном запуске (хотя файл удаляется)
-    cursor.executescript("""
-    DROP TABLE IF EXISTS PerformanceLog;
-    DROP TABLE IF EXISTS GameSessions;
-    DROP TABLE IF EXISTS Users;
-    DROP TABLE IF EXISTS Titles;
-
-    CREATE TABLE Users (
+# --- Агрегаты по игрокам и играм ---
+# Накопительные суммы вместо пересчета по всему PerformanceLog. UserStats
+# хранит и сумму K/D по записям с Deaths > 0 (kd_sum/kd_count), чтобы
+# средний K/D считался так же, как AVG(Frags / NULLIF(Deaths, 0)).
+ROLLUP_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS UserStats (
+    UserRefID INTEGER PRIMARY KEY,
+    entries INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    frags INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    kd_sum REAL NOT NULL,
+    kd_count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS TitleStats (
+    TitleRefID INTEGER PRIMARY KEY,
+    sessions INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    frags INTEGER NOT NULL,
+    deaths INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS UserTitleStats (
+    UserRefID INTEGER NOT NULL,
+    TitleRefID INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    frags INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    PRIMARY KEY (UserRefID, TitleRefID)
+) WITHOUT ROWID;
+"""
+
+# Пересчет агрегатов с нуля по журналу (начальное заполнение и восстановление)
+ROLLUP_REBUILD_SQL = """
+DELETE FROM UserStats;
+DELETE FROM TitleStats;
+DELETE FROM UserTitleStats;
+
+INSERT INTO UserStats (UserRefID, entries, score_sum, wins, frags, deaths, kd_sum, kd_count)
+SELECT 
+    UserRefID, COUNT(*), SUM(FinalScore), SUM(IsVictory = 1), SUM(Frags), SUM(Deaths),
+    TOTAL(CAST(Frags AS REAL) / NULLIF(Deaths, 0)), COUNT(NULLIF(Deaths, 0))
+FROM PerformanceLog
+GROUP BY UserRefID;
+
+INSERT INTO TitleStats (TitleRefID, sessions, entries, score_sum, wins, frags, deaths)
+SELECT 
+    GS.TitleRefID, COUNT(DISTINCT GS.SessionID), COUNT(PL.LogID), IFNULL(SUM(PL.FinalScore), 0),
+    IFNULL(SUM(PL.IsVictory = 1), 0), IFNULL(SUM(PL.Frags), 0), IFNULL(SUM(PL.Deaths), 0)
+FROM GameSessions GS
+LEFT JOIN PerformanceLog PL ON PL.SessionRefID = GS.SessionID
+GROUP BY GS.TitleRefID;
+
+INSERT INTO UserTitleStats (UserRefID, TitleRefID, entries, score_sum, wins, frags, deaths)
+SELECT 
+    PL.UserRefID, GS.TitleRefID, COUNT(*), SUM(PL.FinalScore), SUM(PL.IsVictory = 1),
+    SUM(PL.Frags), SUM(PL.Deaths)
+FROM PerformanceLog PL
+JOIN GameSessions GS ON GS.SessionID = PL.SessionRefID
+GROUP BY PL.UserRefID, GS.TitleRefID;
+"""
+
+# Журнал только пополняется, поэтому агрегаты ведутся триггерами на вставку
+ROLLUP_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_GameSessions_rollup AFTER INSERT ON GameSessions
+BEGIN
+    INSERT INTO TitleStats (TitleRefID, sessions, entries, score_sum, wins, frags, deaths)
+    VALUES (new.TitleRefID, 1, 0, 0, 0, 0, 0)
+    ON CONFLICT (TitleRefID) DO UPDATE SET sessions = sessions + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_PerformanceLog_rollup AFTER INSERT ON PerformanceLog
+BEGIN
+    INSERT INTO UserStats (UserRefID, entries, score_sum, wins, frags, deaths, kd_sum, kd_count)
+    VALUES (new.UserRefID, 1, new.FinalScore, new.IsVictory = 1, new.Frags, new.Deaths,
+            COALESCE(CAST(new.Frags AS REAL) / NULLIF(new.Deaths, 0), 0.0), new.Deaths != 0)
+    ON CONFLICT (UserRefID) DO UPDATE SET 
+        entries = entries + 1,
+        score_sum = score_sum + excluded.score_sum,
+        wins = wins + excluded.wins,
+        frags = frags + excluded.frags,
+        deaths = deaths + excluded.deaths,
+        kd_sum = kd_sum + excluded.kd_sum,
+        kd_count = kd_count + excluded.kd_count;
+
+    INSERT INTO TitleStats (TitleRefID, sessions, entries, score_sum, wins, frags, deaths)
+    SELECT TitleRefID, 0, 1, new.FinalScore, new.IsVictory = 1, new.Frags, new.Deaths
+    FROM GameSessions WHERE SessionID = new.SessionRefID
+    ON CONFLICT (TitleRefID) DO UPDATE SET 
+        entries = entries + 1,
+        score_sum = score_sum + excluded.score_sum,
+        wins = wins + excluded.wins,
+        frags = frags + excluded.frags,
+        deaths = deaths + excluded.deaths;
+
+    INSERT INTO UserTitleStats (UserRefID, TitleRefID, entries, score_sum, wins, frags, deaths)
+    SELECT new.UserRefID, TitleRefID, 1, new.FinalScore, new.IsVictory = 1, new.Frags, new.Deaths
+    FROM GameSessions WHERE SessionID = new.SessionRefID
+    ON CONFLICT (UserRefID, TitleRefID) DO UPDATE SET 
+        entries = entries + 1,
+        score_sum = score_sum + excluded.score_sum,
+        wins = wins + excluded.wins,
+        frags = frags + excluded.frags,
+        deaths = deaths + excluded.deaths;
+END;
+"""
+
+# Таблицы, в которые пишет код отчета и загрузка, и агрегаты, которые ведут триггеры
+BASE_TABLES = ["Users", "Titles", "GameSessions", "PerformanceLog"]
+ROLLUP_TABLES = ["UserStats", "TitleStats", "UserTitleStats"]
+
+# Шаги миграций: применяются по порядку, каждый ровно один раз
+MIGRATIONS = [
+    (1, "Таблицы Users, Titles, GameSessions и PerformanceLog", """
+    CREATE TABLE IF NOT EXISTS Users (
         UserID INTEGER PRIMARY KEY AUTOINCREMENT,
         Username TEXT NOT NULL,
         JoinedDate TEXT NOT NULL
     );
 
-    CREATE TABLE Titles (
+    CREATE TABLE IF NOT EXISTS Titles (
         TitleID INTEGER PRIMARY KEY AUTOINCREMENT,
         GameName TEXT NOT NULL
     );
 
-    CREATE TABLE GameSessions (
+    CREATE TABLE IF NOT EXISTS GameSessions (
         SessionID INTEGER PRIMARY KEY AUTOINCREMENT,
         TitleRefID INTEGER NOT NULL,
         SessionTime TEXT NOT NULL,
         FOREIGN KEY (TitleRefID) REFERENCES Titles(TitleID)
     );
 
-    CREATE TABLE PerformanceLog (
+    CREATE TABLE IF NOT EXISTS PerformanceLog (
         LogID INTEGER PRIMARY KEY AUTOINCREMENT,
         SessionRefID INTEGER NOT NULL,
         UserRefID INTEGER NOT NULL,
@@ -60,8 +173,47 @@ def create_game_schema(cursor):
         FOREIGN KEY (SessionRefID) REFERENCES GameSessions(SessionID),
         FOREIGN KEY (UserRefID) REFERENCES Users(UserID)
     );
-    """)
-    print("Структура БД для игровой платформы создана.")
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+    (3, "Счетчики изменений таблиц для кэша результатов", cache.change_counter_script(BASE_TABLES)),
+    (4, "Агрегаты UserStats, TitleStats и UserTitleStats с триггерами",
+     ROLLUP_TABLES_SQL + ROLLUP_REBUILD_SQL + ROLLUP_TRIGGERS_SQL),
+    # Выражения в индексах совпадают с LEADERBOARD_METRICS: топ-K читается по индексу
+    (5, "Индексы для рейтингов игроков", """
+    CREATE INDEX IF NOT EXISTS idx_UserStats_score ON UserStats (score_sum);
+    CREATE INDEX IF NOT EXISTS idx_UserStats_kd ON UserStats ((CAST(frags AS REAL) / NULLIF(deaths, 0)));
+    CREATE INDEX IF NOT EXISTS idx_UserStats_winrate ON UserStats ((CAST(wins AS REAL) / entries));
+    CREATE INDEX IF NOT EXISTS idx_UserStats_avg_kd ON UserStats ((kd_sum / NULLIF(kd_count, 0)));
+    CREATE INDEX IF NOT EXISTS idx_UserTitleStats_score ON UserTitleStats (TitleRefID, score_sum);
+    CREATE INDEX IF NOT EXISTS idx_UserTitleStats_kd
+        ON UserTitleStats (TitleRefID, (CAST(frags AS REAL) / NULLIF(deaths, 0)));
+    CREATE INDEX IF NOT EXISTS idx_UserTitleStats_winrate
+        ON UserTitleStats (TitleRefID, (CAST(wins AS REAL) / entries));
+    CREATE INDEX IF NOT EXISTS idx_GameSessions_SessionTime ON GameSessions (SessionTime, TitleRefID);
+    """),
+    # Счетчики отмечает пишущий код (cache.record_changes), агрегаты - без счетчиков
+    (6, "Счетчики изменений без построчных триггеров",
+     cache.untrack_tables_script(BASE_TABLES + ROLLUP_TABLES) + cache.change_counter_script(BASE_TABLES)),
+    # Каждый индекс на агрегатах обновляется триггером при каждой записи журнала:
+    # семь индексов миграции 5 снижали загрузку PerformanceLog вдвое. Рейтинг
+    # по одной игре и так сужается индексом (TitleRefID, score_sum) до игроков
+    # этой игры, поэтому K/D и доля побед по игре сортируются без своих индексов
+    (7, "Без индексов K/D и доли побед по играм", """
+    DROP INDEX IF EXISTS idx_UserTitleStats_kd;
+    DROP INDEX IF EXISTS idx_UserTitleStats_winrate;
+    """),
+]
+
+# Кэш результатов аналитических запросов (живет, пока жив процесс)
+RESULT_CACHE = cache.ResultCache()
+
+def create_game_schema(cursor):
+    """Доводит структуру всех таблиц для хранения статистики до актуальной версии."""
+    before, after = migrations.migrate(cursor.connection, MIGRATIONS)
+    if before == after:
+        print(f"Структура БД актуальна (версия {after}).")
+    else:
+        print("Структура БД для игровой платформы создана.")
 
 # --- 3. Вставка данных ---
 
@@ -145,11 +297,160 @@ def insert_game_data(cursor, conn):
     VALUES (?, ?, ?, ?, ?, ?);
     """, log_data)
 
-    conn.commit()
+    cache.record_changes(conn, BASE_TABLES)
+    cache.commit(conn)
     print("Тестовые данные успешно загружены.")
 
+# Столбцы PerformanceLog во входных файлах (LogID назначается автоматически)
+PERFORMANCE_LOG_COLUMNS = ["SessionRefID", "UserRefID", "FinalScore", "Frags", "Deaths", "IsVictory"]
+
+def ingest_performance_log(conn, path, batch_size=ingest.DEFAULT_BATCH_SIZE):
+    """
+    Потоково загружает результаты игроков из CSV/JSONL-файла в PerformanceLog
+    (IsVictory - 0/1). Подходит для десятков миллионов строк.
+    """
+    stats = ingest.ingest_file(conn, "PerformanceLog", path, PERFORMANCE_LOG_COLUMNS,
+                               batch_size=batch_size)
+    print(f"Загружено из {path}: {stats}")
+    return stats
+
+def rebuild_rollups(conn):
+    """Пересчитывает агрегаты по всему журналу (например, после ручной правки PerformanceLog)."""
+    conn.execute("BEGIN;")
+    try:
+        for statement in migrations.split_statements(ROLLUP_REBUILD_SQL):
+            conn.execute(statement)
+        cache.record_changes(conn, ROLLUP_TABLES)
+        cache.commit(conn)
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+
 # --- 4. Аналитические Запросы ---
 
+# Условие "победа" - для него есть готовые счетчики wins в UserTitleStats
+VICTORY = "PL.IsVictory = 1"
+
+def never_satisfied_query(title_name, predicate=VICTORY, predicate_params=(), use_rollups=True):
+    """
+    Запрос (sql, параметры): игроки, которые играли в игру title_name, но ни в
+    одной записи журнала по ней не выполнили predicate - условие над строкой
+    PerformanceLog PL, например VICTORY или "PL.FinalScore >= ?" с параметром.
+
+    Вместо NOT IN по второму такому же соединению журнал игры проходится один
+    раз с условной агрегацией по игроку. Для VICTORY достаточно UserTitleStats:
+    это одна строка на игрока и игру, без чтения журнала.
+    """
+    if predicate == VICTORY and use_rollups:
+        return """
+        SELECT 
+            U.UserID, U.Username
+        FROM 
+            Titles T
+        JOIN 
+            UserTitleStats UTS ON UTS.TitleRefID = T.TitleID
+        JOIN 
+            Users U ON U.UserID = UTS.UserRefID
+        WHERE 
+            T.GameName = ?
+        GROUP BY 
+            U.UserID
+        HAVING 
+            SUM(UTS.wins) = 0
+        ORDER BY 
+            U.UserID;
+        """, [title_name]
+    return f"""
+    SELECT 
+        U.UserID, U.Username
+    FROM 
+        Titles T
+    JOIN 
+        GameSessions GS ON GS.TitleRefID = T.TitleID
+    JOIN 
+        PerformanceLog PL ON PL.SessionRefID = GS.SessionID
+    JOIN 
+        Users U ON U.UserID = PL.UserRefID
+    WHERE 
+        T.GameName = ?
+    GROUP BY 
+        U.UserID
+    HAVING 
+        MAX(CASE WHEN {predicate} THEN 1 ELSE 0 END) = 0
+    ORDER BY 
+        U.UserID;
+    """, [title_name, *predicate_params]
+
+def not_in_query(title_name, predicate=VICTORY, predicate_params=()):
+    """Прежняя форма запроса 5 (DISTINCT + NOT IN) - эталон для сравнения в benchmark_never_satisfied."""
+    return f"""
+    SELECT DISTINCT 
+        U.UserID, U.Username
+    FROM 
+        Users U
+    JOIN 
+        PerformanceLog PL ON U.UserID = PL.UserRefID
+    JOIN 
+        GameSessions GS ON PL.SessionRefID = GS.SessionID
+    JOIN 
+        Titles T ON GS.TitleRefID = T.TitleID
+    WHERE 
+        T.GameName = ?
+        AND U.UserID NOT IN (
+            SELECT 
+                PL.UserRefID 
+            FROM 
+                PerformanceLog PL
+            JOIN 
+                GameSessions GS ON PL.SessionRefID = GS.SessionID
+            JOIN 
+                Titles T ON GS.TitleRefID = T.TitleID
+            WHERE 
+                T.GameName = ? AND {predicate}
+        );
+    """, [title_name, title_name, *predicate_params]
+
+def benchmark_never_satisfied(rows, repeat=3):
+    """
+    Сравнивает на синтетическом журнале из rows записей (БД во временном каталоге)
+    прежнюю форму NOT IN с однопроходной агрегацией и с чтением UserTitleStats.
+    Перед замером проверяет, что все формы возвращают одинаковые строки.
+    """
+    cases = [
+        ("Cyber Arena", "победа", VICTORY, ()),
+        ("Mystic Quest", "победа", VICTORY, ()),
+        ("Cyber Arena", "очки >= 1500", "PL.FinalScore >= ?", (1500,)),
+        ("Game 40", "фрагов >= 25", "PL.Frags >= ?", (25,)),
+    ]
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "game stats reports.db")
+        synthetic.generate("game stats reports", db_file, rows)
+        conn = connection.connect(db_file, "read-report")
+        try:
+            print(f"{'Игра':<13} {'Условие':<14} {'строк':>7} {'NOT IN, мс':>11} {'проход, мс':>11} {'агрегаты, мс':>13}")
+            for title_name, label, predicate, params in cases:
+                forms = [not_in_query(title_name, predicate, params),
+                         never_satisfied_query(title_name, predicate, params, use_rollups=False)]
+                if predicate == VICTORY:
+                    forms.append(never_satisfied_query(title_name, predicate, params))
+                timings, results = [], []
+                for sql, sql_params in forms:
+                    best = None
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        found = conn.execute(sql, sql_params).fetchall()
+                        elapsed = time.perf_counter() - started
+                        best = elapsed if best is None else min(best, elapsed)
+                    timings.append(f"{best * 1000:.2f}")
+                    results.append(sorted(found))
+                if any(result != results[0] for result in results[1:]):
+                    raise AssertionError(f"Формы запроса расходятся: {title_name}, {label}")
+                timings += ["-"] * (3 - len(timings))
+                print(f"{title_name:<13} {label:<14} {len(results[0]):>7} "
+                      f"{timings[0]:>11} {timings[1]:>11} {timings[2]:>13}")
+        finally:
+            connection.release(conn)
+
 def run_analytics(cursor):
     """Выполняет аналитические запросы по игровой статистике."""
     
@@ -157,7 +458,7 @@ def run_analytics(cursor):
 
     # Задание 1: Игроки, зарегистрировавшиеся в 2024 году (Используем LIKE)
     print("\n1. Пользователи, присоединившиеся в 2024 году:")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, """
     SELECT 
         UserID, Username, JoinedDate 
     FROM 
@@ -165,90 +466,63 @@ def run_analytics(cursor):
     WHERE 
         JoinedDate LIKE '2024%';
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result)
 
     # Задание 2: Средний балл игрока с UserID=1 (Phoenix)
     print("\n2. Средний балл пользователя с UserID=1:")
-    cursor.execute("""
-    SELECT 
-        AVG(FinalScore) 
-    FROM 
-        PerformanceLog 
-    WHERE 
-        UserRefID = 1;
+    # Подзапрос дает одну строку и без записей игрока - как AVG по пустому набору
+    result = RESULT_CACHE.execute(cursor, """
+    SELECT (
+        SELECT 
+            CAST(score_sum AS REAL) / entries 
+        FROM 
+            UserStats 
+        WHERE 
+            UserRefID = 1
+    );
     """)
-    print(cursor.fetchone()[0])
+    print(result.fetchone()[0])
 
     # Задание 3: 5 самых популярных игр по количеству сессий
     print("\n3. Топ-5 самых популярных игр по количеству проведенных Сессий:")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, """
     SELECT 
-        T.GameName, COUNT(GS.SessionID) AS TotalSessions
+        T.GameName, TS.sessions AS TotalSessions
     FROM 
         Titles T
     JOIN 
-        GameSessions GS ON T.TitleID = GS.TitleRefID
-    GROUP BY 
-        T.TitleID
+        TitleStats TS ON T.TitleID = TS.TitleRefID
+    WHERE 
+        TS.sessions > 0
     ORDER BY 
         TotalSessions DESC
     LIMIT 5;
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result)
 
     # Задание 4: Игрок с самым высоким средним K/D (Убийства/Смерти)
     print("\n4. Пользователь с максимальным средним коэффициентом K/D:")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, """
     SELECT 
-        U.UserID, U.Username, AVG(CAST(PL.Frags AS REAL) / NULLIF(PL.Deaths, 0)) AS Avg_KDRatio
+        U.UserID, U.Username, US.kd_sum / NULLIF(US.kd_count, 0) AS Avg_KDRatio
     FROM 
         Users U
     JOIN 
-        PerformanceLog PL ON U.UserID = PL.UserRefID
-    GROUP BY 
-        U.UserID
+        UserStats US ON U.UserID = US.UserRefID
     ORDER BY 
-        Avg_KDRatio DESC
+        US.kd_sum / NULLIF(US.kd_count, 0) DESC
     LIMIT 1;
     """)
-    print(cursor.fetchone())
+    print(result.fetchone())
 
     # Задание 5: Игроки, которые играли в 'Cyber Arena', но не выиграли в ней ни одной сессии
     print("\n5. Пользователи, которые играли в 'Cyber Arena', но не одержали в ней ни одной победы:")
-    cursor.execute("""
-    SELECT DISTINCT 
-        U.UserID, U.Username
-    FROM 
-        Users U
-    JOIN 
-        PerformanceLog PL ON U.UserID = PL.UserRefID
-    JOIN 
-        GameSessions GS ON PL.SessionRefID = GS.SessionID
-    JOIN 
-        Titles T ON GS.TitleRefID = T.TitleID
-    WHERE 
-        T.GameName = 'Cyber Arena'
-        AND U.UserID NOT IN (
-            SELECT 
-                UserRefID 
-            FROM 
-                PerformanceLog PL_INNER
-            JOIN 
-                GameSessions GS_INNER ON PL_INNER.SessionRefID = GS_INNER.SessionID
-            JOIN 
-                Titles T_INNER ON GS_INNER.TitleRefID = T_INNER.TitleID
-            WHERE 
-                T_INNER.GameName = 'Cyber Arena' AND PL_INNER.IsVictory = 1
-        );
-    """)
-    for row in cursor.fetchall():
-        print(row)
+    result = RESULT_CACHE.execute(cursor, *never_satisfied_query("Cyber Arena"))
+    output.print_rows(result)
 
     # Задание 6: Полная статистика сессии с SessionID=2
     print("\n6. Детализированный лог результатов сессии с SessionID=2:")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, """
     SELECT 
         GS.SessionID, T.GameName AS Title, U.Username AS Player,
         PL.FinalScore, PL.Frags, PL.Deaths,
@@ -270,19 +544,157 @@ def run_analytics(cursor):
     ORDER BY 
         U.Username;
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result)
+
+# --- 5. Рейтинги игроков ---
 
-# --- 5. Выполнение ---
+# Метрики рейтинга: выражения над столбцами агрегатов (entries, score_sum, wins, frags, deaths).
+# K/D здесь - общий (все убийства / все смерти), как принято в таблицах лидеров.
+LEADERBOARD_METRICS = {
+    "score": "score_sum",
+    "kd": "CAST(frags AS REAL) / NULLIF(deaths, 0)",
+    "winrate": "CAST(wins AS REAL) / entries",
+}
+
+def leaderboard_source(title_id=None, since=None, until=None):
+    """
+    Источник строк рейтинга (UserRefID, entries, score_sum, wins, frags, deaths) и его параметры.
+    Без окна времени читаются агрегаты UserStats/UserTitleStats (O(игроков));
+    окно [since, until) по GameSessions.SessionTime агрегирует журнал только
+    по сессиям из окна (поиск по индексу SessionTime).
+    """
+    if since is None and until is None:
+        if title_id is None:
+            return "SELECT * FROM UserStats", []
+        return "SELECT * FROM UserTitleStats WHERE TitleRefID = ?", [title_id]
+
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("GS.SessionTime >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("GS.SessionTime < ?")
+        params.append(until)
+    if title_id is not None:
+        conditions.append("GS.TitleRefID = ?")
+        params.append(title_id)
+    return f"""
+    SELECT 
+        PL.UserRefID, COUNT(*) AS entries, SUM(PL.FinalScore) AS score_sum,
+        SUM(PL.IsVictory = 1) AS wins, SUM(PL.Frags) AS frags, SUM(PL.Deaths) AS deaths
+    FROM 
+        GameSessions GS
+    JOIN 
+        PerformanceLog PL ON PL.SessionRefID = GS.SessionID
+    WHERE 
+        {" AND ".join(conditions)}
+    GROUP BY 
+        PL.UserRefID""", params
+
+class Leaderboard:
+    """
+    Таблица лидеров: топ-K по очкам, K/D или доле побед - по всем играм или по
+    одной, за все время или за окно SessionTime, и поиск места игрока.
+
+    Топ-K - не больше K строк: без окна они читаются по индексам на
+    выражениях метрик (миграция 5) проходом K записей индекса, с окном -
+    сортировкой с LIMIT, которая держит в памяти только K лучших строк.
+    Места считаются оконной функцией RANK() только по этим строкам.
+    Индексы стоят записи: каждый обновляется при загрузке журнала, поэтому
+    для рейтингов по одной игре остался только индекс по очкам (миграция 7). Результаты
+    держатся в кэше до изменения данных, поэтому повторный запрос не
+    зависит от размера журнала.
+    """
+
+    def __init__(self, cursor, k=10, result_cache=None):
+        self.cursor = cursor
+        self.k = k
+        self.result_cache = result_cache or RESULT_CACHE
+
+    @staticmethod
+    def _metric(metric):
+        try:
+            return LEADERBOARD_METRICS[metric]
+        except KeyError:
+            raise ValueError(f"Неизвестная метрика рейтинга: {metric!r}") from None
+
+    def top(self, metric="score", title_id=None, since=None, until=None, k=None, min_entries=1):
+        """
+        Список (место, UserID, Username, значение, записей), не больше k строк.
+        Равные на границе топа отбираются по меньшему UserID; место - как в rank_of.
+        """
+        expression = self._metric(metric)
+        source, params = leaderboard_source(title_id, since, until)
+        k = k or self.k
+        # Все, кто строго лучше любой строки топа, стоят в порядке раньше нее и
+        # тоже в топе, поэтому RANK() по этим строкам совпадает с местом во всем
+        # рейтинге (и с rank_of). Агрегаты читаются без материализации, чтобы
+        # отбор шел по индексу; агрегат по окну времени - один раз
+        materialized = "" if since is not None or until is not None else "NOT MATERIALIZED"
+        return self.result_cache.execute(self.cursor, f"""
+        WITH Board AS {materialized} ({source}),
+        Ranked AS {materialized} (
+            SELECT UserRefID, entries, {expression} AS value
+            FROM Board
+            WHERE entries >= ? AND {expression} IS NOT NULL
+        ),
+        Leaders AS (
+            SELECT * FROM Ranked
+            ORDER BY value DESC, UserRefID
+            LIMIT ?
+        )
+        SELECT 
+            RANK() OVER (ORDER BY L.value DESC) AS position, U.UserID, U.Username, L.value, L.entries
+        FROM 
+            Leaders L
+        JOIN 
+            Users U ON U.UserID = L.UserRefID
+        ORDER BY 
+            position, U.UserID;
+        """, params + [min_entries, k]).fetchall()
+
+    def rank_of(self, user_id, metric="score", title_id=None, since=None, until=None, min_entries=1):
+        """Место игрока (1 + число игроков со строго большим значением) и значение, либо None."""
+        expression = self._metric(metric)
+        source, params = leaderboard_source(title_id, since, until)
+        row = self.result_cache.execute(self.cursor, f"""
+        WITH Board AS ({source})
+        SELECT {expression} FROM Board WHERE UserRefID = ? AND entries >= ?;
+        """, params + [user_id, min_entries]).fetchone()
+        if row is None or row[0] is None:
+            return None
+        better = self.result_cache.execute(self.cursor, f"""
+        WITH Board AS ({source})
+        SELECT COUNT(*) FROM Board WHERE {expression} > ? AND entries >= ?;
+        """, params + [row[0], min_entries]).fetchone()[0]
+        return better + 1, row[0]
+
+# --- 6. Выполнение ---
 
 def main():
+    parser = argparse.ArgumentParser(description="Игровая статистика: схема, данные и отчеты")
+    parser.add_argument("files", nargs="*", help="CSV/JSONL-файлы с результатами игроков для загрузки")
+    parser.add_argument("--bench", type=lambda value: int(float(value)), metavar="ROWS",
+                        help="Сравнить формы запроса 5 на синтетическом журнале из ROWS записей")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark_never_satisfied(args.bench)
+        return
+
     conn, cursor = initialize_db()
     create_game_schema(cursor)
-    insert_game_data(cursor, conn)
+    # Тестовые данные загружаются только в пустую БД
+    if migrations.is_empty(conn, "Users"):
+        insert_game_data(cursor, conn)
+    # Дополнительные файлы с результатами игроков: аргументы командной строки
+    for path in args.files:
+        ingest_performance_log(conn, path)
+    connection.apply_profile(conn, "read-report")
     run_analytics(cursor)
     
     print("\nанализа данных завершено.")
-    conn.close()
+    connection.release(conn)
 
 if __name__ == "__main__":
     main()
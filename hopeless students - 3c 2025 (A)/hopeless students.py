@@ -1,37 +1,43 @@
 # Импорт необходимых модулей
 import sqlite3
 import os
+import sys
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, migrations, output
 
 # --- Константы Базы Данных ---
 DB_FILE = "hopeless_students.db"
 TABLE_STUDENTS = "StudentsList"
 TABLE_SUBMISSIONS = "SubmissionsLog"
 
-def setup_database(db_file):
-    """Устанавливает соединение с БД, удаляет старый файл и создает таблицы."""
-    if os.path.exists(db_file):
-        os.remove(db_file)
-
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-
-    # Создаем основную таблицу: StudentsList (список всех студентов)
-    cursor.executescript(f"""
-    CREATE TABLE {TABLE_STUDENTS} (
+# --- Миграции схемы ---
+MIGRATIONS = [
+    (1, f"Таблицы {TABLE_STUDENTS} и {TABLE_SUBMISSIONS}", f"""
+    -- Основная таблица: StudentsList (список всех студентов)
+    CREATE TABLE IF NOT EXISTS {TABLE_STUDENTS} (
         student_id INTEGER PRIMARY KEY,
         full_name TEXT NOT NULL,
         group_num TEXT
     );
 
-    -- Создаем детальную таблицу: SubmissionsLog (записи о сданных работах)
-    CREATE TABLE {TABLE_SUBMISSIONS} (
+    -- Детальная таблица: SubmissionsLog (записи о сданных работах)
+    CREATE TABLE IF NOT EXISTS {TABLE_SUBMISSIONS} (
         submission_pk INTEGER PRIMARY KEY,
         assignment_code TEXT,
         student_ref_id INTEGER,
         grade REAL,
         FOREIGN KEY (student_ref_id) REFERENCES StudentsList(student_id)
     );
-    """)
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+]
+
+def setup_database(db_file):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+    conn = migrations.open_database(db_file, MIGRATIONS)
+    cursor = conn.cursor()
     return conn, cursor
 
 def insert_sample_data(cursor, conn):
@@ -75,12 +81,8 @@ def run_missing_submissions_query(cursor):
     print("Студенты, не сдавшие ни одной работы:")
     print("-" * 60)
     
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"ID: {row[0]:<5} | ФИО: {row[1]:<20} | Группа: {row[2]}")
-    else:
-        print("Все студенты в списке имеют записи о сданных работах.")
+    output.print_rows(cursor, lambda row: f"ID: {row[0]:<5} | ФИО: {row[1]:<20} | Группа: {row[2]}",
+                      empty="Все студенты в списке имеют записи о сданных работах.")
     print("-" * 60)
 
 
@@ -89,13 +91,16 @@ def audit_student_assignments():
     conn = None
     try:
         conn, cursor = setup_database(DB_FILE)
-        insert_sample_data(cursor, conn)
+        # Тестовые данные загружаются только в пустую БД
+        if migrations.is_empty(conn, TABLE_STUDENTS):
+            insert_sample_data(cursor, conn)
+        connection.apply_profile(conn, "read-report")
         run_missing_submissions_query(cursor)
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     audit_student_assignments()
@@ -1,5 +1,19 @@
-import sqlite3
 import os
+import sys
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, migrations, output
+
+# Миграции схемы: таблица для учета товаров (Items)
+MIGRATIONS = [
+    (1, "Таблица Items", """
+    CREATE TABLE IF NOT EXISTS Items (
+        item_id INTEGER PRIMARY KEY,
+        code_inventory INTEGER
+    );
+    """),
+]
 
 def status_lookup_demo():
     """
@@ -8,21 +22,10 @@ def status_lookup_demo():
     """
     db_file_name = "inventory_status.db"
     
-    # Убедимся, что начинаем с чистого листа
-    if os.path.exists(db_file_name):
-        os.remove(db_file_name)
-
-    db_connection = sqlite3.connect(db_file_name)
+    # Открываем существующую БД, схема доводится до актуальной версии
+    db_connection = migrations.open_database(db_file_name, MIGRATIONS)
     sql_cursor = db_connection.cursor()
 
-    # Создаем таблицу для учета товаров (Items)
-    sql_cursor.execute("""
-    CREATE TABLE Items (
-        item_id INTEGER PRIMARY KEY,
-        code_inventory INTEGER
-    );
-    """)
-
     # --- Вставляем данные инвентаризации ---
     
     inventory_items = [
@@ -32,10 +35,12 @@ def status_lookup_demo():
         (104, 3),
         (105, 99)  # Неизвестный код статуса
     ]
-    sql_cursor.executemany("INSERT INTO Items VALUES (?, ?);", inventory_items)
-    db_connection.commit()
+    if migrations.is_empty(db_connection, "Items"):
+        sql_cursor.executemany("INSERT INTO Items VALUES (?, ?);", inventory_items)
+        db_connection.commit()
 
     # --- Запрос с CASE (перевод кода в текст) ---
+    connection.apply_profile(db_connection, "read-report")
     
     sql_cursor.execute("""
     SELECT 
@@ -51,8 +56,9 @@ def status_lookup_demo():
     """)
 
     print("--- Отчет по статусам инвентаризации ---")
-    for row in sql_cursor.fetchall():
-        print(f"Товар ID: {row[0]}, Статус: {row[1]}")
+    output.print_rows(sql_cursor, lambda row: f"Товар ID: {row[0]}, Статус: {row[1]}")
+
+    connection.release(db_connection)
 
 if __name__ == "__main__":
     status_lookup_demo()
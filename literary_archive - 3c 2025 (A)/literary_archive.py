@@ -1,18 +1,23 @@
 import sqlite3
+import argparse
 import os
-from datetime import datetime
+import re
+import sys
+import tempfile
+import time
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, migrations, synthetic
 
 # --- 1. Настройка и подключение к базе данных ---
 
 def setup_library_db(filename="literary_archive.db"):
     """
     Устанавливает соединение с базой данных и активирует поддержку внешних ключей.
-    Удаляет существующий файл БД, чтобы начать с чистого листа.
+    Существующий файл БД открывается как есть, накопленные данные сохраняются.
     """
-    if os.path.exists(filename):
-        os.remove(filename)
-
-    db_conn = sqlite3.connect(filename)
+    db_conn = connection.connect(filename, "bulk-load")
     db_cursor = db_conn.cursor()
     # Активация внешних ключей
     db_cursor.execute("PRAGMA foreign_keys = ON;")
@@ -21,11 +26,10 @@ def setup_library_db(filename="literary_archive.db"):
 
 # --- 2. Создание структуры (Схемы) ---
 
-def define_schema(cursor):
-    """Определяет структуру всех пяти связанных таблиц для каталога."""
-    
-    # Таблица 1: Members (Пользователи/Читатели)
-    cursor.execute("""
+# Шаги миграций: применяются по порядку, каждый ровно один раз
+MIGRATIONS = [
+    (1, "Пять связанных таблиц каталога", """
+    -- Таблица 1: Members (Пользователи/Читатели)
     CREATE TABLE IF NOT EXISTS Members (
         member_id INTEGER PRIMARY KEY AUTOINCREMENT,
         display_name TEXT NOT NULL,
@@ -33,27 +37,21 @@ def define_schema(cursor):
         secure_hash TEXT NOT NULL,
         join_date TEXT NOT NULL
     );
-    """)
 
-    # Таблица 2: Creators (Авторы)
-    cursor.execute("""
+    -- Таблица 2: Creators (Авторы)
     CREATE TABLE IF NOT EXISTS Creators (
         creator_id INTEGER PRIMARY KEY AUTOINCREMENT,
         display_full_name TEXT NOT NULL,
         year_born INTEGER
     );
-    """)
 
-    # Таблица 3: Categories (Жанры)
-    cursor.execute("""
+    -- Таблица 3: Categories (Жанры)
     CREATE TABLE IF NOT EXISTS Categories (
         category_id INTEGER PRIMARY KEY AUTOINCREMENT,
         category_title TEXT UNIQUE NOT NULL
     );
-    """)
 
-    # Таблица 4: LibraryEntries (Книги)
-    cursor.execute("""
+    -- Таблица 4: LibraryEntries (Книги)
     CREATE TABLE IF NOT EXISTS LibraryEntries (
         entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
         entry_title TEXT NOT NULL,
@@ -63,10 +61,8 @@ def define_schema(cursor):
         FOREIGN KEY (creator_ref_id) REFERENCES Creators(creator_id),
         FOREIGN KEY (category_ref_id) REFERENCES Categories(category_id)
     );
-    """)
 
-    # Таблица 5: UserFeedback (Отзывы)
-    cursor.execute("""
+    -- Таблица 5: UserFeedback (Отзывы)
     CREATE TABLE IF NOT EXISTS UserFeedback (
         feedback_id INTEGER PRIMARY KEY AUTOINCREMENT,
         member_ref_id INTEGER NOT NULL,
@@ -77,8 +73,72 @@ def define_schema(cursor):
         FOREIGN KEY (member_ref_id) REFERENCES Members(member_id),
         FOREIGN KEY (entry_ref_id) REFERENCES LibraryEntries(entry_id)
     );
-    """)
-    print("Структура базы данных для цифрового каталога создана.")
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+    (3, "Полнотекстовый поиск FTS5 по отзывам и названиям книг", """
+    -- Внешнее содержимое: FTS хранит только индекс, текст берется из исходных таблиц
+    CREATE VIRTUAL TABLE IF NOT EXISTS UserFeedback_fts USING fts5(
+        feedback_text,
+        content='UserFeedback', content_rowid='feedback_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS LibraryEntries_fts USING fts5(
+        entry_title,
+        content='LibraryEntries', content_rowid='entry_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+
+    -- Триггеры синхронизации: индекс обновляется вместе с исходными строками
+    CREATE TRIGGER IF NOT EXISTS trg_UserFeedback_fts_insert AFTER INSERT ON UserFeedback
+    BEGIN
+        INSERT INTO UserFeedback_fts (rowid, feedback_text) VALUES (new.feedback_id, new.feedback_text);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_UserFeedback_fts_delete AFTER DELETE ON UserFeedback
+    BEGIN
+        INSERT INTO UserFeedback_fts (UserFeedback_fts, rowid, feedback_text)
+        VALUES ('delete', old.feedback_id, old.feedback_text);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_UserFeedback_fts_update AFTER UPDATE OF feedback_text ON UserFeedback
+    BEGIN
+        INSERT INTO UserFeedback_fts (UserFeedback_fts, rowid, feedback_text)
+        VALUES ('delete', old.feedback_id, old.feedback_text);
+        INSERT INTO UserFeedback_fts (rowid, feedback_text) VALUES (new.feedback_id, new.feedback_text);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_LibraryEntries_fts_insert AFTER INSERT ON LibraryEntries
+    BEGIN
+        INSERT INTO LibraryEntries_fts (rowid, entry_title) VALUES (new.entry_id, new.entry_title);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_LibraryEntries_fts_delete AFTER DELETE ON LibraryEntries
+    BEGIN
+        INSERT INTO LibraryEntries_fts (LibraryEntries_fts, rowid, entry_title)
+        VALUES ('delete', old.entry_id, old.entry_title);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_LibraryEntries_fts_update AFTER UPDATE OF entry_title ON LibraryEntries
+    BEGIN
+        INSERT INTO LibraryEntries_fts (LibraryEntries_fts, rowid, entry_title)
+        VALUES ('delete', old.entry_id, old.entry_title);
+        INSERT INTO LibraryEntries_fts (rowid, entry_title) VALUES (new.entry_id, new.entry_title);
+    END;
+
+    -- Индексация строк, накопленных до этой миграции
+    INSERT INTO UserFeedback_fts (UserFeedback_fts) VALUES ('rebuild');
+    INSERT INTO LibraryEntries_fts (LibraryEntries_fts) VALUES ('rebuild');
+    """),
+]
+
+def define_schema(cursor):
+    """Доводит структуру всех пяти связанных таблиц каталога до актуальной версии."""
+    before, after = migrations.migrate(cursor.connection, MIGRATIONS)
+    if before == after:
+        print(f"Структура базы данных актуальна (версия {after}).")
+    else:
+        print("Структура базы данных для цифрового каталога создана.")
 
 # --- 3. Вставка данных ---
 
@@ -132,20 +192,146 @@ def populate_data(cursor):
     """, feedback_data)
     print("Таблицы успешно заполнены тестовыми данными.")
 
-# --- 4. Выполнение ---
+# --- 4. Полнотекстовый поиск ---
+
+def fts_query(text, prefix=True):
+    """
+    Превращает пользовательский текст в запрос FTS5: каждое слово берется
+    в кавычки (спецсимволы синтаксиса FTS5 не мешают), при prefix - с '*'.
+    Слова объединяются через неявный AND.
+    """
+    words = re.findall(r"\w+", text)
+    suffix = "*" if prefix else ""
+    return " ".join(f'"{word}"{suffix}' for word in words)
+
+
+def search_feedback(cursor, text, limit=10, prefix=True):
+    """Отзывы, подходящие под запрос, по релевантности bm25 вместе с книгой, автором и жанром."""
+    match = fts_query(text, prefix)
+    if not match:
+        return []
+    cursor.execute("""
+    SELECT 
+        F.feedback_id, E.entry_title, C.display_full_name, G.category_title, F.grade,
+        snippet(UserFeedback_fts, 0, '[', ']', '...', 10) AS fragment,
+        bm25(UserFeedback_fts) AS rank
+    FROM 
+        UserFeedback_fts
+    JOIN 
+        UserFeedback F ON F.feedback_id = UserFeedback_fts.rowid
+    JOIN 
+        LibraryEntries E ON E.entry_id = F.entry_ref_id
+    JOIN 
+        Creators C ON C.creator_id = E.creator_ref_id
+    JOIN 
+        Categories G ON G.category_id = E.category_ref_id
+    WHERE 
+        UserFeedback_fts MATCH ?
+    ORDER BY 
+        rank
+    LIMIT ?;
+    """, (match, limit))
+    return cursor.fetchall()
+
+
+def search_titles(cursor, text, limit=10, prefix=True):
+    """Книги, в названии которых есть слова запроса, по релевантности bm25 с автором и жанром."""
+    match = fts_query(text, prefix)
+    if not match:
+        return []
+    cursor.execute("""
+    SELECT 
+        E.entry_id, E.entry_title, E.publication_year, C.display_full_name, G.category_title,
+        bm25(LibraryEntries_fts) AS rank
+    FROM 
+        LibraryEntries_fts
+    JOIN 
+        LibraryEntries E ON E.entry_id = LibraryEntries_fts.rowid
+    JOIN 
+        Creators C ON C.creator_id = E.creator_ref_id
+    JOIN 
+        Categories G ON G.category_id = E.category_ref_id
+    WHERE 
+        LibraryEntries_fts MATCH ?
+    ORDER BY 
+        rank
+    LIMIT ?;
+    """, (match, limit))
+    return cursor.fetchall()
+
+
+def print_search(cursor, text, limit=10):
+    print(f"\n--- Поиск: '{text}' ---")
+    print("Книги:")
+    for row in search_titles(cursor, text, limit):
+        print(f"  #{row[0]} {row[1]} ({row[2]}) - {row[3]}, {row[4]}")
+    print("Отзывы:")
+    for row in search_feedback(cursor, text, limit):
+        print(f"  #{row[0]} [{row[4]}/5] {row[1]} - {row[2]}, {row[3]}: {row[5]}")
+
+
+def benchmark_search(rows, terms, repeat=3):
+    """
+    Сравнивает поиск FTS5 с просмотром LIKE '%слово%' на синтетическом каталоге
+    из rows отзывов (БД во временном каталоге). LIKE ищет подстроку, а FTS -
+    слова и их префиксы, поэтому число найденных строк может немного отличаться.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, "literary_archive.db")
+        synthetic.generate("literary_archive", db_file, rows)
+        conn = connection.connect(db_file, "read-report")
+        try:
+            print(f"{'Запрос':<15} {'FTS, мс':>10} {'строк':>8} {'LIKE, мс':>10} {'строк':>8}")
+            for term in terms:
+                timings = {}
+                for name, sql, param in (
+                    ("fts", "SELECT COUNT(*) FROM UserFeedback_fts WHERE UserFeedback_fts MATCH ?;",
+                     fts_query(term)),
+                    ("like", "SELECT COUNT(*) FROM UserFeedback WHERE feedback_text LIKE ?;",
+                     f"%{term}%"),
+                ):
+                    best = None
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        count = conn.execute(sql, (param,)).fetchone()[0]
+                        elapsed = time.perf_counter() - started
+                        best = elapsed if best is None else min(best, elapsed)
+                    timings[name] = (best * 1000, count)
+                print(f"{term:<15} {timings['fts'][0]:>10.2f} {timings['fts'][1]:>8} "
+                      f"{timings['like'][0]:>10.2f} {timings['like'][1]:>8}")
+        finally:
+            connection.release(conn)
+
+# --- 5. Выполнение ---
 
 def main():
+    parser = argparse.ArgumentParser(description="Цифровой каталог: схема, данные и полнотекстовый поиск")
+    parser.add_argument("query", nargs="*", help="Слова для поиска по отзывам и названиям книг")
+    parser.add_argument("--limit", type=int, default=10, help="Сколько результатов показывать")
+    parser.add_argument("--bench", type=lambda value: int(float(value)), metavar="ROWS",
+                        help="Сравнить FTS5 и LIKE на синтетическом каталоге из ROWS отзывов")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark_search(args.bench, args.query or ["love", "classic", "deep novel"])
+        return
+
     conn, cursor = setup_library_db()
     
     try:
         define_schema(cursor)
-        populate_data(cursor)
-        conn.commit()
+        # Тестовые данные загружаются только в пустую БД
+        if migrations.is_empty(conn, "Members"):
+            populate_data(cursor)
+            conn.commit()
+        if args.query:
+            connection.apply_profile(conn, "read-report")
+            print_search(cursor, " ".join(args.query), args.limit)
     except sqlite3.Error as e:
         print(f"Ошибка при работе с БД: {e}")
         conn.rollback()
     finally:
-        conn.close()
+        connection.release(conn)
 
 if __name__ == "__main__":
     main()
@@ -1,36 +1,41 @@
 # Импорт необходимых модулей
 import sqlite3
 import os
+import sys
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, migrations, output
 
 # --- Константы БД ---
 DB_FILE = "product.db"
 TECH_TABLE = "Tech_Inventory"
 HOME_TABLE = "Home_Inventory"
 
-def setup_database(db_file):
-    """Настраивает подключение, удаляет старый файл и создает таблицы."""
-    if os.path.exists(db_file):
-        os.remove(db_file)
-
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-
-    # Создаем две таблицы: Техника и Товары для дома
-    cursor.executescript(f"""
-    CREATE TABLE {TECH_TABLE} (
+# --- Миграции схемы ---
+MIGRATIONS = [
+    # Две таблицы: Техника и Товары для дома
+    (1, f"Таблицы {TECH_TABLE} и {HOME_TABLE}", f"""
+    CREATE TABLE IF NOT EXISTS {TECH_TABLE} (
         Prod_ID INTEGER PRIMARY KEY,
         Item_Name TEXT NOT NULL,
         Mfg_City TEXT NOT NULL,
         Mfg_Region TEXT NOT NULL
     );
 
-    CREATE TABLE {HOME_TABLE} (
+    CREATE TABLE IF NOT EXISTS {HOME_TABLE} (
         Prod_ID INTEGER PRIMARY KEY,
         Item_Name TEXT NOT NULL,
         Mfg_City TEXT NOT NULL,
         Mfg_Region TEXT NOT NULL
     );
-    """)
+    """),
+]
+
+def setup_database(db_file):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+    conn = migrations.open_database(db_file, MIGRATIONS)
+    cursor = conn.cursor()
     return conn, cursor
 
 def insert_sample_data(cursor, conn):
@@ -83,10 +88,8 @@ def run_union_query(cursor):
     print("Список всех товаров из Европы и Азии, объединенных по категории:")
     print("-" * 50)
     
-    results = cursor.fetchall()
-    for row in results:
-        # Форматированный вывод
-        print(f"ID: {row[0]:<5} | Товар: {row[1]:<20} | Город: {row[2]:<10} | Категория: {row[4]}")
+    # Форматированный вывод
+    output.print_rows(cursor, lambda row: f"ID: {row[0]:<5} | Товар: {row[1]:<20} | Город: {row[2]:<10} | Категория: {row[4]}")
     print("-" * 50)
 
 
@@ -95,13 +98,16 @@ def combine_product_lists():
     conn = None
     try:
         conn, cursor = setup_database(DB_FILE)
-        insert_sample_data(cursor, conn)
+        # Синтетические данные загружаются только в пустую БД
+        if migrations.is_empty(conn, TECH_TABLE):
+            insert_sample_data(cursor, conn)
+        connection.apply_profile(conn, "read-report")
         run_union_query(cursor)
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     combine_product_lists()
\ No newline at end of file
@@ -1,32 +1,60 @@
-import sqlite3
+import argparse
 import os
+import sys
 
-def check_user_overlap():
-    """
-    Создает две таблицы пользователей для разных платформ и выполняет 
-    операцию INNER JOIN для поиска общих ID.
-    """
-    db_filename = "service_cross_check.db"
-    
-    # Удаляем старый файл для чистого старта
-    if os.path.exists(db_filename):
-        os.remove(db_filename)
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import changelog, connection, idsets, migrations, output
 
-    conn_handle = sqlite3.connect(db_filename)
-    db_cursor = conn_handle.cursor()
+# Множества пользователей платформ: битовые карты, обновляемые по журналам изменений
+PLATFORMS = [
+    idsets.PlatformIds("A", changelog.Capture("PlatformA_Users", "PID", ("Alias",))),
+    idsets.PlatformIds("B", changelog.Capture("PlatformB_Users", "PID", ("Alias",))),
+]
 
-    # Создаем таблицы с новыми именами и структурой
-    db_cursor.executescript("""
-    CREATE TABLE PlatformA_Users (
+# Миграции схемы: таблицы пользователей двух платформ
+MIGRATIONS = [
+    (1, "Таблицы PlatformA_Users и PlatformB_Users", """
+    CREATE TABLE IF NOT EXISTS PlatformA_Users (
         PID INTEGER PRIMARY KEY,
         Alias TEXT NOT NULL
     );
 
-    CREATE TABLE PlatformB_Users (
+    CREATE TABLE IF NOT EXISTS PlatformB_Users (
         PID INTEGER PRIMARY KEY,
         Alias TEXT NOT NULL
     );
-    """)
+    """),
+    (2, "Журналы изменений и битовые карты платформ",
+     "".join(platform.capture.script() for platform in PLATFORMS) + idsets.PlatformIds.script()),
+    # Карты прежнего формата (одно целое) перестраиваются при следующем обновлении
+    (3, "Битовые карты платформ блоками", f"DELETE FROM {idsets.BITMAPS_TABLE};"),
+]
+
+def print_overlap(platform_sets):
+    """Число пользователей в каждой области диаграммы Венна (ровно на этих платформах)."""
+    print("\n--- Пересечения платформ ---")
+    names = list(platform_sets)
+    regions = idsets.venn_counts(platform_sets)
+    for members, count in sorted(regions.items(), key=lambda item: (-len(item[0]), sorted(map(names.index, item[0])))):
+        print(f"Только {' + '.join(name for name in names if name in members)}: {count}")
+    print(f"Всего пользователей: {sum(regions.values())}")
+
+def check_user_overlap():
+    """
+    Создает две таблицы пользователей для разных платформ и выполняет 
+    операцию INNER JOIN для поиска общих ID.
+    Пересечение считается по битовым картам id платформ (db_common.idsets).
+    """
+    parser = argparse.ArgumentParser(description="Пользователи, общие для платформ")
+    parser.add_argument("--venn", action="store_true", help="Показать число пользователей по сочетаниям платформ")
+    args = parser.parse_args()
+
+    db_filename = "service_cross_check.db"
+    
+    # Открываем существующую БД, схема доводится до актуальной версии
+    conn_handle = migrations.open_database(db_filename, MIGRATIONS)
+    db_cursor = conn_handle.cursor()
 
     # --- Вставляем данные ---
     
@@ -46,30 +74,39 @@ def check_user_overlap():
         (6, "Frank")
     ]
 
-    db_cursor.executemany("INSERT INTO PlatformA_Users VALUES (?, ?);", platform_a_data)
-    db_cursor.executemany("INSERT INTO PlatformB_Users VALUES (?, ?);", platform_b_data)
-    conn_handle.commit()
+    # Данные загружаются только в пустую БД
+    if migrations.is_empty(conn_handle, "PlatformA_Users"):
+        db_cursor.executemany("INSERT INTO PlatformA_Users VALUES (?, ?);", platform_a_data)
+        db_cursor.executemany("INSERT INTO PlatformB_Users VALUES (?, ?);", platform_b_data)
+        conn_handle.commit()
 
-    # --- Анализ: Пересечение данных (INNER JOIN) ---
+    # --- Анализ: Пересечение данных ---
+    # Битовые карты обновляются по журналам изменений до перехода в режим чтения
+    platform_sets = {platform.name: platform.refresh(conn_handle) for platform in PLATFORMS}
+    connection.apply_profile(conn_handle, "read-report")
 
-    # Запрос на поиск общих записей, используя псевдонимы (A, B)
+    # Пересечение всех платформ в памяти, имена - поиском по ключу
+    shared = idsets.intersection(platform_sets.values())
     db_cursor.execute("""
-    SELECT 
+    SELECT
         A.PID, A.Alias
-    FROM 
+    FROM
+        json_each(?) J
+    INNER JOIN
         PlatformA_Users A
-    INNER JOIN 
-        PlatformB_Users B 
-    ON 
-        A.PID = B.PID
-    ORDER BY 
+    ON
+        A.PID = J.value
+    ORDER BY
         A.PID;
-    """)
+    """, (idsets.ids_json(shared),))
 
     print("--- Результат кросс-проверки ---")
     print("Идентификаторы и имена пользователей, присутствующих на обеих платформах:")
-    for row in db_cursor.fetchall():
-        print(f"ID: {row[0]}, Имя: {row[1]}")
+    output.print_rows(db_cursor, lambda row: f"ID: {row[0]}, Имя: {row[1]}")
+    if args.venn:
+        print_overlap(platform_sets)
+
+    connection.release(conn_handle)
 
 if __name__ == "__main__":
     check_user_overlap()
@@ -1,34 +1,103 @@
-import sqlite3
+import argparse
 import os
+import sys
 
-def compare_staff_datasets():
-    """
-    Создает две таблицы (текущий штат и исторические записи) и использует 
-    оператор EXCEPT для выполнения взаимного сравнения.
-    """
-    db_file_name = "staff division.db"
-    
-    # Очистка файла БД для гарантированного чистого запуска
-    if os.path.exists(db_file_name):
-        os.remove(db_file_name)
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import changelog, connection, migrations, output, tablediff
 
-    conn = sqlite3.connect(db_file_name)
-    cursor = conn.cursor()
+# Журналы изменений обеих таблиц и поддерживаемое по ним сравнение штата
+CURRENT_CAPTURE = changelog.Capture("CurrentStaff", "StaffID", ("WorkerName", "Division"))
+PAST_CAPTURE = changelog.Capture("PastRecords", "StaffID", ("WorkerName", "Division"))
+STAFF_COMPARISON = changelog.Comparison("StaffComparison", CURRENT_CAPTURE, PAST_CAPTURE)
+# Контрольная точка для вывода изменений (--changes)
+REPORT_CHECKPOINT = "report"
+# Хэши диапазонов ключей для сравнения с другим файлом БД (--diff-with)
+STAFF_HASHES = [tablediff.RangeHashes(capture.table, capture.key, capture.columns)
+                for capture in (CURRENT_CAPTURE, PAST_CAPTURE)]
 
-    # Создаем таблицы с новыми именами
-    cursor.executescript("""
-    CREATE TABLE CurrentStaff (
+# Миграции схемы: текущий штат и исторические записи
+MIGRATIONS = [
+    (1, "Таблицы CurrentStaff и PastRecords", """
+    CREATE TABLE IF NOT EXISTS CurrentStaff (
         StaffID INTEGER PRIMARY KEY,
         WorkerName TEXT NOT NULL,
         Division TEXT NOT NULL
     );
 
-    CREATE TABLE PastRecords (
+    CREATE TABLE IF NOT EXISTS PastRecords (
         StaffID INTEGER PRIMARY KEY,
         WorkerName TEXT NOT NULL,
         Division TEXT NOT NULL
     );
-    """)
+    """),
+    (2, "Журналы изменений и сравнение штата",
+     CURRENT_CAPTURE.script() + PAST_CAPTURE.script() + STAFF_COMPARISON.script()),
+    (3, "Хэши диапазонов ключей", "".join(hashes.script() for hashes in STAFF_HASHES)),
+    # Хэши пересчитываются заново, а таблицы отмечаются как хэшируемые
+    (4, "Отметка таблиц с хэшами диапазонов", "".join(hashes.script() for hashes in STAFF_HASHES)),
+]
+
+def take_changes(conn, captures, name=REPORT_CHECKPOINT):
+    """Изменения таблиц с контрольной точки name; точка сдвигается на прочитанное."""
+    changes = [(capture, capture.changes_since(conn, name)) for capture in captures]
+    for capture, table_changes in changes:
+        capture.checkpoint(conn, name, table_changes.until)
+        capture.prune(conn)
+    conn.commit()
+    return changes
+
+def print_changes(changes):
+    for capture, table_changes in changes:
+        print(f"\n--- Изменения {capture.table} (записи журнала {table_changes.since + 1}..{table_changes.until}): ---")
+        for row in table_changes.added:
+            print(f"Добавлен:  {row}")
+        for row in table_changes.removed:
+            print(f"Удален:    {row}")
+        for before, after in table_changes.changed:
+            print(f"Изменен:   {before} -> {after}")
+        if not (table_changes.added or table_changes.removed or table_changes.changed):
+            print("Изменений нет.")
+
+def diff_with_snapshot(conn, path):
+    """Разница каждой таблицы с той же таблицей в другом файле БД (один проход на таблицу)."""
+    snapshot = tablediff.open_snapshot(path)
+    try:
+        return [(hashes.table, tablediff.symmetric_diff(conn, hashes, snapshot, hashes)) for hashes in STAFF_HASHES]
+    finally:
+        snapshot.close()
+
+def print_snapshot_diff(path, diffs):
+    for table, diff in diffs:
+        print(f"\n--- Разница {table} со снимком {path} "
+              f"(диапазонов: {diff.ranges}, совпали по хэшу: {diff.skipped}): ---")
+        for row in diff.only_left:
+            print(f"Только здесь:    {row}")
+        for row in diff.only_right:
+            print(f"Только в снимке: {row}")
+        for here, there in diff.changed:
+            print(f"Различается:     {there} -> {here}")
+        if not (diff.only_left or diff.only_right or diff.changed):
+            print("Различий нет.")
+
+def compare_staff_datasets():
+    """
+    Создает две таблицы (текущий штат и исторические записи) и выполняет
+    взаимное сравнение. Сравнение поддерживается по журналам изменений:
+    вместо двух EXCEPT по полным таблицам пересчитываются только измененные ключи.
+    """
+    parser = argparse.ArgumentParser(description="Сравнение текущего штата с историческими записями")
+    parser.add_argument("--changes", action="store_true",
+                        help="Показать изменения обеих таблиц с прошлого запуска с --changes")
+    parser.add_argument("--diff-with", metavar="ФАЙЛ",
+                        help="Сравнить таблицы с теми же таблицами в другом файле БД (снимке)")
+    args = parser.parse_args()
+
+    db_file_name = "staff division.db"
+    
+    # Открываем существующую БД, схема доводится до актуальной версии
+    conn = migrations.open_database(db_file_name, MIGRATIONS)
+    cursor = conn.cursor()
 
     # --- Вставляем данные ---
     
@@ -47,35 +116,38 @@ def compare_staff_datasets():
         (3, "Сергей Сидоров", "ИТ") 
     ]
 
-    cursor.executemany("INSERT INTO CurrentStaff VALUES (?, ?, ?);", current_staff_data)
-    cursor.executemany("INSERT INTO PastRecords VALUES (?, ?, ?);", past_staff_data)
-    conn.commit()
+    # Данные загружаются только в пустую БД
+    if migrations.is_empty(conn, "CurrentStaff"):
+        cursor.executemany("INSERT INTO CurrentStaff VALUES (?, ?, ?);", current_staff_data)
+        cursor.executemany("INSERT INTO PastRecords VALUES (?, ?, ?);", past_staff_data)
+        conn.commit()
 
     # --- Анализ: Сравнение множеств ---
+    STAFF_COMPARISON.refresh(conn)
+    changes = take_changes(conn, (CURRENT_CAPTURE, PAST_CAPTURE)) if args.changes else None
+    for hashes in STAFF_HASHES:
+        hashes.refresh(conn)
+    connection.apply_profile(conn, "read-report")
 
     # Запрос 1: Найти записи, которые есть только в CurrentStaff
     # Задача: Сотрудники, которые работают сейчас, но не имеют записей в историческом списке (т.е. никогда не увольнялись или их ID уникальны)
     print("--- 1. Уникальные сотрудники (Только в CurrentStaff): ---")
-    cursor.execute("""
-    SELECT StaffID, WorkerName, Division FROM CurrentStaff
-    EXCEPT
-    SELECT StaffID, WorkerName, Division FROM PastRecords;
-    """)
-    for row in cursor.fetchall():
-        print(f"ID: {row[0]}, Имя: {row[1]}, Подразделение: {row[2]}")
+    # То же, что CurrentStaff EXCEPT PastRecords
+    cursor.execute(STAFF_COMPARISON.except_sql("left"))
+    output.print_rows(cursor, lambda row: f"ID: {row[0]}, Имя: {row[1]}, Подразделение: {row[2]}")
 
     # Запрос 2: Найти записи, которые есть только в PastRecords
     # Задача: Сотрудники, которые есть в историческом списке, но отсутствуют в текущем штате (т.е. они не были повторно наняты)
     print("\n--- 2. Невозвращенные сотрудники (Только в PastRecords): ---")
-    cursor.execute("""
-    SELECT StaffID, WorkerName, Division FROM PastRecords
-    EXCEPT
-    SELECT StaffID, WorkerName, Division FROM CurrentStaff;
-    """)
-    for row in cursor.fetchall():
-        print(f"ID: {row[0]}, Имя: {row[1]}, Подразделение: {row[2]}")
-
-    conn.close()
+    cursor.execute(STAFF_COMPARISON.except_sql("right"))
+    output.print_rows(cursor, lambda row: f"ID: {row[0]}, Имя: {row[1]}, Подразделение: {row[2]}")
+
+    if changes is not None:
+        print_changes(changes)
+    if args.diff_with:
+        print_snapshot_diff(args.diff_with, diff_with_snapshot(conn, args.diff_with))
+
+    connection.release(conn)
     print("\nОперация завершена.")
 
 if __name__ == "__main__":
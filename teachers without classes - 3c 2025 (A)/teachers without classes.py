@@ -1,37 +1,43 @@
 # Импорт необходимых модулей
 import sqlite3
 import os
+import sys
+
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import connection, index_advisor, migrations, output
 
 # --- Константы Базы Данных ---
 DB_FILE = "teachers without classes.db" # имя файла
 TABLE_FACULTY = "Faculty"        # Таблица преподавателей
 TABLE_ASSIGNMENTS = "ClassAssignments" # Таблица назначений
 
-def setup_database(db_file):
-    """Устанавливает соединение, удаляет старый файл и создает таблицы."""
-    if os.path.exists(db_file):
-        os.remove(db_file)
-
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-
-    # Создаем основную таблицу: Faculty (Список всех преподавателей)
-    cursor.executescript(f"""
-    CREATE TABLE {TABLE_FACULTY} (
+# --- Миграции схемы ---
+MIGRATIONS = [
+    (1, f"Таблицы {TABLE_FACULTY} и {TABLE_ASSIGNMENTS}", f"""
+    -- Основная таблица: Faculty (Список всех преподавателей)
+    CREATE TABLE IF NOT EXISTS {TABLE_FACULTY} (
         teacher_id INTEGER PRIMARY KEY,
         full_name TEXT NOT NULL,
         department TEXT
     );
 
-    -- Создаем детальную таблицу: ClassAssignments (Записи о назначенных классах)
-    CREATE TABLE {TABLE_ASSIGNMENTS} (
+    -- Детальная таблица: ClassAssignments (Записи о назначенных классах)
+    CREATE TABLE IF NOT EXISTS {TABLE_ASSIGNMENTS} (
         assignment_id INTEGER PRIMARY KEY,
         teacher_ref_id INTEGER,
         class_code TEXT,
         semester TEXT,
         FOREIGN KEY (teacher_ref_id) REFERENCES Faculty(teacher_id)
     );
-    """)
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+]
+
+def setup_database(db_file):
+    """Открывает существующую БД и доводит схему до актуальной версии."""
+    conn = migrations.open_database(db_file, MIGRATIONS)
+    cursor = conn.cursor()
     return conn, cursor
 
 def insert_sample_data(cursor, conn):
@@ -73,12 +79,8 @@ def run_unassigned_teachers_query(cursor):
     print("Преподаватели, не имеющие назначенных классов:")
     print("-" * 70)
     
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"ID: {row[0]:<5} | ФИО: {row[1]:<20} | Отдел: {row[2]}")
-    else:
-        print("Все преподаватели имеют назначенные классы.")
+    output.print_rows(cursor, lambda row: f"ID: {row[0]:<5} | ФИО: {row[1]:<20} | Отдел: {row[2]}",
+                      empty="Все преподаватели имеют назначенные классы.")
     print("-" * 70)
 
 
@@ -87,13 +89,16 @@ def audit_faculty_load():
     conn = None
     try:
         conn, cursor = setup_database(DB_FILE)
-        insert_sample_data(cursor, conn)
+        # Тестовые данные загружаются только в пустую БД
+        if migrations.is_empty(conn, TABLE_FACULTY):
+            insert_sample_data(cursor, conn)
+        connection.apply_profile(conn, "read-report")
         run_unassigned_teachers_query(cursor)
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
     finally:
         if conn:
-            conn.close()
+            connection.release(conn)
 
 if __name__ == "__main__":
     audit_faculty_load()
\ No newline at end of file
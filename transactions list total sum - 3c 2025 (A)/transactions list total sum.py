@@ -1,42 +1,321 @@
-import sqlite3
+import argparse
+import re
 import os
+import stat
+import sys
 from datetime import datetime
 
+# Корень репозитория в sys.path - для общего пакета db_common
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_common import cache, connection, index_advisor, ingest, migrations, money, output
+
 # --- 1. Настройка и подключение к базе данных ---
 
 def setup_database(db_file="transactions list total sum.db"):
-    """Инициализирует подключение и удаляет старый файл, если он существует."""
-    if os.path.exists(db_file):
-        os.remove(db_file)
-        
-    conn = sqlite3.connect(db_file)
+    """Инициализирует подключение к существующей БД (файл создается при первом запуске)."""
+    conn = connection.connect(db_file, "bulk-load", money.DETECT_TYPES)
+    money.register(conn)
     cursor = conn.cursor()
     # Активация проверки внешних ключей
     cursor.execute("PRAGMA foreign_keys = ON;")
     return conn, cursor
 
-def create_schema(cursor):
-    """Создает все необходимые таблицы для магазина."""
-    
-    # Таблица 1: Clients (Клиенты)
-    cursor.execute("""
+# --- Материализованные суммы заказов и расходы клиентов ---
+# Transactions.total_amount - сумма заказа по текущим ценам (как SUM(unit_price * purchased_count)),
+# detail_count - число позиций с существующим товаром: заказ без них не попадает в отчеты,
+# как и при внутреннем соединении. ClientSpend - те же суммы по клиенту.
+TOTALS_TABLES_SQL = """
+ALTER TABLE Transactions ADD COLUMN total_amount REAL NOT NULL DEFAULT 0;
+ALTER TABLE Transactions ADD COLUMN detail_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS ClientSpend (
+    client_ref_id INTEGER PRIMARY KEY,
+    total_spent REAL NOT NULL,
+    detail_count INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_ClientSpend_total_spent ON ClientSpend (total_spent);
+"""
+
+# Пересчет сумм с нуля (начальное заполнение и восстановление после расхождений)
+TOTALS_REBUILD_SQL = """
+UPDATE Transactions SET (total_amount, detail_count) = (
+    SELECT IFNULL(SUM(SI.unit_price * TD.purchased_count), 0), COUNT(*)
+    FROM TransactionDetails TD
+    JOIN StoreItems SI ON SI.item_pk = TD.item_ref_id
+    WHERE TD.transaction_ref_id = Transactions.transaction_pk
+);
+
+DELETE FROM ClientSpend;
+
+INSERT INTO ClientSpend (client_ref_id, total_spent, detail_count)
+SELECT client_ref_id, SUM(total_amount), SUM(detail_count)
+FROM Transactions
+WHERE client_ref_id IS NOT NULL
+GROUP BY client_ref_id;
+"""
+
+# Суммы меняются на разность, без пересчета заказа или клиента целиком
+TOTALS_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_TransactionDetails_total_insert AFTER INSERT ON TransactionDetails
+BEGIN
+    UPDATE Transactions SET 
+        total_amount = total_amount + new.purchased_count * (
+            SELECT unit_price FROM StoreItems WHERE item_pk = new.item_ref_id),
+        detail_count = detail_count + 1
+    WHERE transaction_pk = new.transaction_ref_id
+        AND EXISTS (SELECT 1 FROM StoreItems WHERE item_pk = new.item_ref_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_TransactionDetails_total_delete AFTER DELETE ON TransactionDetails
+BEGIN
+    UPDATE Transactions SET 
+        total_amount = total_amount - old.purchased_count * (
+            SELECT unit_price FROM StoreItems WHERE item_pk = old.item_ref_id),
+        detail_count = detail_count - 1
+    WHERE transaction_pk = old.transaction_ref_id
+        AND EXISTS (SELECT 1 FROM StoreItems WHERE item_pk = old.item_ref_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_TransactionDetails_total_update
+AFTER UPDATE OF transaction_ref_id, item_ref_id, purchased_count ON TransactionDetails
+BEGIN
+    UPDATE Transactions SET 
+        total_amount = total_amount - old.purchased_count * (
+            SELECT unit_price FROM StoreItems WHERE item_pk = old.item_ref_id),
+        detail_count = detail_count - 1
+    WHERE transaction_pk = old.transaction_ref_id
+        AND EXISTS (SELECT 1 FROM StoreItems WHERE item_pk = old.item_ref_id);
+
+    UPDATE Transactions SET 
+        total_amount = total_amount + new.purchased_count * (
+            SELECT unit_price FROM StoreItems WHERE item_pk = new.item_ref_id),
+        detail_count = detail_count + 1
+    WHERE transaction_pk = new.transaction_ref_id
+        AND EXISTS (SELECT 1 FROM StoreItems WHERE item_pk = new.item_ref_id);
+END;
+
+-- Смена цены переоценивает только заказы с этим товаром (поиск по индексу item_ref_id)
+CREATE TRIGGER IF NOT EXISTS trg_StoreItems_total_price AFTER UPDATE OF unit_price ON StoreItems
+WHEN new.unit_price IS NOT old.unit_price
+BEGIN
+    UPDATE Transactions SET 
+        total_amount = total_amount + (new.unit_price - old.unit_price) * (
+            SELECT SUM(purchased_count) FROM TransactionDetails
+            WHERE transaction_ref_id = Transactions.transaction_pk AND item_ref_id = new.item_pk)
+    WHERE transaction_pk IN (SELECT transaction_ref_id FROM TransactionDetails WHERE item_ref_id = new.item_pk);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_StoreItems_total_delete AFTER DELETE ON StoreItems
+BEGIN
+    UPDATE Transactions SET 
+        total_amount = total_amount - old.unit_price * (
+            SELECT SUM(purchased_count) FROM TransactionDetails
+            WHERE transaction_ref_id = Transactions.transaction_pk AND item_ref_id = old.item_pk),
+        detail_count = detail_count - (
+            SELECT COUNT(*) FROM TransactionDetails
+            WHERE transaction_ref_id = Transactions.transaction_pk AND item_ref_id = old.item_pk)
+    WHERE transaction_pk IN (SELECT transaction_ref_id FROM TransactionDetails WHERE item_ref_id = old.item_pk);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Transactions_spend_delta
+AFTER UPDATE OF total_amount, detail_count ON Transactions
+WHEN new.client_ref_id IS old.client_ref_id
+BEGIN
+    UPDATE ClientSpend SET 
+        total_spent = total_spent + (new.total_amount - old.total_amount),
+        detail_count = detail_count + (new.detail_count - old.detail_count)
+    WHERE client_ref_id = new.client_ref_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Transactions_spend_move AFTER UPDATE OF client_ref_id ON Transactions
+WHEN new.client_ref_id IS NOT old.client_ref_id
+BEGIN
+    UPDATE ClientSpend SET 
+        total_spent = total_spent - old.total_amount,
+        detail_count = detail_count - old.detail_count
+    WHERE client_ref_id = old.client_ref_id;
+
+    INSERT INTO ClientSpend (client_ref_id, total_spent, detail_count)
+    SELECT new.client_ref_id, new.total_amount, new.detail_count
+    WHERE new.client_ref_id IS NOT NULL
+    ON CONFLICT (client_ref_id) DO UPDATE SET 
+        total_spent = total_spent + excluded.total_spent,
+        detail_count = detail_count + excluded.detail_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Transactions_spend_insert AFTER INSERT ON Transactions
+WHEN new.client_ref_id IS NOT NULL
+BEGIN
+    INSERT INTO ClientSpend (client_ref_id, total_spent, detail_count)
+    VALUES (new.client_ref_id, new.total_amount, new.detail_count)
+    ON CONFLICT (client_ref_id) DO UPDATE SET 
+        total_spent = total_spent + excluded.total_spent,
+        detail_count = detail_count + excluded.detail_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Transactions_spend_delete AFTER DELETE ON Transactions
+BEGIN
+    UPDATE ClientSpend SET 
+        total_spent = total_spent - old.total_amount,
+        detail_count = detail_count - old.detail_count
+    WHERE client_ref_id = old.client_ref_id;
+END;
+"""
+
+def convert_money_columns(conn):
+    """
+    Шаг миграции: цены и суммы из REAL в целые копейки (money.DECLARED_TYPE),
+    чтобы итоги не зависели от порядка суммирования. Триггеры и индекс,
+    которые ссылаются на эти столбцы, пересоздаются, суммы пересчитываются.
+    """
+    for trigger in re.findall(r"CREATE TRIGGER IF NOT EXISTS (\w+)", TOTALS_TRIGGERS_SQL):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    conn.execute("DROP INDEX IF EXISTS idx_ClientSpend_total_spent;")
+    money.convert_column(conn, "StoreItems", "unit_price")
+    money.convert_column(conn, "Transactions", "total_amount")
+    money.convert_column(conn, "ClientSpend", "total_spent")
+    conn.execute("CREATE INDEX idx_ClientSpend_total_spent ON ClientSpend (total_spent);")
+    for statement in migrations.split_statements(TOTALS_REBUILD_SQL + TOTALS_TRIGGERS_SQL):
+        conn.execute(statement)
+
+# --- Куб продаж: группа x товар x клиент x месяц ---
+# SalesCube хранит несколько уровней агрегации (как GROUPING SETS): номер
+# уровня - битовая маска измерений, у измерений вне уровня NULL. Все уровни
+# содержат месяц, поэтому обновление затрагивает только строки измененных
+# месяцев, а итоги без месяца быстро складываются из помесячных строк.
+# Выручка - по текущим ценам, как и total_amount.
+
+CUBE_DIMENSIONS = {"month": 1, "group": 2, "item": 4, "client": 8}
+CUBE_COLUMNS = {"month": "month", "group": "group_ref_id", "item": "item_ref_id", "client": "client_ref_id"}
+# Хранимые уровни. Товар определяет группу, поэтому уровни с товаром хранят и группу.
+# Срезы товар x клиент почти не меньше самих позиций - они считаются по исходным строкам.
+CUBE_LEVELS = [
+    ("month",),
+    ("month", "group"),
+    ("month", "item"),
+    ("month", "client"),
+    ("month", "group", "client"),
+]
+
+CUBE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS SalesCube (
+    level INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    group_ref_id INTEGER,
+    item_ref_id INTEGER,
+    client_ref_id INTEGER,
+    units INTEGER NOT NULL,
+    revenue MONEY INTEGER NOT NULL,
+    lines INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_SalesCube_level_month ON SalesCube (level, month);
+
+-- Месяцы, которые нужно пересчитать (заполняются триггерами)
+CREATE TABLE IF NOT EXISTS CubeDirtyMonths (
+    month TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+-- Товары с новой группой (или удаленные): их месяцы в архиве находит refresh_cube
+CREATE TABLE IF NOT EXISTS CubeRepricedItems (
+    item_ref_id INTEGER PRIMARY KEY
+) WITHOUT ROWID;
+
+-- Все месяцы с заказами, включая архивные разделы, - для первого заполнения
+INSERT OR IGNORE INTO CubeDirtyMonths
+SELECT DISTINCT substr(transaction_date, 1, 7) FROM Transactions;
+
+WITH RECURSIVE Months (month, date_to) AS (
+    SELECT substr(date_from, 1, 7), date_to FROM TransactionPartitions
+    UNION ALL
+    SELECT strftime('%Y-%m', month || '-01', '+1 month'), date_to
+    FROM Months
+    WHERE date(month || '-01', '+1 month') < date_to
+)
+INSERT OR IGNORE INTO CubeDirtyMonths SELECT month FROM Months;
+"""
+
+CUBE_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_TransactionDetails_cube_insert AFTER INSERT ON TransactionDetails
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths
+    SELECT substr(transaction_date, 1, 7) FROM Transactions WHERE transaction_pk = new.transaction_ref_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_TransactionDetails_cube_delete AFTER DELETE ON TransactionDetails
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths
+    SELECT substr(transaction_date, 1, 7) FROM Transactions WHERE transaction_pk = old.transaction_ref_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_TransactionDetails_cube_update
+AFTER UPDATE OF transaction_ref_id, item_ref_id, purchased_count ON TransactionDetails
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths
+    SELECT substr(transaction_date, 1, 7) FROM Transactions
+    WHERE transaction_pk IN (old.transaction_ref_id, new.transaction_ref_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Transactions_cube_update
+AFTER UPDATE OF transaction_date, client_ref_id ON Transactions
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths
+    VALUES (substr(old.transaction_date, 1, 7)), (substr(new.transaction_date, 1, 7));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Transactions_cube_delete AFTER DELETE ON Transactions
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths VALUES (substr(old.transaction_date, 1, 7));
+END;
+
+-- Архив в триггере недоступен: месяцы основной БД помечаются сразу,
+-- а товар запоминается, если есть архивные разделы и сменилась группа
+-- (выручка архива считается по ценам на момент переноса и от цены не зависит)
+CREATE TRIGGER IF NOT EXISTS trg_StoreItems_cube_update AFTER UPDATE OF unit_price, group_ref_id ON StoreItems
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths
+    SELECT DISTINCT substr(T.transaction_date, 1, 7)
+    FROM TransactionDetails TD
+    JOIN Transactions T ON T.transaction_pk = TD.transaction_ref_id
+    WHERE TD.item_ref_id = new.item_pk;
+    INSERT OR IGNORE INTO CubeRepricedItems
+    SELECT new.item_pk
+    WHERE new.group_ref_id IS NOT old.group_ref_id AND EXISTS (SELECT 1 FROM TransactionPartitions);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_StoreItems_cube_delete AFTER DELETE ON StoreItems
+BEGIN
+    INSERT OR IGNORE INTO CubeDirtyMonths
+    SELECT DISTINCT substr(T.transaction_date, 1, 7)
+    FROM TransactionDetails TD
+    JOIN Transactions T ON T.transaction_pk = TD.transaction_ref_id
+    WHERE TD.item_ref_id = old.item_pk;
+    INSERT OR IGNORE INTO CubeRepricedItems
+    SELECT old.item_pk WHERE EXISTS (SELECT 1 FROM TransactionPartitions);
+END;
+"""
+
+# Таблицы, в которые пишет код отчета и загрузка (счетчики изменений для кэша)
+BASE_TABLES = ["Clients", "Groups", "StoreItems", "Transactions", "TransactionDetails"]
+
+# Шаги миграций: применяются по порядку, каждый ровно один раз
+MIGRATIONS = [
+    (1, "Таблицы магазина: клиенты, категории, товары, заказы", """
+    -- Таблица 1: Clients (Клиенты)
     CREATE TABLE IF NOT EXISTS Clients (
         client_pk INTEGER PRIMARY KEY AUTOINCREMENT,
         full_name TEXT NOT NULL,
         contact_email TEXT NOT NULL
     );
-    """)
 
-    # Таблица 2: Groups (Категории)
-    cursor.execute("""
+    -- Таблица 2: Groups (Категории)
     CREATE TABLE IF NOT EXISTS Groups (
         group_pk INTEGER PRIMARY KEY AUTOINCREMENT,
         group_title TEXT NOT NULL
     );
-    """)
 
-    # Таблица 3: StoreItems (Товары)
-    cursor.execute("""
+    -- Таблица 3: StoreItems (Товары)
     CREATE TABLE IF NOT EXISTS StoreItems (
         item_pk INTEGER PRIMARY KEY AUTOINCREMENT,
         item_name TEXT NOT NULL,
@@ -44,20 +323,16 @@ def create_schema(cursor):
         group_ref_id INTEGER,
         FOREIGN KEY (group_ref_id) REFERENCES Groups(group_pk)
     );
-    """)
 
-    # Таблица 4: Transactions (Заказы)
-    cursor.execute("""
+    -- Таблица 4: Transactions (Заказы)
     CREATE TABLE IF NOT EXISTS Transactions (
         transaction_pk INTEGER PRIMARY KEY AUTOINCREMENT,
         client_ref_id INTEGER,
         transaction_date TEXT NOT NULL,
         FOREIGN KEY (client_ref_id) REFERENCES Clients(client_pk)
     );
-    """)
 
-    # Таблица 5: TransactionDetails (Детали заказа/Позиции)
-    cursor.execute("""
+    -- Таблица 5: TransactionDetails (Детали заказа/Позиции)
     CREATE TABLE IF NOT EXISTS TransactionDetails (
         detail_pk INTEGER PRIMARY KEY AUTOINCREMENT,
         transaction_ref_id INTEGER,
@@ -66,8 +341,43 @@ def create_schema(cursor):
         FOREIGN KEY (transaction_ref_id) REFERENCES Transactions(transaction_pk),
         FOREIGN KEY (item_ref_id) REFERENCES StoreItems(item_pk)
     );
-    """)
-    print("Схема базы данных успешно создана.")
+    """),
+    (2, "Индексы по внешним ключам", index_advisor.create_foreign_key_indexes),
+    (3, "Счетчики изменений таблиц для кэша результатов", cache.change_counter_script(BASE_TABLES)),
+    (4, "Суммы заказов и расходы клиентов с триггерами",
+     TOTALS_TABLES_SQL + TOTALS_REBUILD_SQL + TOTALS_TRIGGERS_SQL),
+    (5, "Цены и суммы в целых копейках", convert_money_columns),
+    (6, "Каталог архивных разделов заказов и индекс по дате", """
+    CREATE TABLE IF NOT EXISTS TransactionPartitions (
+        period TEXT PRIMARY KEY,
+        date_from TEXT NOT NULL,
+        date_to TEXT NOT NULL,
+        transactions INTEGER NOT NULL,
+        details INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_Transactions_transaction_date ON Transactions (transaction_date);
+    """),
+    (7, "Куб продаж и пометка измененных месяцев", CUBE_TABLES_SQL + CUBE_TRIGGERS_SQL),
+    # Счетчики отмечает пишущий код (cache.record_changes), ClientSpend - без счетчика
+    (8, "Счетчики изменений без построчных триггеров",
+     cache.untrack_tables_script(BASE_TABLES + ["ClientSpend"]) + cache.change_counter_script(BASE_TABLES)),
+    # Смена цены больше не помечает архивные месяцы куба (остальные триггеры уже есть)
+    (9, "Куб: архивные месяцы по ценам на момент переноса",
+     "DROP TRIGGER IF EXISTS trg_StoreItems_cube_update;\n" + CUBE_TRIGGERS_SQL),
+]
+
+# Кэш результатов аналитических запросов (живет, пока жив процесс)
+RESULT_CACHE = cache.ResultCache()
+
+def create_schema(cursor):
+    """Доводит все необходимые таблицы для магазина до актуальной версии схемы."""
+    before, after = migrations.migrate(cursor.connection, MIGRATIONS)
+    if before == after:
+        print(f"Схема базы данных актуальна (версия {after}).")
+    else:
+        print("Схема базы данных успешно создана.")
 
 
 def insert_data(cursor, conn):
@@ -91,12 +401,12 @@ def insert_data(cursor, conn):
 
     # 3. StoreItems
     item_data = [
-        ("Кофе-машина", 650.00, 1),
-        ("Термос", 50.00, 1),
-        ("Кроссовки беговые", 90.00, 2),
-        ("Фитнес-браслет", 35.00, 2),
-        ("Антивирус Premium", 12.50, 3),
-        ("Графический редактор", 55.00, 3)
+        ("Кофе-машина", money.Money.from_decimal("650.00"), 1),
+        ("Термос", money.Money.from_decimal("50.00"), 1),
+        ("Кроссовки беговые", money.Money.from_decimal("90.00"), 2),
+        ("Фитнес-браслет", money.Money.from_decimal("35.00"), 2),
+        ("Антивирус Premium", money.Money.from_decimal("12.50"), 3),
+        ("Графический редактор", money.Money.from_decimal("55.00"), 3)
     ]
     cursor.executemany("INSERT INTO StoreItems (item_name, unit_price, group_ref_id) VALUES (?, ?, ?);", item_data)
 
@@ -121,10 +431,529 @@ def insert_data(cursor, conn):
         (4, 1, 1), # Максим: Кофе-машина
     ]
     cursor.executemany("INSERT INTO TransactionDetails (transaction_ref_id, item_ref_id, purchased_count) VALUES (?, ?, ?);", details_data)
-    
-    conn.commit()
+    cache.record_changes(conn, BASE_TABLES)
+    cache.commit(conn)
     print("Данные успешно вставлены.")
 
+# Столбцы позиций заказов во входных файлах (detail_pk назначается автоматически)
+TRANSACTION_DETAILS_COLUMNS = ["transaction_ref_id", "item_ref_id", "purchased_count"]
+
+def ingest_transaction_details(conn, path, batch_size=ingest.DEFAULT_BATCH_SIZE):
+    """Потоково загружает позиции заказов из CSV/JSONL-файла пачками в транзакциях."""
+    stats = ingest.ingest_file(conn, "TransactionDetails", path, TRANSACTION_DETAILS_COLUMNS,
+                               batch_size=batch_size)
+    print(f"Загружено из {path}: {stats}")
+    return stats
+
+def rebuild_totals(conn):
+    """
+    Пересчитывает суммы заказов и расходы клиентов по всем позициям. Суммы
+    архивных заказов не пересчитываются (архив только для чтения) и входят
+    в ClientSpend как есть.
+    """
+    money.register(conn)
+    periods = attach_archive(conn, views=False)
+    conn.execute("BEGIN;")
+    try:
+        for statement in migrations.split_statements(TOTALS_REBUILD_SQL):
+            conn.execute(statement)
+        if periods:
+            add_archived_spend(conn, archive_source(conn, "Transactions", periods))
+        cache.record_changes(conn, ["Transactions", "ClientSpend"])
+        cache.commit(conn)
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+
+def check_totals(conn):
+    """
+    Сверяет сохраненные суммы с полным пересчетом (точно, в копейках). Возвращает
+    список расхождений (таблица, ключ, сохранено, ожидается) - пустой, если все сходится.
+    """
+    money.register(conn)
+    periods = attach_archive(conn, views=False)
+    archived = ("UNION ALL SELECT client_ref_id, total_amount, detail_count FROM "
+                + archive_source(conn, "Transactions", periods)) if periods else ""
+    mismatches = conn.execute(f"""
+    WITH Expected AS (
+        SELECT 
+            T.transaction_pk, T.client_ref_id,
+            IFNULL(money_sum(SI.unit_price * TD.purchased_count), 0) AS total_amount,
+            COUNT(SI.item_pk) AS detail_count
+        FROM 
+            Transactions T
+        LEFT JOIN 
+            TransactionDetails TD ON TD.transaction_ref_id = T.transaction_pk
+        LEFT JOIN 
+            StoreItems SI ON SI.item_pk = TD.item_ref_id
+        GROUP BY 
+            T.transaction_pk
+    )
+    SELECT 
+        'Transactions', T.transaction_pk, money_text(T.total_amount) || ' / ' || T.detail_count,
+        money_text(E.total_amount) || ' / ' || E.detail_count
+    FROM 
+        Transactions T
+    JOIN 
+        Expected E ON E.transaction_pk = T.transaction_pk
+    WHERE 
+        T.total_amount != E.total_amount OR T.detail_count != E.detail_count
+    UNION ALL
+    SELECT 
+        'ClientSpend', C.client_ref_id,
+        IFNULL(money_text(CS.total_spent) || ' / ' || CS.detail_count, 'нет строки'),
+        money_text(C.total_amount) || ' / ' || C.detail_count
+    FROM 
+        (SELECT client_ref_id, money_sum(total_amount) AS total_amount, SUM(detail_count) AS detail_count
+         FROM (SELECT client_ref_id, total_amount, detail_count FROM Expected {archived})
+         WHERE client_ref_id IS NOT NULL GROUP BY client_ref_id) C
+    LEFT JOIN 
+        ClientSpend CS ON CS.client_ref_id = C.client_ref_id
+    WHERE 
+        CS.client_ref_id IS NULL
+        OR CS.total_spent != C.total_amount OR CS.detail_count != C.detail_count;
+    """).fetchall()
+    return mismatches
+
+def print_check(conn):
+    """Печатает результат сверки сумм; возвращает True, если расхождений нет."""
+    mismatches = check_totals(conn)
+    if not mismatches:
+        print("Суммы заказов и расходы клиентов совпадают с пересчетом.")
+        return True
+    print(f"Найдено расхождений: {len(mismatches)} (сохранено -> ожидается, сумма / позиций):")
+    for table, key, stored, expected in mismatches:
+        print(f"  {table} #{key}: {stored} -> {expected}")
+    print("Для исправления вызовите rebuild_totals(conn).")
+    return False
+
+# --- Разделы заказов по датам ---
+# Заказы закрытых периодов (год или месяц) переносятся из основной БД в файл
+# архива "<БД>.archive.db": у каждого периода свои таблицы Transactions_<период>
+# и TransactionDetails_<период>. Архив подключается только для чтения, и запрос
+# с диапазоном дат читает лишь те разделы, чьи периоды пересекаются с ним.
+# Один файл вместо файла на период: SQLite подключает не больше 10 баз сразу.
+# Каталог разделов - таблица TransactionPartitions основной БД. Позиции раздела
+# хранят цену на момент переноса (unit_price): суммы архивных заказов заморожены,
+# и куб считает их выручку по тем же ценам, а не по текущему каталогу.
+
+ARCHIVE_SCHEMA = "archive"
+TRANSACTION_COLUMNS = "transaction_pk, client_ref_id, transaction_date, total_amount, detail_count"
+DETAIL_COLUMNS = "detail_pk, transaction_ref_id, item_ref_id, purchased_count"
+
+PARTITION_TABLES_SQL = """
+CREATE TABLE {transactions} (
+    transaction_pk INTEGER PRIMARY KEY,
+    client_ref_id INTEGER,
+    transaction_date TEXT NOT NULL,
+    total_amount MONEY INTEGER NOT NULL,
+    detail_count INTEGER NOT NULL
+);
+
+CREATE TABLE {details} (
+    detail_pk INTEGER PRIMARY KEY,
+    transaction_ref_id INTEGER NOT NULL,
+    item_ref_id INTEGER,
+    purchased_count INTEGER NOT NULL,
+    unit_price MONEY INTEGER
+);
+"""
+
+PARTITION_INDEXES_SQL = """
+CREATE INDEX {schema}.idx_{suffix}_transaction_date ON Transactions_{suffix} (transaction_date);
+CREATE INDEX {schema}.idx_{suffix}_transaction_ref_id ON TransactionDetails_{suffix} (transaction_ref_id);
+"""
+
+def period_bounds(period):
+    """Полуинтервал дат [начало, конец) периода "ГГГГ" или "ГГГГ-ММ"."""
+    if len(period) == 4:
+        year = int(period)
+        return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+    year, month = map(int, period.split("-"))
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{period}-01", f"{year:04d}-{month:02d}-01"
+
+def partition_table(table, period):
+    """Таблица раздела в архиве, например archive.Transactions_2022_03."""
+    return f"{ARCHIVE_SCHEMA}.{table}_{period.replace('-', '_')}"
+
+def archive_file(conn):
+    """Файл архива рядом с основной БД."""
+    main_file = conn.execute("PRAGMA database_list;").fetchone()[2]
+    return os.path.splitext(main_file)[0] + ".archive.db"
+
+def archived_periods(conn, date_from=None, date_to=None):
+    """Периоды архива, пересекающиеся с [date_from, date_to) (без границ - все)."""
+    return [period for period, period_from, period_to in conn.execute(
+                "SELECT period, date_from, date_to FROM TransactionPartitions ORDER BY date_from;").fetchall()
+            if (date_to is None or period_from < date_to) and (date_from is None or period_to > date_from)]
+
+def _archive_attached(conn):
+    return any(name == ARCHIVE_SCHEMA for _, name, _ in conn.execute("PRAGMA database_list;").fetchall())
+
+def attach_archive(conn, views=True):
+    """
+    Подключает архив только для чтения (если в каталоге есть разделы) и
+    возвращает список периодов. views=True пересоздает временные представления
+    AllTransactions и AllTransactionDetails (UNION ALL основной БД и всех
+    разделов) - это запись во временную БД, поэтому вызывать до профиля read-report.
+    """
+    periods = archived_periods(conn)
+    if periods and not _archive_attached(conn):
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA};", ("file:" + archive_file(conn) + "?mode=ro",))
+    if views:
+        for view, table in (("AllTransactions", "Transactions"), ("AllTransactionDetails", "TransactionDetails")):
+            conn.execute(f"DROP VIEW IF EXISTS temp.{view};")
+            conn.execute(f"CREATE TEMP VIEW {view} AS SELECT * FROM {union_source(conn, table)};")
+    return periods
+
+def archive_source(conn, table, periods):
+    """Подзапрос UNION ALL по таблицам разделов periods (архив должен быть подключен)."""
+    columns = TRANSACTION_COLUMNS if table == "Transactions" else DETAIL_COLUMNS
+    return "(" + " UNION ALL ".join(
+        f"SELECT {columns} FROM {partition_table(table, period)}" for period in periods) + ")"
+
+def union_source(conn, table, date_from=None, date_to=None, branch=None):
+    """
+    Источник для FROM: основная таблица и разделы архива, пересекающиеся с
+    [date_from, date_to). Основная БД читается всегда - в нее можно дописать
+    заказ задним числом. Без подходящих разделов - просто имя таблицы.
+
+    branch - запрос к одному источнику с {source} вместо таблицы, например
+    частичная агрегация: он выполняется в каждом разделе, а объединяются уже
+    его результаты. Иначе SQLite материализует все строки UNION ALL перед
+    соединением с другими таблицами.
+    """
+    periods = archived_periods(conn, date_from, date_to)
+    if branch is None:
+        if not periods:
+            return table
+        columns = TRANSACTION_COLUMNS if table == "Transactions" else DETAIL_COLUMNS
+        branch = f"SELECT {columns} FROM {{source}}"
+    if periods:
+        attach_archive(conn, views=False)
+    sources = [f"main.{table}"] + [partition_table(table, period) for period in periods]
+    return "(" + " UNION ALL ".join(branch.format(source=source) for source in sources) + ")"
+
+def add_archived_spend(conn, source):
+    """Добавляет суммы архивных заказов из source к ClientSpend (расходы клиента - за все время)."""
+    conn.execute(f"""
+    INSERT INTO ClientSpend (client_ref_id, total_spent, detail_count)
+    SELECT client_ref_id, money_sum(total_amount), SUM(detail_count)
+    FROM {source}
+    WHERE client_ref_id IS NOT NULL
+    GROUP BY client_ref_id
+    ON CONFLICT (client_ref_id) DO UPDATE SET 
+        total_spent = total_spent + excluded.total_spent,
+        detail_count = detail_count + excluded.detail_count;
+    """)
+
+def archive_partition(conn, period):
+    """
+    Переносит заказы периода ("ГГГГ" или "ГГГГ-ММ") вместе с позициями в архив.
+    Сначала фиксируется запись в архив, затем в одной транзакции основной БД -
+    удаление и запись в каталог: при сбое между ними раздел не попадет в каталог,
+    а его таблицы пересоздаются при повторе. Файл архива открыт на запись только
+    на время переноса. Возвращает (заказов, позиций).
+    """
+    money.register(conn)
+    if conn.execute("SELECT 1 FROM TransactionPartitions WHERE period = ?;", (period,)).fetchone():
+        raise ValueError(f"Раздел {period} уже в архиве")
+    date_from, date_to = period_bounds(period)
+    transactions_table = partition_table("Transactions", period)
+    details_table = partition_table("TransactionDetails", period)
+    path = archive_file(conn)
+
+    if _archive_attached(conn):
+        conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA};")
+    if os.path.exists(path):
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA};", (path,))
+    try:
+        conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode = DELETE;")
+        conn.execute("BEGIN;")
+        try:
+            conn.execute(f"DROP TABLE IF EXISTS {transactions_table};")
+            conn.execute(f"DROP TABLE IF EXISTS {details_table};")
+            for statement in migrations.split_statements(
+                    PARTITION_TABLES_SQL.format(transactions=transactions_table, details=details_table)):
+                conn.execute(statement)
+            transactions = conn.execute(f"""
+            INSERT INTO {transactions_table} ({TRANSACTION_COLUMNS})
+            SELECT {TRANSACTION_COLUMNS} FROM main.Transactions
+            WHERE transaction_date >= ? AND transaction_date < ?;
+            """, (date_from, date_to)).rowcount
+            detail_columns = ", ".join(f"TD.{column}" for column in DETAIL_COLUMNS.split(", "))
+            details = conn.execute(f"""
+            INSERT INTO {details_table} ({DETAIL_COLUMNS}, unit_price)
+            SELECT {detail_columns}, SI.unit_price
+            FROM main.TransactionDetails TD
+            LEFT JOIN main.StoreItems SI ON SI.item_pk = TD.item_ref_id
+            WHERE TD.transaction_ref_id IN (SELECT transaction_pk FROM {transactions_table});
+            """).rowcount
+            for statement in migrations.split_statements(
+                    PARTITION_INDEXES_SQL.format(schema=ARCHIVE_SCHEMA, suffix=period.replace("-", "_"))):
+                conn.execute(statement)
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+
+        # Триггеры уменьшат ClientSpend на удаленные суммы - они возвращаются из раздела
+        conn.execute("BEGIN;")
+        try:
+            conn.execute(f"""
+            DELETE FROM main.TransactionDetails
+            WHERE transaction_ref_id IN (SELECT transaction_pk FROM {transactions_table});
+            """)
+            conn.execute(f"""
+            DELETE FROM main.Transactions
+            WHERE transaction_pk IN (SELECT transaction_pk FROM {transactions_table});
+            """)
+            add_archived_spend(conn, transactions_table)
+            cache.record_changes(conn, ["Transactions", "TransactionDetails", "TransactionPartitions"])
+            conn.execute("""
+            INSERT INTO TransactionPartitions (period, date_from, date_to, transactions, details, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?);
+            """, (period, date_from, date_to, transactions, details, datetime.now().isoformat(timespec="seconds")))
+            cache.commit(conn)
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+    finally:
+        conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA};")
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return transactions, details
+
+def archive_before(conn, cutoff, granularity="year"):
+    """
+    Архивирует все закрытые периоды (год или месяц), которые целиком раньше
+    даты cutoff и в которых есть заказы в основной БД. Возвращает список периодов.
+    """
+    length = 4 if granularity == "year" else 7
+    periods = [row[0] for row in conn.execute(f"""
+    SELECT DISTINCT substr(transaction_date, 1, {length})
+    FROM Transactions
+    WHERE transaction_date < ?
+    ORDER BY 1;
+    """, (cutoff,)).fetchall()]
+    archived = []
+    for period in periods:
+        if period_bounds(period)[1] <= cutoff:
+            transactions, details = archive_partition(conn, period)
+            print(f"Раздел {period}: в архив перенесено заказов {transactions}, позиций {details}.")
+            archived.append(period)
+    return archived
+
+# --- Куб продаж: обновление и срезы ---
+
+def cube_level(dimensions):
+    """Номер уровня куба (битовая маска) для набора измерений."""
+    try:
+        return sum(CUBE_DIMENSIONS[dimension] for dimension in set(dimensions))
+    except KeyError as error:
+        raise ValueError(f"Неизвестное измерение куба: {error.args[0]!r}") from None
+
+def _level_covers(level_dimensions, needed):
+    available = set(level_dimensions)
+    if "item" in available:
+        available.add("group")
+    return set(needed) <= available
+
+def _frozen_prices(conn, period):
+    """Хранит ли раздел цены на момент переноса (разделы, перенесенные раньше, - нет)."""
+    table = partition_table("TransactionDetails", period).split(".")[1]
+    return any(row[1] == "unit_price" for row in conn.execute(
+        f"PRAGMA {ARCHIVE_SCHEMA}.table_info({table});"))
+
+def _sales_sources(conn, date_from=None, date_to=None):
+    """
+    Источники строк продаж для куба: (заказы, позиции, цена, соединение с
+    каталогом) по основной БД и разделам архива, пересекающимся с
+    [date_from, date_to). Выручка архива - по цене из раздела, как и
+    замороженные суммы его заказов; позиции без цены в разделе не учитываются.
+    """
+    periods = archived_periods(conn, date_from, date_to)
+    if periods:
+        attach_archive(conn, views=False)
+    sources = [("main.Transactions", "main.TransactionDetails", "SI.unit_price", "JOIN")]
+    for period in periods:
+        frozen = _frozen_prices(conn, period)
+        sources.append((partition_table("Transactions", period), partition_table("TransactionDetails", period),
+                        "TD.unit_price" if frozen else "SI.unit_price", "LEFT JOIN" if frozen else "JOIN"))
+    return sources
+
+def _cube_base_sql(conn, month):
+    """
+    Строки месяца в разрезе месяц x группа x товар x клиент по основной БД
+    и архивным разделам этого месяца (соединение позиций с заказом - внутри раздела).
+    """
+    date_from, date_to = period_bounds(month)
+    sources = _sales_sources(conn, date_from, date_to)
+    branches = [f"""
+        SELECT SI.group_ref_id, TD.item_ref_id, T.client_ref_id,
+               SUM(TD.purchased_count) AS units, SUM({price} * TD.purchased_count) AS revenue,
+               COUNT(*) AS lines
+        FROM {transactions} T
+        JOIN {details} TD ON TD.transaction_ref_id = T.transaction_pk
+        {join} StoreItems SI ON SI.item_pk = TD.item_ref_id
+        WHERE T.transaction_date >= ? AND T.transaction_date < ? AND {price} IS NOT NULL
+        GROUP BY 1, 2, 3""" for transactions, details, price, join in sources]
+    sql = f"""
+    SELECT group_ref_id, item_ref_id, client_ref_id, SUM(units), SUM(revenue), SUM(lines)
+    FROM ({" UNION ALL ".join(branches)})
+    GROUP BY 1, 2, 3;
+    """
+    return sql, [date_from, date_to] * len(sources)
+
+def _mark_repriced_months(conn):
+    """
+    Переносит товары из CubeRepricedItems в CubeDirtyMonths: помечает архивные
+    месяцы, где эти товары продавались (группа берется из текущего каталога).
+    """
+    if conn.execute("SELECT 1 FROM CubeRepricedItems LIMIT 1;").fetchone() is None:
+        return
+    months = set()
+    for period in attach_archive(conn, views=False):
+        months.update(row[0] for row in conn.execute(f"""
+        SELECT DISTINCT substr(T.transaction_date, 1, 7)
+        FROM {partition_table("Transactions", period)} T
+        JOIN {partition_table("TransactionDetails", period)} TD ON TD.transaction_ref_id = T.transaction_pk
+        WHERE TD.item_ref_id IN (SELECT item_ref_id FROM main.CubeRepricedItems);
+        """))
+    conn.execute("BEGIN;")
+    conn.executemany("INSERT OR IGNORE INTO CubeDirtyMonths (month) VALUES (?);", [(month,) for month in months])
+    conn.execute("DELETE FROM CubeRepricedItems;")
+    cache.record_changes(conn, ["CubeDirtyMonths", "CubeRepricedItems"])
+    cache.commit(conn)
+
+def refresh_cube(conn, full=False):
+    """
+    Пересчитывает строки куба для месяцев из CubeDirtyMonths (full=True - для
+    всех месяцев с заказами). Каждый месяц - отдельная транзакция: сначала
+    строки нижнего уровня во временную таблицу, из нее - все уровни CUBE_LEVELS.
+    Возвращает число пересчитанных месяцев.
+    """
+    if full:
+        months = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT substr(transaction_date, 1, 7) FROM {union_source(conn, 'Transactions')} ORDER BY 1;")]
+        conn.execute("BEGIN;")
+        conn.execute("DELETE FROM SalesCube;")
+        conn.execute("DELETE FROM CubeDirtyMonths;")
+        conn.execute("DELETE FROM CubeRepricedItems;")
+        conn.executemany("INSERT INTO CubeDirtyMonths (month) VALUES (?);", [(month,) for month in months])
+        cache.record_changes(conn, ["SalesCube", "CubeDirtyMonths", "CubeRepricedItems"])
+        cache.commit(conn)
+    else:
+        _mark_repriced_months(conn)
+    months = [row[0] for row in conn.execute("SELECT month FROM CubeDirtyMonths ORDER BY month;")]
+
+    conn.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS CubeBase (
+        group_ref_id INTEGER, item_ref_id INTEGER, client_ref_id INTEGER,
+        units INTEGER, revenue INTEGER, lines INTEGER
+    );
+    """)
+    for month in months:
+        # Запрос строится до BEGIN: подключать архив внутри транзакции нельзя
+        base_sql, params = _cube_base_sql(conn, month)
+        conn.execute("BEGIN;")
+        try:
+            conn.execute("DELETE FROM temp.CubeBase;")
+            conn.execute("INSERT INTO temp.CubeBase " + base_sql, params)
+            levels = [cube_level(level) for level in CUBE_LEVELS]
+            conn.execute(f"DELETE FROM SalesCube WHERE level IN ({', '.join('?' * len(levels))}) AND month = ?;",
+                         levels + [month])
+            for level in CUBE_LEVELS:
+                grouped = [CUBE_COLUMNS[dimension] for dimension in level if dimension != "month"]
+                if "item" in level and "group" not in level:
+                    grouped.append("group_ref_id")
+                columns = ", ".join(
+                    column if column in grouped else "NULL"
+                    for column in ("group_ref_id", "item_ref_id", "client_ref_id"))
+                conn.execute(f"""
+                INSERT INTO SalesCube
+                    (level, month, group_ref_id, item_ref_id, client_ref_id, units, revenue, lines)
+                SELECT ?, ?, {columns}, SUM(units), SUM(revenue), SUM(lines)
+                FROM temp.CubeBase
+                {"GROUP BY " + ", ".join(grouped) if grouped else ""}
+                {"" if grouped else "HAVING COUNT(*) > 0"};
+                """, (cube_level(level), month))
+            conn.execute("DELETE FROM CubeDirtyMonths WHERE month = ?;", (month,))
+            cache.record_changes(conn, ["SalesCube", "CubeDirtyMonths"])
+            cache.commit(conn)
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+    return len(months)
+
+def cube_query(conn, dimensions, month_from=None, month_to=None, **filters):
+    """
+    Срез куба: строки (значения dimensions..., единиц, выручка, позиций) с
+    фильтрами по месяцам [month_from, month_to] ("ГГГГ-ММ") и по значениям
+    измерений (group=3, client=17, ...). Берется самый мелкий хранимый уровень,
+    который содержит нужные измерения; если такого нет (например, товар x клиент),
+    срез считается по исходным строкам. Не забудьте refresh_cube перед чтением.
+    """
+    dimensions = list(dimensions)
+    needed = set(dimensions) | set(filters)
+    cube_level(needed)
+    columns = [CUBE_COLUMNS[dimension] for dimension in dimensions]
+    conditions, params = [], []
+    if month_from is not None:
+        conditions.append("month >= ?")
+        params.append(month_from)
+    if month_to is not None:
+        conditions.append("month <= ?")
+        params.append(month_to)
+    for dimension, value in filters.items():
+        conditions.append(f"{CUBE_COLUMNS[dimension]} = ?")
+        params.append(value)
+
+    levels = [level for level in CUBE_LEVELS if _level_covers(level, needed)]
+    if levels:
+        level = min(levels, key=len)
+        source = "SalesCube"
+        conditions.insert(0, "level = ?")
+        params.insert(0, cube_level(level))
+    else:
+        date_from = period_bounds(month_from)[0] if month_from else None
+        date_to = period_bounds(month_to)[1] if month_to else None
+        source = "(" + " UNION ALL ".join(f"""
+            SELECT substr(T.transaction_date, 1, 7) AS month, SI.group_ref_id, TD.item_ref_id, T.client_ref_id,
+                   TD.purchased_count AS units, {price} * TD.purchased_count AS revenue, 1 AS lines
+            FROM {transactions} T
+            JOIN {details} TD ON TD.transaction_ref_id = T.transaction_pk
+            {join} StoreItems SI ON SI.item_pk = TD.item_ref_id
+            WHERE {price} IS NOT NULL"""
+            for transactions, details, price, join in _sales_sources(conn, date_from, date_to)) + ")"
+    group_by = ", ".join(columns)
+    rows = conn.execute(f"""
+    SELECT {group_by + ", " if columns else ""}SUM(units), SUM(revenue), SUM(lines)
+    FROM {source}
+    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+    {"GROUP BY " + group_by if columns else ""}
+    {"ORDER BY " + group_by if columns else ""};
+    """, params).fetchall()
+    return [row[:-3] + (row[-3], money.Money(row[-2] or 0), row[-1]) for row in rows if row[-1]]
+
+def drill_down(conn, dimensions, dimension, **options):
+    """Детализация: тот же срез с еще одним измерением."""
+    return cube_query(conn, list(dimensions) + [dimension], **options)
+
+def roll_up(conn, dimensions, dimension, **options):
+    """Обобщение: тот же срез без измерения dimension."""
+    return cube_query(conn, [d for d in dimensions if d != dimension], **options)
+
+def print_cube(conn, dimensions, month_from=None, month_to=None):
+    """Печатает срез куба: измерения, единиц, выручка, позиций."""
+    rows = cube_query(conn, dimensions, month_from, month_to)
+    print(f"\nСрез куба продаж: {' x '.join(dimensions) or 'итого'}")
+    for row in rows:
+        print(money.format_row(row))
+    if not rows:
+        print("Нет данных.")
+
 def execute_queries(cursor):
     """Выполняет набор аналитических SQL-запросов."""
     
@@ -132,26 +961,30 @@ def execute_queries(cursor):
 
     # Запрос 1: Клиенты, сделавшие заказы после 2023-01-01 (Дата изменена для получения того же результата)
     print("\n1. Клиенты, чьи заказы были оформлены в 2023 году или позже:")
-    cursor.execute("""
+    conn = cursor.connection
+    result = RESULT_CACHE.execute(cursor, f"""
     SELECT DISTINCT 
         C.full_name, C.contact_email
     FROM 
         Clients C
     INNER JOIN 
-        Transactions T ON C.client_pk = T.client_ref_id
+        {union_source(conn, "Transactions", date_from="2023-01-01")} T ON C.client_pk = T.client_ref_id
     WHERE 
         T.transaction_date >= '2023-01-01';
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result)
 
     # Запрос 2: Общее количество проданных единиц по категориям товаров
     print("\n2. Объем продаж по группам товаров (по количеству единиц):")
-    cursor.execute("""
+    # В каждом разделе - частичные суммы по товарам, затем они складываются по группам
+    details = union_source(conn, "TransactionDetails", branch="""
+        SELECT item_ref_id, SUM(purchased_count) AS purchased_count
+        FROM {source} GROUP BY item_ref_id""")
+    result = RESULT_CACHE.execute(cursor, f"""
     SELECT 
         G.group_title, SUM(TD.purchased_count) AS total_items_shipped
     FROM 
-        TransactionDetails TD
+        {details} TD
     JOIN 
         StoreItems SI ON TD.item_ref_id = SI.item_pk
     JOIN 
@@ -159,12 +992,11 @@ def execute_queries(cursor):
     GROUP BY 
         G.group_pk;
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result)
 
     # Запрос 3: Топ-3 самых дорогих товаров
     print("\n3. Три самых дорогих товара в ассортименте:")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, """
     SELECT 
         item_name, unit_price
     FROM 
@@ -173,61 +1005,88 @@ def execute_queries(cursor):
         unit_price DESC
     LIMIT 3;
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result, money.format_row)
 
     # Запрос 4: Список всех транзакций с подсчетом общей денежной суммы
     print("\n4. Список транзакций и общая сумма каждой (цена * кол-во):")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, f"""
     SELECT 
-        T.transaction_pk, C.full_name, SUM(SI.unit_price * TD.purchased_count) AS final_transaction_amount
+        T.transaction_pk, C.full_name, T.total_amount AS final_transaction_amount
     FROM 
-        Transactions T
+        {union_source(conn, "Transactions")} T
     JOIN 
         Clients C ON T.client_ref_id = C.client_pk
-    JOIN 
-        TransactionDetails TD ON T.transaction_pk = TD.transaction_ref_id
-    JOIN 
-        StoreItems SI ON TD.item_ref_id = SI.item_pk
-    GROUP BY 
-        T.transaction_pk
+    WHERE 
+        T.detail_count > 0
     ORDER BY 
         T.transaction_pk;
     """)
-    for row in cursor.fetchall():
-        print(row)
+    output.print_rows(result, money.format_row)
 
     # Запрос 5: Клиент с наибольшим общим объемом потраченных средств
     print("\n5. Клиент с максимальными суммарными расходами:")
-    cursor.execute("""
+    result = RESULT_CACHE.execute(cursor, """
     SELECT 
-        C.full_name, SUM(SI.unit_price * TD.purchased_count) AS total_spending
+        C.full_name, CS.total_spent AS total_spending
     FROM 
-        Clients C
+        ClientSpend CS
     JOIN 
-        Transactions T ON C.client_pk = T.client_ref_id
-    JOIN 
-        TransactionDetails TD ON T.transaction_pk = TD.transaction_ref_id
-    JOIN 
-        StoreItems SI ON TD.item_ref_id = SI.item_pk
-    GROUP BY 
-        C.client_pk
+        Clients C ON C.client_pk = CS.client_ref_id
+    WHERE 
+        CS.detail_count > 0
     ORDER BY 
-        total_spending DESC
+        CS.total_spent DESC
     LIMIT 1;
     """)
-    print(cursor.fetchone())
+    output.print_rows(result, money.format_row, empty="None")
 
 # --- Основная логика ---
 
 def main():
+    parser = argparse.ArgumentParser(description="Магазин: схема, данные и отчеты по заказам")
+    parser.add_argument("files", nargs="*", help="CSV/JSONL-файлы с позициями заказов для загрузки")
+    parser.add_argument("--check", action="store_true",
+                        help="Сверить суммы заказов и расходы клиентов с полным пересчетом")
+    parser.add_argument("--archive-before", metavar="ДАТА",
+                        help="Перенести в архивные разделы закрытые периоды раньше ДАТЫ (ГГГГ-ММ-ДД)")
+    parser.add_argument("--granularity", choices=["year", "month"], default="year",
+                        help="Размер архивного раздела")
+    parser.add_argument("--cube", metavar="ИЗМЕРЕНИЯ",
+                        help="Показать срез куба продаж, например month,group (пустая строка - итого)")
+    parser.add_argument("--from", dest="month_from", metavar="ГГГГ-ММ", help="Первый месяц среза куба")
+    parser.add_argument("--to", dest="month_to", metavar="ГГГГ-ММ", help="Последний месяц среза куба")
+    args = parser.parse_args()
+    cube_dimensions = None
+    if args.cube is not None:
+        cube_dimensions = [dimension for dimension in args.cube.split(",") if dimension]
+        unknown = sorted(set(cube_dimensions) - set(CUBE_DIMENSIONS))
+        if unknown:
+            parser.error("неизвестные измерения куба: " + ", ".join(unknown))
+
     conn, cursor = setup_database()
     create_schema(cursor)
-    insert_data(cursor, conn)
-    execute_queries(cursor)
+    if args.check:
+        consistent = print_check(conn)
+        connection.release(conn)
+        sys.exit(0 if consistent else 1)
+    # Тестовые данные загружаются только в пустую БД
+    if migrations.is_empty(conn, "Clients"):
+        insert_data(cursor, conn)
+    # Дополнительные файлы с позициями заказов: аргументы командной строки
+    for path in args.files:
+        ingest_transaction_details(conn, path)
+    if args.archive_before:
+        archive_before(conn, args.archive_before, args.granularity)
+    refresh_cube(conn)
+    attach_archive(conn)
+    connection.apply_profile(conn, "read-report")
+    if cube_dimensions is not None:
+        print_cube(conn, cube_dimensions, args.month_from, args.month_to)
+    else:
+        execute_queries(cursor)
     
     print("\nВсе операции с завершены.")
-    conn.close()
+    connection.release(conn)
 
 if __name__ == "__main__":
     main()